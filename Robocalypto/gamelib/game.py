@@ -133,6 +133,9 @@ class Game(object):
         
         #parse ze level
         static, self.walls._objects = level_parse(self, self.scene)
+        #the walls never move, so keep them as arrays of 2d boxes for the shot tests
+        self.wall_centers = [w.pos for w in self.walls]
+        self.wall_halves = [[3.0, 3.0]] * len(self.wall_centers)
         self.scene.add_3d(pyggel.misc.StaticObjectGroup(static))
 
         self.scene.camera = self.camera
@@ -192,16 +195,14 @@ class Game(object):
             r = [w.pos[0]-3.0, w.pos[1]-3.0, 6.0, 6.0]
             self.player.collide(r) 
         for s in self.shots:
-            collidables = []
-            for w in self.walls:
-                area = [s.pos[0]-10, s.pos[1]-10, 20, 20]
-                if collidepoint(w.pos, area):
-                    collidables.append(w)
-            for i in xrange(5):
-                s.move_increment()
-                for w in collidables:
-                    r = [w.pos[0]-3.0, w.pos[1]-3.0, 6.0, 6.0]
-                    s.collide(r)
+            #test the whole move against every wall at once, instead of stepping the shot
+            start = list(s.pos)
+            s.move(s.speed, (0, s.rotation-90))
+            if self.wall_centers: #a level with no walls has nothing to hit
+                hit = pyggel.math3d.segment_boxes(start, s.pos, self.wall_centers, self.wall_halves).min()
+                if hit <= 1:
+                    s.position(start[0] + (s.pos[0] - start[0]) * hit, start[1] + (s.pos[1] - start[1]) * hit)
+                    s.kill()
             for b in self.baddies:
                 if b.collide(s.pos):
                     s.kill()
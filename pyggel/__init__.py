@@ -8,12 +8,13 @@ from include import *
 
 import mesh, view, image, camera, math3d, light
 import scene, font, geometry, misc, data
-import particle, event, gui
+import particle, event, gui, shader, instance, resource, loader, collision
 
 import ext
 
 def quit():
     """Deinitialize PYGGEL..."""
+    resource.shutdown()
     view.clear_screen()
     glFlush()
     pygame.quit()
@@ -5,10 +5,18 @@ This library (PYGGEL) is licensed under the LGPL by Matthew Roe and PYGGEL contr
 The camera module defines a Base camera class other cameras should inherit from, and two common cameras:
 LookFromCamera - which is basically a FPS camera,
 and the LookAtCamera - which is basically a third-person camera
+
+Cameras build their view, projection and view-projection matrices on the CPU (with math3d.Mat4),
+and only rebuild them when their pos/rotation/distance or the view settings change.
+The frustum, screen and billboard helpers work in pyggel's coordinates - the same pos you give scene objects,
+whose z is flipped when rendered.
 """
 from include import *
 import numpy
 from math import sqrt
+import math3d, view
+
+_flip_z = math3d.Mat4.scaling(1, 1, -1)
 
 class Base(object):
     """camera.Base camera object all other inherit from..."""
@@ -19,9 +27,98 @@ class Base(object):
         self.posx, self.posy, self.posz = pos
         self.rotx, self.roty, self.rotz = rotation
 
+        self._state = None
+        self._projection_state = None
+
+    def _get_state(self):
+        """Return the values the view matrix is built from - the matrices are rebuilt when this changes."""
+        return self.posx, self.posy, self.posz, self.rotx, self.roty, self.rotz
+
+    def _build_view(self):
+        """Return the (rotation, view) Mat4s of the camera - rotation is the view without any movement."""
+        return math3d.Mat4(), math3d.Mat4()
+
+    def _update(self):
+        """Rebuild the cached matrices if the camera or the view settings changed since they were last built."""
+        state = self._get_state()
+        screen = view.screen
+        projection = (screen.view_angle, screen.close_view, screen.far_view, tuple(screen.screen_size))
+        if state == self._state and projection == self._projection_state:
+            return
+        if state != self._state:
+            self._state = state
+            self._rotation, self._view = self._build_view()
+        if projection != self._projection_state:
+            self._projection_state = projection
+            angle, near, far, size = projection
+            self._projection = math3d.Mat4.perspective(angle, 1.0*size[0]/size[1], near, far)
+        self._view_projection = self._projection * self._view
+        self._world = self._view_projection * _flip_z
+        self._world_inverse = self._world.inverse()
+        self._frustum = None
+
+    def get_view_matrix(self):
+        """Return the Mat4 the camera applies to the modelview matrix in push."""
+        self._update()
+        return self._view
+
+    def get_projection_matrix(self):
+        """Return the Mat4 of the perspective projection view.set3d uses."""
+        self._update()
+        return self._projection
+
+    def get_view_projection_matrix(self):
+        """Return the projection * view Mat4."""
+        self._update()
+        return self._view_projection
+
+    def get_frustum(self):
+        """Return a (6,4) array of the normalized (a,b,c,d) left, right, bottom, top, near and far planes of the view,
+           which point inwards - ready for math3d Vector/Sphere.in_frustum and Vec3Array.in_frustum"""
+        self._update()
+        if self._frustum is None:
+            m = self._world.data
+            planes = numpy.array((m[3] + m[0], m[3] - m[0],
+                                  m[3] + m[1], m[3] - m[1],
+                                  m[3] + m[2], m[3] - m[2]), "f")
+            planes /= numpy.sqrt((planes[:,:3]**2).sum(1))[:,numpy.newaxis]
+            self._frustum = planes
+        return self._frustum
+
+    def world_to_screen(self, points):
+        """Return an (N,3) array of the screen x, y (in pixels, from the top left) and depth (0-1 inside the view)
+           of points - a Vec3Array or (N,3)/(x,y,z) positions"""
+        self._update()
+        points = self._world.transform_points(points)
+        size = view.screen.screen_size
+        out = numpy.empty_like(points)
+        out[:,0] = (points[:,0] + 1) * 0.5 * size[0]
+        out[:,1] = (1 - points[:,1]) * 0.5 * size[1]
+        out[:,2] = (points[:,2] + 1) * 0.5
+        return out
+
+    def screen_to_ray(self, x, y):
+        """Return the (origin, direction) arrays of the ray through screen pixel x, y (from the top left)
+           origin is on the near plane and direction is normalized - ie for picking with the mouse"""
+        self._update()
+        size = view.screen.screen_size
+        nx = 2.0 * x / size[0] - 1
+        ny = 1 - 2.0 * y / size[1]
+        near, far = self._world_inverse.transform_points(((nx, ny, -1), (nx, ny, 1)))
+        direction = far - near
+        return near, direction / numpy.sqrt((direction**2).sum())
+
+    def get_billboard_axes(self):
+        """Return the (right, up, facing) unit vectors of the view as arrays -
+           a sprite whose corners are pos -/+ right*w -/+ up*h faces the camera, and facing points back at it"""
+        self._update()
+        rotation = self._rotation.data[:3,:3] * numpy.array((1, 1, -1), "f")
+        return rotation[0], rotation[1], rotation[2]
+
     def push(self):
         """Activate the camera - anything rendered after this uses the cameras transformations."""
         glPushMatrix()
+        glMultMatrixf(self.get_view_matrix().get_gl())
 
     def pop(self):
         """Deactivate the camera - must be called after push or will raise an OpenGL error"""
@@ -41,11 +138,13 @@ class Base(object):
 
     def set_facing_matrix(self):
         """Transforms the matrix so that all objects are facing camera - used in Image3D (billboard sprites)"""
-        pass
+        self._update()
+        glMultMatrixf(self._rotation.transpose().get_gl())
 
     def set_skybox_data(self):
         """Transforms the view only for a skybox, ie only rotation is taken into account, not position"""
-        pass
+        self._update()
+        glMultMatrixf(self._rotation.get_gl())
 
 class LookFromCamera(Base):
     """camera.LookFromCamera is a FPS camera"""
@@ -53,13 +152,10 @@ class LookFromCamera(Base):
         Base.__init__(self, pos, rotation)
     __init__.__doc__ = Base.__init__.__doc__
 
-    def push(self):
-        glPushMatrix()
-        glRotatef(self.rotx, 1, 0, 0)
-        glRotatef(self.roty, 0, 1, 0)
-        glRotatef(self.rotz, 0, 0, 1)
-        glTranslatef(-self.posx, -self.posy, self.posz)
-    push.__doc__ = Base.push.__doc__
+    def _build_view(self):
+        rotation = math3d.Mat4.rotation(self.rotx, self.roty, self.rotz)
+        return rotation, rotation * math3d.Mat4.translation(-self.posx, -self.posy, self.posz)
+    _build_view.__doc__ = Base._build_view.__doc__
 
     def pop(self):
         glPopMatrix()
@@ -73,18 +169,6 @@ class LookFromCamera(Base):
         return self.rotx, self.roty, self.rotz
     get_rotation.__doc__ = Base.get_rotation.__doc__
 
-    def set_facing_matrix(self):
-        glRotatef(-self.rotz, 0, 0, 1)
-        glRotatef(-self.roty, 0, 1, 0)
-        glRotatef(-self.rotx, 1, 0, 0)
-    set_facing_matrix.__doc__ = Base.set_facing_matrix.__doc__
-
-    def set_skybox_data(self):
-        glRotatef(self.rotx, 1, 0, 0)
-        glRotatef(self.roty, 0, 1, 0)
-        glRotatef(self.rotz, 0, 0, 1)
-    set_skybox_data.__doc__ = Base.set_skybox_data.__doc__
-
 class LookAtCamera(Base):
     """camera.LookAtCamera is a third-person camera"""
     def __init__(self, pos=[0,0,0], rotation=[0,0,0],
@@ -96,23 +180,12 @@ class LookAtCamera(Base):
         Base.__init__(self, pos, rotation)
         self.distance = distance
 
-    def push(self):
-        glPushMatrix()
-        glTranslatef(0, 0, -self.distance)
-        glRotatef(-self.rotx, 1, 0, 0)
-        glRotatef(-self.roty, 0, 1, 0)
-        glRotatef(self.rotz, 0, 0, 1)
-        glTranslatef(-self.posx, -self.posy, self.posz)
-    push.__doc__ = Base.push.__doc__
+    def _get_state(self):
+        return Base._get_state(self) + (self.distance,)
+    _get_state.__doc__ = Base._get_state.__doc__
 
-    def set_facing_matrix(self):
-        glRotatef(-self.rotz, 0, 0, 1)
-        glRotatef(self.roty, 0, 1, 0)
-        glRotatef(self.rotx, 1, 0, 0)
-    set_facing_matrix.__doc__ = Base.set_facing_matrix.__doc__
-
-    def set_skybox_data(self):
-        glRotatef(-self.rotx, 1, 0, 0)
-        glRotatef(-self.roty, 0, 1, 0)
-        glRotatef(self.rotz, 0, 0, 1)
-    set_skybox_data.__doc__ = Base.set_skybox_data.__doc__
+    def _build_view(self):
+        rotation = math3d.Mat4.rotation(-self.rotx, -self.roty, self.rotz)
+        return rotation, math3d.Mat4.translation(0, 0, -self.distance) * rotation *\
+                         math3d.Mat4.translation(-self.posx, -self.posy, self.posz)
+    _build_view.__doc__ = Base._build_view.__doc__
@@ -0,0 +1,252 @@
+"""
+pyggel.collision
+This library (PYGGEL) is licensed under the LGPL by Matthew Roe and PYGGEL contributors.
+
+The collision module contains CollisionWorld, which holds many math3d.Sphere/AABox (or Vector point) shapes
+and finds every overlapping pair at once - a sweep-and-prune broad phase finds the candidate pairs
+and the math3d collide_* kernels test them all in a few numpy calls.
+Results are reported as enter/stay/exit events, and layer masks filter what collides with what.
+"""
+
+from include import *
+import math3d
+
+ALL_LAYERS = 0xFFFFFFFF
+
+SPHERE = 0
+BOX = 1
+
+class Body(object):
+    """One shape in a CollisionWorld."""
+    def __init__(self, shape, layer=1, mask=ALL_LAYERS, static=False, data=None):
+        """Create the body
+           shape must be a math3d.Sphere, AABox or Vector (a point)
+           layer is the bit flags of the layers this body is on
+           mask is the bit flags of the layers this body collides with -
+               two bodies only collide if each one's layer is in the other's mask
+           static is whether the shape never moves - static bodies are never tested against each other,
+               and their shapes are only read again when CollisionWorld.refresh is called
+           data can be anything you want to attach to the body, like the game object it belongs to"""
+        self.shape = shape
+        self.layer = layer
+        self.mask = mask
+        self.static = static
+        self.data = data
+
+        self.ident = None
+        self.world = None
+
+    def get_extents(self):
+        """Return the (kind, (x,y,z) center, (w,h,d) half size) of the shape, kind is SPHERE or BOX
+           Points are spheres with no radius"""
+        shape = self.shape
+        if isinstance(shape, math3d.AABox):
+            return BOX, (shape.x, shape.y, shape.z), shape.get_half_size()
+        if isinstance(shape, math3d.Sphere):
+            r = shape.radius * shape.scale
+        else:
+            r = 0
+        return SPHERE, (shape.x, shape.y, shape.z), (r, r, r)
+
+class CollisionWorld(object):
+    """Holds Bodies and finds which of them overlap each update.
+       After update:
+           entered is a list of (body, body) pairs that started touching
+           staying is a list of pairs that were already touching and still are
+           exited is a list of pairs that stopped touching (or were removed)"""
+    def __init__(self):
+        """Create the world."""
+        self.bodies = []
+        self._next_ident = 0
+        self._by_ident = {}
+        self._removed = []
+
+        self.entered = []
+        self.staying = []
+        self.exited = []
+
+        self._keys = numpy.zeros(0, "int64")
+        self._dirty = True
+
+        self.kinds = numpy.zeros(0, "b")
+        self.centers = numpy.zeros((0,3), "f")
+        self.halves = numpy.zeros((0,3), "f")
+        self.layers = numpy.zeros(0, "int64")
+        self.masks = numpy.zeros(0, "int64")
+        self.statics = numpy.zeros(0, bool)
+        self.idents = numpy.zeros(0, "int64")
+
+    def add(self, shape, layer=1, mask=ALL_LAYERS, static=False, data=None):
+        """Add a shape to the world, returns its Body - see Body for the arguments
+           shape can also be a Body, which is added as is"""
+        if isinstance(shape, Body):
+            body = shape
+        else:
+            body = Body(shape, layer, mask, static, data)
+        if body.world:
+            raise ValueError("Body is already in a CollisionWorld!")
+        body.ident = self._next_ident
+        body.world = self
+        self._next_ident += 1
+        self._by_ident[body.ident] = body
+        self.bodies.append(body)
+        self._dirty = True
+        return body
+
+    def remove(self, body):
+        """Remove a Body from the world - its pairs are reported as exited on the next update."""
+        self.bodies.remove(body)
+        body.world = None
+        self._removed.append(body)
+        self._dirty = True
+
+    def refresh(self):
+        """Re-read the layer/mask/static flags of every body and the shapes of static bodies
+           - call this after changing them."""
+        self._dirty = True
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def _rebuild(self):
+        """Rebuild the per-body arrays after bodies were added, removed or changed."""
+        bodies = self.bodies
+        n = len(bodies)
+        self.kinds = numpy.zeros(n, "b")
+        self.centers = numpy.zeros((n,3), "f")
+        self.halves = numpy.zeros((n,3), "f")
+        for i, body in enumerate(bodies):
+            self.kinds[i], self.centers[i], self.halves[i] = body.get_extents()
+        self.layers = numpy.array([i.layer for i in bodies], "int64")
+        self.masks = numpy.array([i.mask for i in bodies], "int64")
+        self.statics = numpy.array([i.static for i in bodies], bool)
+        self.idents = numpy.array([i.ident for i in bodies], "int64")
+        self._moving = [(i, body) for i, body in enumerate(bodies) if not body.static]
+        self._dirty = False
+
+    def _gather(self):
+        """Read the current position/size of every moving body into the arrays."""
+        if self._dirty:
+            self._rebuild()
+            return
+        if not self._moving:
+            return
+        extents = [body.get_extents() for i, body in self._moving]
+        index = [i for i, body in self._moving]
+        self.kinds[index] = [i[0] for i in extents]
+        self.centers[index] = [i[1] for i in extents]
+        self.halves[index] = [i[2] for i in extents]
+
+    def get_candidates(self):
+        """Return (a, b) index arrays of the body pairs whose bounding boxes overlap and whose layers match.
+           Sweep and prune: bodies are sorted along the axis they are most spread out on,
+           and each is paired with the following ones that start before it ends."""
+        n = len(self.bodies)
+        if n < 2:
+            return numpy.zeros(0, int), numpy.zeros(0, int)
+        centers, halves = self.centers, self.halves
+        axis = centers.var(0).argmax()
+        low = centers[:,axis] - halves[:,axis]
+        high = centers[:,axis] + halves[:,axis]
+        order = low.argsort(kind="mergesort")
+        low = low[order]
+        end = low.searchsorted(high[order], "right")
+        counts = numpy.maximum(end - numpy.arange(1, n+1), 0)
+        total = counts.sum()
+        first = numpy.repeat(numpy.arange(n), counts)
+        second = first + 1 + numpy.arange(total) - numpy.repeat(counts.cumsum() - counts, counts)
+        a = order[first]
+        b = order[second]
+
+        keep = ~(self.statics[a] & self.statics[b])
+        keep &= (self.layers[a] & self.masks[b]) != 0
+        keep &= (self.layers[b] & self.masks[a]) != 0
+        a = a[keep]
+        b = b[keep]
+        keep = math3d.collide_boxes(centers[a], halves[a], centers[b], halves[b])
+        return a[keep], b[keep]
+
+    def test_pairs(self, a, b):
+        """Return a bool array of which of the (a, b) index pairs really collide."""
+        kinds = self.kinds
+        centers, halves = self.centers, self.halves
+        hit = numpy.ones(len(a), bool) #box-box pairs are exact after the bounding box test
+        ka = kinds[a]
+        kb = kinds[b]
+
+        both = (ka == SPHERE) & (kb == SPHERE)
+        i, j = a[both], b[both]
+        hit[both] = math3d.collide_spheres(centers[i], halves[i,0], centers[j], halves[j,0])
+
+        for sphere_kind, sphere, box in ((ka, a, b), (kb, b, a)):
+            mixed = (sphere_kind == SPHERE) & (ka != kb)
+            i, j = sphere[mixed], box[mixed]
+            hit[mixed] = math3d.collide_sphere_box(centers[i], halves[i,0], centers[j], halves[j])
+        return hit
+
+    def update(self):
+        """Read the moving shapes, find all colliding pairs and fill entered/staying/exited."""
+        self._gather()
+        a, b = self.get_candidates()
+        hit = self.test_pairs(a, b)
+        a = self.idents[a[hit]]
+        b = self.idents[b[hit]]
+        keys = numpy.unique(numpy.minimum(a, b) << 32 | numpy.maximum(a, b))
+
+        old = self._keys
+        self._keys = keys
+        self.entered = self._get_pairs(numpy.setdiff1d(keys, old, True))
+        self.staying = self._get_pairs(numpy.intersect1d(keys, old, True))
+        self.exited = self._get_pairs(numpy.setdiff1d(old, keys, True))
+
+        #removed bodies are only kept until their exit events are made
+        for i in self._removed:
+            del self._by_ident[i.ident]
+        self._removed = []
+
+    def _get_pairs(self, keys):
+        """Return a list of (body, body) pairs for pair keys."""
+        get = self._by_ident.__getitem__
+        return [(get(i >> 32), get(i & 0xFFFFFFFF)) for i in keys.tolist()]
+
+    def get_collisions(self, body=None):
+        """Return a list of the (body, body) pairs touching as of the last update - or only the pairs body is in."""
+        pairs = self._get_pairs(self._keys)
+        if body is None:
+            return pairs
+        return [i for i in pairs if body in i]
+
+    def query(self, shape, mask=ALL_LAYERS):
+        """Return a list of the bodies (as of the last update) that shape collides with
+           shape must be a math3d.Sphere, AABox or Vector
+           mask is the bit flags of the layers to test against"""
+        if self._dirty:
+            self._gather()
+        kind, center, half = Body(shape).get_extents()
+        centers, halves = self.centers, self.halves
+        if kind == BOX:
+            hit = numpy.where(self.kinds == BOX,
+                              math3d.collide_boxes(centers, halves, center, half),
+                              math3d.collide_sphere_box(centers, halves[:,0], center, half))
+        else:
+            hit = numpy.where(self.kinds == BOX,
+                              math3d.collide_sphere_box(center, half[0], centers, halves),
+                              math3d.collide_spheres(centers, halves[:,0], center, half[0]))
+        hit &= (self.layers & mask) != 0
+        return [self.bodies[i] for i in numpy.nonzero(hit)[0]]
+
+    def raycast(self, origin, direction, length=None, mask=ALL_LAYERS):
+        """Return the (body, distance) of the first body (as of the last update) a ray hits, or (None, None)
+           origin/direction/length work like in math3d.ray_boxes
+           mask is the bit flags of the layers to test against"""
+        if self._dirty:
+            self._gather()
+        boxes = self.kinds == BOX
+        dist = numpy.where(boxes,
+                           math3d.ray_boxes(origin, direction, self.centers, self.halves, length),
+                           math3d.ray_spheres(origin, direction, self.centers, self.halves[:,0], length))
+        dist[(self.layers & mask) == 0] = numpy.inf
+        if not len(dist) or numpy.isinf(dist.min()):
+            return None, None
+        i = dist.argmin()
+        return self.bodies[i], float(dist[i])
@@ -7,7 +7,8 @@ like textures, display lists and vertex arrays.
 """
 
 from include import *
-import view
+import view, resource
+import weakref
 
 def max_tex_size():
     view.require_init()
@@ -23,19 +24,21 @@ class Texture(object):
     bound = None
     repeating = False
     _all_loaded = {}
-    _dead_textures = []
-    def __init__(self, filename=None, repeat=False, fill_color=(1,1,1,1), fill_size=(2,2), fill_unique=False):
+    def __init__(self, filename=None, repeat=False, fill_color=(1,1,1,1), fill_size=(2,2), fill_unique=False,
+                 image=None):
         """Create a texture
            filename can be be a filename for an image, or a pygame.Surface object
            repeat controls whether the texture repeats when values overflow the 0-1 range
            fill_color is the color the texture will be filled with if filename is None
            fill_size is the size the texture will be if filename is None
-           fill_unique controls whether the texture is unique if filename is None"""
+           fill_unique controls whether the texture is unique if filename is None
+           image can be None or a pygame.Surface already loaded from filename, to use instead of loading it again"""
         view.require_init()
         self.filename = filename
         self.unique = False
 
         self.gl_tex = None
+        self._res = None
 
         self.size = (0,0)
         self.unique = True
@@ -48,7 +51,7 @@ class Texture(object):
             self.filename = "BlankTexture: %s | %s"%(fill_color, fill_size)
             self.make_blank(fill_color, fill_size, fill_unique)
         elif type(filename) is type(""):
-            self._load_file()
+            self._load_file(image)
         else:
             self.make_gl_tex()
             self.filename = "UniqueTexture: %s"%self.gl_tex
@@ -58,11 +61,9 @@ class Texture(object):
 
     def make_gl_tex(self):
         if self.gl_tex and self.unique:
-            self.free_texture(self.gl_tex)
-        if Texture._dead_textures:
-            self.gl_tex = Texture._dead_textures.pop()
-        else:
-            self.gl_tex = glGenTextures(1)
+            self.free_texture()
+        self.gl_tex = glGenTextures(1)
+        self._res = resource.register("texture", self.gl_tex)
 
     def make_blank(self, color, size, unique):
         if (not unique) and self.filename in Texture._all_loaded:
@@ -113,14 +114,15 @@ class Texture(object):
             nh *= 2
         return nw, nh
 
-    def _load_file(self):
-        """Loads file"""
+    def _load_file(self, image=None):
+        """Loads file, or uses image if it is already loaded"""
         if self.filename in Texture._all_loaded:
             if self.gl_tex and self.unique:
-                self.free_texture(self.gl_tex)
+                self.free_texture()
             self.gl_tex, self.size, self.size_mult = Texture._all_loaded[self.filename]
         else:
-            image = pygame.image.load(self.filename)
+            if image is None:
+                image = pygame.image.load(self.filename)
             self.make_gl_tex()
             self._compile(image)
             Texture._all_loaded[self.filename] = self.to_atts()
@@ -151,6 +153,7 @@ class Texture(object):
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, w2, h2, 0, GL_RGBA,
                      GL_UNSIGNED_BYTE, tdata)
+        resource.resize(self._res, w2*h2*4)
 
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
@@ -179,13 +182,15 @@ class Texture(object):
                 glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_R, GL_CLAMP_TO_EDGE)
             Texture.repeating = self.repeat
 
-    def free_texture(self, name):
-        if name and (not name in Texture._dead_textures):
-            Texture._dead_textures.append(name)
+    def free_texture(self):
+        """Queue our GL texture for deletion - it is deleted the next time resource.collect runs."""
+        if self._res:
+            resource.release(self._res)
+            self._res = None
 
     def __del__(self):
         if self.unique:
-            self.free_texture(self.gl_tex)
+            self.free_texture()
 
     def to_atts(self):
         return self.gl_tex, self.size, self.size_mult
@@ -205,6 +210,7 @@ class DisplayList(object):
     def __init__(self):
         """Creat the list"""
         self.gl_list = glGenLists(1)
+        self._res = resource.register("display_list", self.gl_list)
 
     def begin(self):
         """Begin recording to the list - anything rendered after this will be compiled into the list and not actually rendered"""
@@ -219,11 +225,315 @@ class DisplayList(object):
         glCallList(self.gl_list)
 
     def __del__(self):
-        """Clear the display list data"""
-        try:
-            glDeleteLists(self.gl_list, 1)
-        except:
-            pass #already cleared!
+        """Queue the display list data to be cleared"""
+        resource.release(self._res)
+
+def fan_indices(counts, start=0):
+    """Return the GL_TRIANGLES indices that split a run of convex polygons into triangle fans.
+       counts is the number of vertices in each polygon - the polygons' vertices must follow each other
+       start is the index of the first vertex"""
+    counts = numpy.asarray(counts, "i")
+    firsts = numpy.cumsum(counts) - counts + start
+    firsts = firsts[counts >= 3]
+    counts = counts[counts >= 3]
+    if not len(counts):
+        return numpy.zeros(0, "I")
+    tris = counts - 2
+    first = numpy.repeat(firsts, tris)
+    step = numpy.arange(tris.sum()) - numpy.repeat(numpy.cumsum(tris) - tris, tris) + 1
+    fan = numpy.empty((len(first), 3), "I")
+    fan[:,0] = first
+    fan[:,1] = first + step
+    fan[:,2] = first + step + 1
+    return fan.ravel()
+
+class Geometry(object):
+    """Retained geometry - numpy arrays of vertices, normals, texture coords and (optionally) colors and indices,
+       uploaded once into vertex buffer objects and drawn with a single call.
+       If VBOs are not available the same arrays are compiled into a DisplayList instead.
+       Geometry renders just like a DisplayList, so it can be used anywhere one is."""
+    def __init__(self, verts, norms=None, texcs=None, colors=None, indices=None, render_type=None, usage="static"):
+        """Create the geometry
+           verts must be a list/array of (x,y,z) vertices
+           norms can be None or a matching list/array of (x,y,z) normals
+           texcs can be None or a matching list/array of (u,v) texture coords
+           colors can be None (use the current color) or a matching list/array of (r,g,b,a) colors
+           indices can be None (draw the vertices in order) or a list/array of vertex indices
+           render_type is the OpenGL constant used in rendering, ie GL_TRIANGLES (the default), GL_QUADS, etc.
+           usage can be static, dynamic or stream - geometry that is changed often with update should not be static"""
+        if render_type is None:
+            render_type = GL_TRIANGLES
+        self.render_type = render_type
+        self.usage = usage
+
+        self.verts = numpy.array(verts, "f").reshape((-1,3))
+        n = len(self.verts)
+        if norms is None:
+            self.norms = numpy.zeros((n,3), "f")
+            self.norms[:,1] = 1
+        else:
+            self.norms = numpy.array(norms, "f").reshape((-1,3))
+        if texcs is None:
+            self.texcs = numpy.zeros((n,2), "f")
+        else:
+            self.texcs = numpy.array(texcs, "f").reshape((-1,2))
+        if colors is None:
+            self.colors = None
+        else:
+            self.colors = numpy.array(colors, "f").reshape((-1,4))
+        if indices is None:
+            self.indices = None
+        else:
+            self.indices = numpy.array(indices, "I").ravel()
+
+        self._interleaved = None
+        self._buffers = None
+        self._res = []
+        self._dlist = None
+        self._shared = None
+
+    def __len__(self):
+        """Return the number of vertices drawn."""
+        if self.indices is None:
+            return len(self.verts)
+        return len(self.indices)
+
+    def get_bounds(self):
+        """Return the (minx, miny, minz, maxx, maxy, maxz) bounds of the vertices."""
+        if not len(self.verts):
+            return 0,0,0,0,0,0
+        return tuple(self.verts.min(0).tolist() + self.verts.max(0).tolist())
+
+    def get_interleaved(self):
+        """Return an (N,8) array of the vertices interleaved as x,y,z, nx,ny,nz, u,v - the layout of the VBO."""
+        if self._interleaved is not None:
+            return self._interleaved
+        inter = numpy.empty((len(self.verts), 8), "f")
+        inter[:,0:3] = self.verts
+        inter[:,3:6] = self.norms
+        inter[:,6:8] = self.texcs
+        return inter
+
+    def _compile(self):
+        """Upload the arrays - into VBOs if available, otherwise into a DisplayList."""
+        if VBO_AVAILABLE:
+            if self._shared:
+                if not self._shared._buffers:
+                    self._shared._compile()
+                self._buffers = [self._shared._buffers[0], self._shared._buffers[1], None]
+            else:
+                self._buffers = [vbo.VBO(self.get_interleaved(), ("GL_"+self.usage+"_DRAW").upper()), None, None]
+                if self.colors is not None:
+                    self._buffers[1] = vbo.VBO(self.colors)
+            if self.indices is not None:
+                self._buffers[2] = vbo.VBO(self.indices, target="GL_ELEMENT_ARRAY_BUFFER")
+            owned = self._buffers[2:] if self._shared else self._buffers
+            self._res = [resource.register("vbo", i, i.data.nbytes) for i in owned if i]
+        else:
+            self._dlist = DisplayList()
+            self._dlist.begin()
+            self._bind_arrays()
+            self._draw()
+            self._unbind_arrays()
+            self._dlist.end()
+
+    def _bind_arrays(self):
+        """Enable and point the client arrays at our data."""
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        if self._buffers:
+            buf, colors, indices = self._buffers
+            buf.bind()
+            #interleaved as x,y,z, nx,ny,nz, u,v - 8 floats, 32 bytes per vertex
+            glVertexPointer(3, GL_FLOAT, 32, buf)
+            glNormalPointer(GL_FLOAT, 32, buf+12)
+            glTexCoordPointer(2, GL_FLOAT, 32, buf+24)
+            if colors:
+                colors.bind()
+                glEnableClientState(GL_COLOR_ARRAY)
+                glColorPointer(4, GL_FLOAT, 0, colors)
+            if indices:
+                indices.bind()
+        else:
+            glVertexPointerf(self.verts)
+            glNormalPointerf(self.norms)
+            glTexCoordPointerf(self.texcs)
+            if self.colors is not None:
+                glEnableClientState(GL_COLOR_ARRAY)
+                glColorPointerf(self.colors)
+
+    def _unbind_arrays(self):
+        """Disable the client arrays again."""
+        if self._buffers:
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        if self.colors is not None:
+            glDisableClientState(GL_COLOR_ARRAY)
+
+    def _draw(self, instances=None):
+        """Issue the draw call - the arrays must be bound."""
+        if self.indices is None:
+            if instances is None:
+                glDrawArrays(self.render_type, 0, len(self.verts))
+            else:
+                glDrawArraysInstancedARB(self.render_type, 0, len(self.verts), instances)
+        elif self._buffers:
+            if instances is None:
+                glDrawElements(self.render_type, len(self.indices), GL_UNSIGNED_INT, self._buffers[2])
+            else:
+                glDrawElementsInstancedARB(self.render_type, len(self.indices), GL_UNSIGNED_INT,
+                                           self._buffers[2], instances)
+        else:
+            glDrawElementsui(self.render_type, self.indices)
+
+    def render(self, camera=None):
+        """Render the geometry."""
+        if not (self._buffers or self._dlist):
+            if VBO_AVAILABLE or (self.usage == "static" and not glGetIntegerv(GL_LIST_INDEX)):
+                self._compile()
+            #else we are being recorded into another display list, and can't start our own,
+            #or we change too often to be worth compiling, so draw from memory
+        if self._dlist:
+            self._dlist.render()
+        else:
+            self._bind_arrays()
+            self._draw()
+            self._unbind_arrays()
+
+    def update(self, verts=None, norms=None, texcs=None):
+        """Replace the vertices, normals and/or texture coords with new arrays of the same length,
+           they are uploaded again the next time the geometry is rendered."""
+        if verts is not None:
+            self.verts[:] = verts
+        if norms is not None:
+            self.norms[:] = norms
+        if texcs is not None:
+            self.texcs[:] = texcs
+        if self._buffers:
+            inter = self._buffers[0].data
+            inter[:,0:3] = self.verts
+            inter[:,3:6] = self.norms
+            inter[:,6:8] = self.texcs
+            self._buffers[0].set_array(inter)
+        elif self._dlist:
+            self._dlist = None
+
+    def render_instanced(self, count):
+        """Render count instances of the geometry with one call - requires VBOs and instancing,
+           the per-instance attributes must already be set up by the caller."""
+        if not (self._buffers or self._dlist):
+            self._compile()
+        self._bind_arrays()
+        self._draw(count)
+        self._unbind_arrays()
+
+    def with_indices(self, indices):
+        """Return a Geometry drawing the same vertices with other indices (ie a simpler level of detail),
+           which shares this geometry's vertex buffers instead of uploading its own."""
+        geom = Geometry((), render_type=self.render_type)
+        geom.verts, geom.norms, geom.texcs, geom.colors = self.verts, self.norms, self.texcs, self.colors
+        geom._interleaved = self._interleaved
+        geom.indices = numpy.asarray(indices, "I").ravel()
+        geom._shared = self
+        return geom
+
+    def expanded(self):
+        """Return a copy of the geometry with the indices applied, ie every vertex stored in draw order."""
+        if self.indices is None:
+            return self
+        i = self.indices
+        colors = None if self.colors is None else self.colors[i]
+        return Geometry(self.verts[i], self.norms[i], self.texcs[i], colors, None, self.render_type)
+
+    def transformed(self, matrix):
+        """Return a copy of the geometry with every vertex transformed by matrix
+           matrix must be a 16 float, column-major OpenGL matrix (like the ones glMultMatrixf takes)
+           normals are transformed by the inverse transpose of the matrix"""
+        m = numpy.array(matrix, "f").reshape((4,4)).T
+        verts = numpy.dot(self.verts, m[:3,:3].T) + m[:3,3]
+        norms = numpy.dot(self.norms, numpy.linalg.inv(m[:3,:3]))
+        return Geometry(verts, norms, self.texcs, self.colors, self.indices, self.render_type)
+
+    def __del__(self):
+        """Clean up..."""
+        for i in self._res:
+            resource.release(i)
+
+def interleaved_geometry(inter, indices=None, colors=None, render_type=None):
+    """Create a Geometry straight from an (N,8) float array laid out like Geometry.get_interleaved,
+       without copying it - so inter can be a numpy.memmap of a file, and is uploaded straight from that
+       indices/colors/render_type are the same as for Geometry"""
+    geom = Geometry((), render_type=render_type)
+    geom._interleaved = inter
+    geom.verts = inter[:,0:3]
+    geom.norms = inter[:,3:6]
+    geom.texcs = inter[:,6:8]
+    if colors is not None:
+        geom.colors = numpy.array(colors, "f").reshape((-1,4))
+    if indices is not None:
+        geom.indices = numpy.asarray(indices, "I").ravel()
+    return geom
+
+def merge_geometry(geometries):
+    """Return a single Geometry holding all of geometries, so they can be drawn with one call.
+       All of them must have the same render_type, and either all or none must have colors."""
+    if not geometries:
+        return Geometry([])
+    render_type = geometries[0].render_type
+    for i in geometries:
+        if i.render_type != render_type:
+            raise ValueError("Cannot merge geometry with different render types!")
+    has_colors = [i.colors is not None for i in geometries]
+    if True in has_colors and False in has_colors:
+        raise ValueError("Cannot merge geometry with and without colors!")
+
+    indices = None
+    if True in [i.indices is not None for i in geometries]:
+        indices = []
+        offset = 0
+        for i in geometries:
+            if i.indices is None:
+                indices.append(numpy.arange(len(i.verts), dtype="I") + offset)
+            else:
+                indices.append(i.indices + offset)
+            offset += len(i.verts)
+        indices = numpy.concatenate(indices)
+
+    colors = None
+    if has_colors[0]:
+        colors = numpy.concatenate([i.colors for i in geometries])
+    return Geometry(numpy.concatenate([i.verts for i in geometries]),
+                    numpy.concatenate([i.norms for i in geometries]),
+                    numpy.concatenate([i.texcs for i in geometries]),
+                    colors, indices, render_type)
+
+def _index_spans(indices):
+    """Return a sorted list of (start, end) spans covering every index in indices."""
+    indices = numpy.unique(numpy.asarray(indices, "i").ravel())
+    if not len(indices):
+        return []
+    breaks = numpy.nonzero(numpy.diff(indices) > 1)[0] + 1
+    starts = numpy.concatenate((indices[:1], indices[breaks]))
+    ends = numpy.concatenate((indices[breaks-1], indices[-1:])) + 1
+    return zip(starts.tolist(), ends.tolist())
+
+def _merge_spans(spans, gap=0):
+    """Merge overlapping (start, end) spans into as few spans as possible.
+       gap is how many untouched elements may sit between two spans before they are uploaded separately"""
+    if not spans:
+        return []
+    spans = sorted(spans)
+    merged = [list(spans[0])]
+    for start, end in spans[1:]:
+        if start <= merged[-1][1] + gap:
+            merged[-1][1] = max((merged[-1][1], end))
+        else:
+            merged.append([start, end])
+    return [tuple(i) for i in merged]
 
 class VertexArray(object):
     """An object to store and render an OpenGL vertex array of vertices, colors and texture coords"""
@@ -292,6 +602,26 @@ class VertexArray(object):
     def update_norms(self, index, new):
         self.norms[index] = new
 
+    def update_verts_many(self, indices, new):
+        """Set the vertices at every index in indices to the matching row of new (or broadcast new)"""
+        self.verts[numpy.asarray(indices, "i")] = new
+
+    def update_colors_many(self, indices, new):
+        """Set the colors at every index in indices to the matching row of new (or broadcast new)"""
+        self.colors[numpy.asarray(indices, "i")] = new
+
+    def update_texcs_many(self, indices, new):
+        """Set the texture coords at every index in indices to the matching row of new (or broadcast new)"""
+        self.texcs[numpy.asarray(indices, "i")] = new
+
+    def update_norms_many(self, indices, new):
+        """Set the normals at every index in indices to the matching row of new (or broadcast new)"""
+        self.norms[numpy.asarray(indices, "i")] = new
+
+    def flush(self):
+        """Vertex arrays are read straight from memory each render, so there is nothing to upload."""
+        pass
+
     def resize(self, max_size):
         self.verts = numpy.resize(self.verts, (max_size, 3))
         self.colors = numpy.resize(self.colors, (max_size, 4))
@@ -300,15 +630,17 @@ class VertexArray(object):
         self.max_size = max_size
 
 class VBOArray(object):
-    def __init__(self, render_type=None, max_size=100, usage="static", cache_changes=False):
+    _res = []
+    def __init__(self, render_type=None, max_size=100, usage="static", cache_changes=False, merge_gap=16):
         """Create the array
            render_type is the OpenGL constant used in rendering, ie GL_POLYGON, GL_TRINAGLES, etc.
            max_size is the size of the array
            usage can be static, dynamic or stream (affecting render vs. modify speeds)
            cache_changes makes any changes between renderings be stored,
-               and then only one modification is performed.
-               NOTE: doing this actually modifies the entire buffer data, just efficiently
-                     so this is only recommended if you are modifying a tremendous amount of points each frame!"""
+               and then uploaded in one go (by flush) right before rendering.
+               Only the changed ranges of each attribute are sent - ranges closer than merge_gap
+               elements to each other are merged, so many scattered changes cost only a few uploads.
+           merge_gap is how many unchanged elements may lie between two changed ranges for them to be sent as one"""
 
         if not VBO_AVAILABLE:
             raise AttributeError("Vertex buffer objects not available!")
@@ -320,10 +652,8 @@ class VBOArray(object):
         self.usage_gl = uses[self.usage]
 
         self.cache_changes = cache_changes
-        self._cached_cv = []
-        self._cached_cc = []
-        self._cached_ct = []
-        self._cached_cn = []
+        self.merge_gap = merge_gap
+        self._dirty = {"verts":[], "colors":[], "texcs":[], "norms":[]}
 
         if render_type is None:
             render_type = GL_QUADS
@@ -336,34 +666,12 @@ class VBOArray(object):
         self.colors = vbo.VBO(numpy.zeros((max_size, 4), "f"), self.usage)
         self.texcs = vbo.VBO(numpy.zeros((max_size, 2), "f"), self.usage)
         self.norms = vbo.VBO(numpy.array([[0,1,0]]*max_size, "f"), self.usage)
+        self._res = [resource.register("vbo", i, i.data.nbytes) for i in (self.verts, self.colors, self.texcs, self.norms)]
 
     def render(self):
         """Render the array"""
         if self.cache_changes:
-            if self._cached_cv or self._cached_cc or self._cached_ct:
-                for i in self._cached_cv:
-                    self.verts.data[i[0]] = i[1]
-                self.verts.bind()
-                glBufferData(GL_ARRAY_BUFFER, self.verts.data, self.usage_gl)
-                self._cached_cv = []
-
-                for i in self._cached_cc:
-                    self.colors.data[i[0]] = i[1]
-                self.colors.bind()
-                glBufferData(GL_ARRAY_BUFFER, self.colors.data, self.usage_gl)
-                self._cached_cc = []
-
-                for i in self._cached_ct:
-                    self.texcs.data[i[0]] = i[1]
-                self.texcs.bind()
-                glBufferData(GL_ARRAY_BUFFER, self.texcs.data, self.usage_gl)
-                self._cached_ct = []
-
-                for i in self._cached_cn:
-                    self.norms.data[i[0]] = i[1]
-                self.norms.bind()
-                glBufferData(GL_ARRAY_BUFFER, self.norms.data, self.usage_gl)
-                self._cached_cn = []
+            self.flush()
         self.texture.bind()
 
         self.verts.bind()
@@ -390,63 +698,95 @@ class VBOArray(object):
         glDisableClientState(GL_TEXTURE_COORD_ARRAY)
         glDisableClientState(GL_NORMAL_ARRAY)
 
+    def _upload(self, name, spans):
+        """Send the (start, end) element spans of attribute name to the buffer."""
+        buf = getattr(self, name)
+        if not spans:
+            return
+        buf.bind()
+        if spans[0] == (0, len(buf.data)):
+            glBufferData(GL_ARRAY_BUFFER, buf.data, self.usage_gl)
+        else:
+            #4 bytes per float * number of floats per element
+            stride = 4*buf.data.shape[1]
+            for start, end in spans:
+                glBufferSubData(GL_ARRAY_BUFFER, stride*start, buf.data[start:end])
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _update(self, name, index, new):
+        getattr(self, name).data[index] = new
+        if self.cache_changes:
+            self._dirty[name].append((index, index+1))
+        else:
+            self._upload(name, [(index, index+1)])
+
+    def _update_many(self, name, indices, new):
+        indices = numpy.asarray(indices, "i")
+        getattr(self, name).data[indices] = new
+        spans = _index_spans(indices)
+        if self.cache_changes:
+            self._dirty[name].extend(spans)
+        else:
+            self._upload(name, _merge_spans(spans, self.merge_gap))
+
+    def flush(self):
+        """Upload all cached changes - only the merged, changed spans of each attribute are sent."""
+        for name in self._dirty:
+            if self._dirty[name]:
+                self._upload(name, _merge_spans(self._dirty[name], self.merge_gap))
+                self._dirty[name] = []
+
     def reset_verts(self, data):
         self.verts.set_array(numpy.array(data, "f"))
+        self._dirty["verts"] = []
         self.max_size = len(data)
 
     def reset_colors(self, data):
         self.colors.set_array(numpy.array(data, "f"))
+        self._dirty["colors"] = []
         self.max_size = len(data)
 
     def reset_texcs(self, data):
         self.texcs.set_array(numpy.array(data, "f"))
+        self._dirty["texcs"] = []
         self.max_size = len(data)
 
     def reset_norms(self, data):
         self.norms.set_array(numpy.array(data, "f"))
+        self._dirty["norms"] = []
         self.max_size = len(data)
 
     def update_verts(self, index, new):
-        if self.cache_changes:
-            self._cached_cv.append([index, new])
-        else:
-            self.verts.bind()
-            #index multiplier is
-            #4*len(new) - so since verts have 3 points, we get 12
-            glBufferSubData(GL_ARRAY_BUFFER, 12*index, numpy.array(new, "f"))
-            self.verts.data[index] = new
+        self._update("verts", index, new)
 
     def update_colors(self, index, new):
-        if self.cache_changes:
-            self._cached_cc.append([index, new])
-        else:
-            self.colors.bind()
-            glBufferSubData(GL_ARRAY_BUFFER, 16*index, numpy.array(new, "f"))
-            self.colors.data[index] = new
+        self._update("colors", index, new)
 
     def update_texcs(self, index, new):
-        if self.cache_changes:
-            self._cached_ct.append([index, new])
-        else:
-            self.texcs.bind()
-            glBufferSubData(GL_ARRAY_BUFFER, 8*index, numpy.array(new, "f"))
-            self.texcs.data[index] = new
+        self._update("texcs", index, new)
 
     def update_norms(self, index, new):
-        if self.cache_changes:
-            self._cached_cn.append([index, new])
-        else:
-            self.norms.bind()
-            glBufferSubData(GL_ARRAY_BUFFER, 12*index, numpy.array(new, "f"))
-            self.norms.data[index] = new
+        self._update("norms", index, new)
+
+    def update_verts_many(self, indices, new):
+        """Set the vertices at every index in indices to the matching row of new (or broadcast new)"""
+        self._update_many("verts", indices, new)
+
+    def update_colors_many(self, indices, new):
+        """Set the colors at every index in indices to the matching row of new (or broadcast new)"""
+        self._update_many("colors", indices, new)
+
+    def update_texcs_many(self, indices, new):
+        """Set the texture coords at every index in indices to the matching row of new (or broadcast new)"""
+        self._update_many("texcs", indices, new)
+
+    def update_norms_many(self, indices, new):
+        """Set the normals at every index in indices to the matching row of new (or broadcast new)"""
+        self._update_many("norms", indices, new)
 
     def __del__(self):
-        bufs = []
-        for i in (self.verts, self.colors, self.texcs, self.norms):
-            try:
-                i.delete()
-            except:
-                pass #pyggel.quit() was called and we can no longer access the functions!
+        for i in self._res:
+            resource.release(i)
 
     def resize(self, max_size):
         self.max_size = max_size
@@ -462,6 +802,239 @@ class VBOArray(object):
         d = numpy.resize(self.norms.data, (max_size, 3))
         self.norms.set_array(d)
 
+        for res, i in zip(self._res, (self.verts, self.colors, self.texcs, self.norms)):
+            resource.resize(res, i.data.nbytes)
+
+        for name in self._dirty:
+            self._dirty[name] = []
+
+def begin_stream_frame():
+    """Start a new frame on every live StreamBuffer - view.refresh_screen calls this after each flip."""
+    for i in list(StreamBuffer._streams):
+        i.begin_frame()
+
+class StreamBuffer(object):
+    """A large, shared vertex buffer that is sub-allocated every frame for dynamic data.
+       The buffer is split into segments, and each frame writes into the next segment in the ring,
+       so the GPU can still be reading the last frames' data while we write the new one.
+       When the ring wraps around the buffer storage is orphaned (if orphan is True),
+       so the driver hands us fresh memory instead of waiting on the old draws."""
+    _res = None
+    _streams = weakref.WeakSet()
+    def __init__(self, size=2**18, segments=3, orphan=True):
+        """Create the buffer
+           size is the total number of floats the buffer holds
+           segments is how many frames can be in flight at once - each frame gets size/segments floats
+           orphan controls whether the storage is orphaned each time the ring wraps around"""
+        if not VBO_AVAILABLE:
+            raise AttributeError("Vertex buffer objects not available!")
+
+        self.segments = segments
+        self.segment_size = (size // segments) & ~3 #keep every segment 16 byte aligned
+        self.size = self.segment_size * segments
+        self.orphan = orphan
+
+        self.data = numpy.zeros(self.size, "f")
+        self.buffer = vbo.VBO(self.data, "GL_STREAM_DRAW")
+        self._res = resource.register("vbo", self.buffer, self.data.nbytes)
+
+        self.frame = 0
+        self.segment = -1
+        self.head = 0
+        self.end = 0
+        self._dirty = []
+
+        self.begin_frame()
+        StreamBuffer._streams.add(self)
+
+    def begin_frame(self):
+        """Start a new frame - moves writing to the next segment of the ring.
+           Windows handed out in earlier frames should not be written to after this."""
+        self.frame += 1
+        self.segment = (self.segment + 1) % self.segments
+        self.head = self.segment * self.segment_size
+        self.end = self.head + self.segment_size
+        self._dirty = []
+        if self.segment == 0 and self.orphan:
+            self.buffer.bind()
+            glBufferData(GL_ARRAY_BUFFER, self.data.nbytes, None, GL_STREAM_DRAW)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def alloc(self, count, components=3):
+        """Return a StreamWindow of count elements, each with components floats, to write this frame's data to.
+           Raises ValueError if the current segment is out of space."""
+        n = (count * components + 3) & ~3
+        if self.head + n > self.end:
+            raise ValueError("StreamBuffer segment full - make the buffer bigger or use fewer segments")
+        start = self.head
+        self.head += n
+        self._dirty.append((start, start+n))
+        return StreamWindow(self, start, count, components)
+
+    def mark_dirty(self, start, end):
+        """Mark the floats from start to end as written, so the next flush uploads them."""
+        self._dirty.append((start, end))
+
+    def flush(self):
+        """Upload every range written (or handed out) since the last flush - touching ranges are sent together."""
+        if self._dirty:
+            self.buffer.bind()
+            for start, end in _merge_spans(self._dirty):
+                glBufferSubData(GL_ARRAY_BUFFER, 4*start, self.data[start:end])
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            self._dirty = []
+
+    def __del__(self):
+        resource.release(self._res)
+
+class StreamWindow(object):
+    """A range of a StreamBuffer, handed out for one frame."""
+    def __init__(self, stream, start, count, components):
+        """Create the window
+           stream is the StreamBuffer this window is part of
+           start is the float offset of the window in the buffer
+           count/components are the number of elements and floats per element"""
+        self.stream = stream
+        self.frame = stream.frame
+        self.start = start
+        self.offset = 4 * start
+        self.end = start + count * components
+        self.data = stream.data[start:self.end].reshape((count, components))
+
+    def mark_dirty(self):
+        """Mark the window as written to, so the stream's next flush uploads it again."""
+        if self.is_current():
+            self.stream.mark_dirty(self.start, self.end)
+
+    def is_current(self):
+        """Return whether this window belongs to the stream's current frame."""
+        return self.frame == self.stream.frame
+
+    def pointer(self):
+        """Return the buffer offset object used by the gl*Pointer functions while the buffer is bound."""
+        return self.stream.buffer + self.offset
+
+class StreamArray(object):
+    """Works like a VertexArray, except the data is rewritten every frame into a shared StreamBuffer.
+       Many small dynamic arrays (particles, text, debug lines) can share one stream and avoid stalling
+       on a buffer the GPU is still reading.
+       verts/colors/texcs/norms are the array's own numpy arrays - write to them whenever,
+       and render copies them into the current frame's part of the stream (view.refresh_screen starts new frames),
+       so an array that isn't rendered for a while still has its contents when it comes back."""
+    def __init__(self, stream, render_type=None, max_size=100):
+        """Create the array
+           stream is the StreamBuffer to allocate from
+           render_type is the OpenGL constant used in rendering, ie GL_POLYGON, GL_TRINAGLES, etc.
+           max_size is the size of the array"""
+        if render_type is None:
+            render_type = GL_QUADS
+        self.stream = stream
+        self.render_type = render_type
+        self.texture = BlankTexture()
+
+        self.verts = numpy.zeros((0,3), "f")
+        self.colors = numpy.zeros((0,4), "f")
+        self.texcs = numpy.zeros((0,2), "f")
+        self.norms = numpy.zeros((0,3), "f")
+        self.resize(max_size)
+        self.norms[:] = (0,1,0)
+
+    def render(self):
+        """Render the array"""
+        self.flush()
+        self.texture.bind()
+
+        v, c, t, n = self._windows
+        self.stream.buffer.bind()
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+
+        glVertexPointer(3, GL_FLOAT, 0, v.pointer())
+        glColorPointer(4, GL_FLOAT, 0, c.pointer())
+        glTexCoordPointer(2, GL_FLOAT, 0, t.pointer())
+        glNormalPointer(GL_FLOAT, 0, n.pointer())
+
+        glDrawArrays(self.render_type, 0, self.max_size)
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+
+    def reset_verts(self, data):
+        data = numpy.array(data, "f")
+        if len(data) != self.max_size:
+            self.resize(len(data))
+        self.verts[:] = data
+
+    def reset_colors(self, data):
+        data = numpy.array(data, "f")
+        if len(data) != self.max_size:
+            self.resize(len(data))
+        self.colors[:] = data
+
+    def reset_texcs(self, data):
+        data = numpy.array(data, "f")
+        if len(data) != self.max_size:
+            self.resize(len(data))
+        self.texcs[:] = data
+
+    def reset_norms(self, data):
+        data = numpy.array(data, "f")
+        if len(data) != self.max_size:
+            self.resize(len(data))
+        self.norms[:] = data
+
+    def update_verts(self, index, new):
+        self.verts[index] = new
+
+    def update_colors(self, index, new):
+        self.colors[index] = new
+
+    def update_texcs(self, index, new):
+        self.texcs[index] = new
+
+    def update_norms(self, index, new):
+        self.norms[index] = new
+
+    def update_verts_many(self, indices, new):
+        self.verts[numpy.asarray(indices, "i")] = new
+
+    def update_colors_many(self, indices, new):
+        self.colors[numpy.asarray(indices, "i")] = new
+
+    def update_texcs_many(self, indices, new):
+        self.texcs[numpy.asarray(indices, "i")] = new
+
+    def update_norms_many(self, indices, new):
+        self.norms[numpy.asarray(indices, "i")] = new
+
+    def flush(self):
+        """Copy the array into the current frame's part of the stream (allocating it if needed),
+           and upload it along with any other pending stream data."""
+        arrays = self.verts, self.colors, self.texcs, self.norms
+        if self._windows is None or not self._windows[0].is_current():
+            self._windows = [self.stream.alloc(self.max_size, i.shape[1]) for i in arrays]
+        for window, array in zip(self._windows, arrays):
+            window.data[:] = array
+            window.mark_dirty()
+        self.stream.flush()
+
+    def resize(self, max_size):
+        """Change the size of the array - the contents that still fit are kept."""
+        arrays = []
+        for old in (self.verts, self.colors, self.texcs, self.norms):
+            new = numpy.zeros((max_size, old.shape[1]), "f")
+            n = min(len(old), max_size)
+            new[:n] = old[:n]
+            arrays.append(new)
+        self.verts, self.colors, self.texcs, self.norms = arrays
+        self.max_size = max_size
+        self._windows = None
+
 def get_best_array_type(render_type=None, max_size=10,
                         opt=0):
     """This function returns the best possible array type for what you need.
@@ -487,39 +1060,107 @@ def get_best_array_type(render_type=None, max_size=10,
     else:
         return VBOArray(render_type, max_size, "static", True)
 
-class FrameBuffer(object):
+def _power_of_two_size(size):
+    """Return size rounded up to the next power of two (at least 2) in each direction."""
+    _x, _y = size
+    x = y = 2
+    while x < _x:
+        x *= 2
+    while y < _y:
+        y *= 2
+    return x, y
+
+class _RenderTarget(object):
+    """Projection and clearing settings shared by the render-to-texture objects."""
+    def set_perspective(self, view_angle=45, near=0.1, far=100.0):
+        """Render with a perspective projection (the default)."""
+        self.view_angle = view_angle
+        self.near = near
+        self.far = far
+        self.projection = None
+
+    def set_projection(self, matrix=None):
+        """Render with a custom projection
+           matrix must be a 16 float, column-major OpenGL matrix (ie for an ortho view, a mirror or an oblique clip),
+               or None to go back to the perspective settings"""
+        if matrix is None:
+            self.projection = None
+        else:
+            self.projection = numpy.array(matrix, "f").ravel()
+
+    def _set_view(self):
+        """Set up the viewport and projection for rendering into the target."""
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        glViewport(0,0,*self.size)
+        if self.projection is None:
+            gluPerspective(self.view_angle, 1.0*self.size[0]/self.size[1], self.near, self.far)
+        else:
+            glLoadMatrixf(self.projection)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        glEnable(GL_DEPTH_TEST)
+
+class DepthBuffer(object):
+    """A depth renderbuffer, which can be shared by several FrameBuffers of the same size
+       as long as they are not rendered to at the same time."""
+    _res = None
+    def __init__(self, size=(512,512)):
+        """Create the buffer
+           size must be the (x,y) size of the buffer, will round up to the next power of two"""
+        view.require_init()
+        if not (FBO_AVAILABLE and bool(glGenRenderbuffersEXT)):
+            raise AttributeError("Frame buffer objects not available!")
+        self.size = _power_of_two_size(size)
+
+        self.rbuffer = glGenRenderbuffersEXT(1)
+        glBindRenderbufferEXT(GL_RENDERBUFFER_EXT,
+                              self.rbuffer)
+        glRenderbufferStorageEXT(GL_RENDERBUFFER_EXT,
+                                 GL_DEPTH_COMPONENT,
+                                 self.size[0],
+                                 self.size[1])
+        glBindRenderbufferEXT(GL_RENDERBUFFER_EXT, 0)
+        self._res = resource.register("renderbuffer", self.rbuffer, self.size[0]*self.size[1]*4)
+
+    def __del__(self):
+        """Clean up..."""
+        resource.release(self._res)
+
+class FrameBuffer(_RenderTarget):
     """An object contains functions to render to a texture instead of to the main display.
        This object renders using FBO's, which are not available to everyone, but they are far faster and more versatile."""
-    def __init__(self, size=(512,512), clear_color=(0,0,0,0)):
+    _res = None
+    def __init__(self, size=(512,512), clear_color=(0,0,0,0), depth=True,
+                 view_angle=45, near=0.1, far=100.0, clear=True):
         """Create the FrameBuffer.
            size must be the (x,y) size of the buffer, will round up to the next power of two
-           clear_color must be the (r,g,b) or (r,g,b,a) color of the background of the texture"""
+           clear_color must be the (r,g,b) or (r,g,b,a) color of the background of the texture
+           depth can be True (create a depth buffer), False (no depth buffer) or a DepthBuffer to share
+           view_angle/near/far are the perspective settings used while rendering to the buffer
+           clear controls whether the buffer is cleared each time it is enabled -
+               can be True/False or the GL_*_BUFFER_BIT flags to clear"""
         view.require_init()
         if not (FBO_AVAILABLE and bool(glGenRenderbuffersEXT)):
             raise AttributeError("Frame buffer objects not available!")
 
-        _x, _y = size
-        x = y = 2
-        while x < _x:
-            x *= 2
-        while y < _y:
-            y *= 2
-        size = x, y
+        size = _power_of_two_size(size)
 
         self.size = size
         self.clear_color = clear_color
+        self.set_perspective(view_angle, near, far)
+        self.set_clear(clear)
 
-        self.texture = BlankTexture(self.size, self.clear_color)
+        self.texture = BlankTexture(self.size, self.clear_color, True)
 
-        self.rbuffer = glGenRenderbuffersEXT(1)
-        glBindRenderbufferEXT(GL_RENDERBUFFER_EXT,
-                              self.rbuffer)
-        glRenderbufferStorageEXT(GL_RENDERBUFFER_EXT,
-                                 GL_DEPTH_COMPONENT,
-                                 size[0],
-                                 size[1])
+        if depth is True:
+            depth = DepthBuffer(size)
+        elif depth and depth.size != size:
+            raise ValueError("DepthBuffer size %s does not match FrameBuffer size %s"%(depth.size, size))
+        self.depth = depth or None
 
         self.fbuffer = glGenFramebuffersEXT(1)
+        self._res = resource.register("framebuffer", self.fbuffer)
         glBindFramebufferEXT(GL_FRAMEBUFFER_EXT,
                              self.fbuffer)
         glFramebufferTexture2DEXT(GL_FRAMEBUFFER_EXT,
@@ -527,66 +1168,126 @@ class FrameBuffer(object):
                                   GL_TEXTURE_2D,
                                   self.texture.gl_tex,
                                   0)
-        glFramebufferRenderbufferEXT(GL_FRAMEBUFFER_EXT,
-                                     GL_DEPTH_ATTACHMENT_EXT,
-                                     GL_RENDERBUFFER_EXT,
-                                     self.rbuffer)
+        if self.depth:
+            glFramebufferRenderbufferEXT(GL_FRAMEBUFFER_EXT,
+                                         GL_DEPTH_ATTACHMENT_EXT,
+                                         GL_RENDERBUFFER_EXT,
+                                         self.depth.rbuffer)
 
         self.worked = glCheckFramebufferStatusEXT(GL_FRAMEBUFFER_EXT) == GL_FRAMEBUFFER_COMPLETE_EXT
 
-        glBindRenderbufferEXT(GL_RENDERBUFFER_EXT, 0)
         glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, 0)
 
+    def set_clear(self, clear=True):
+        """Set which buffers are cleared when the buffer is enabled - True/False or GL_*_BUFFER_BIT flags."""
+        if clear is True:
+            clear = GL_DEPTH_BUFFER_BIT|GL_COLOR_BUFFER_BIT
+        self.clear_bits = clear or 0
+
     def enable(self):
         """Turn this buffer on, swaps rendering to the texture instead of the display."""
         glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, self.fbuffer)
-        r,g,b = self.clear_color[:3]
-        glClearColor(r, g, b, 1)
-        glClear(GL_DEPTH_BUFFER_BIT|GL_COLOR_BUFFER_BIT)
+        clear_bits = self.clear_bits
+        if not self.depth:
+            clear_bits &= ~GL_DEPTH_BUFFER_BIT
+        if clear_bits:
+            r,g,b = self.clear_color[:3]
+            glClearColor(r, g, b, 1)
+            glClear(clear_bits)
+
+        glPushAttrib(GL_VIEWPORT_BIT | GL_ENABLE_BIT) #depth testing may be turned off below
+        self._set_view()
+        if not self.depth:
+            glDisable(GL_DEPTH_TEST)
 
-        glPushAttrib(GL_VIEWPORT_BIT)
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        glViewport(0,0,*self.size)
-        gluPerspective(45, 1.0*self.size[0]/self.size[1], 0.1, 100.0)
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-        glEnable(GL_DEPTH_TEST)
-        
     def disable(self):
         """Turn off the buffer, swap rendering back to the display."""
         glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, 0)
         glClearColor(*view.screen.clear_color)
         glPopAttrib()
-
-    def __del__(self):
-        """Clean up..."""
+        pool = getattr(self, "pool", None)
         try:
-            glDeleteFramebuffersEXT(1, [self.fbuffer])
-        except:
+            if pool is not None and pool.auto_release:
+                pool.release(self)
+        except ReferenceError: #the pool was already collected
             pass
 
-        try:
-            glDeleteRenderbuffersEXT(1, [self.rbuffer])
-        except:
-            pass
-
-class TextureBuffer(object):
+    def __del__(self):
+        """Clean up..."""
+        resource.release(self._res)
+
+class FrameBufferPool(object):
+    """Keeps FrameBuffers (and their depth buffers) around to be reused,
+       so effects that render to a texture every frame (impostors, minimaps, mirrors)
+       don't create and destroy GL objects each time."""
+    def __init__(self, share_depth=True, auto_release=False):
+        """Create the pool
+           share_depth controls whether all FrameBuffers of the same size share one DepthBuffer,
+               only safe if they are never rendered to at the same time (they are cleared on enable anyway)
+           auto_release makes buffers go back to the pool as soon as they are disabled -
+               useful for per-frame effects where the texture is used right after rendering"""
+        self.share_depth = share_depth
+        self.auto_release = auto_release
+        self._free = {}
+        self._depth = {}
+
+    def get_depth(self, size):
+        """Return the shared DepthBuffer for size, creating it if needed."""
+        size = _power_of_two_size(size)
+        if not size in self._depth:
+            self._depth[size] = DepthBuffer(size)
+        return self._depth[size]
+
+    def get(self, size=(512,512), clear_color=(0,0,0,0), depth=True,
+            view_angle=45, near=0.1, far=100.0, clear=True):
+        """Return a FrameBuffer from the pool, or a new one if none of that size/depth setting are free.
+           Arguments are the same as for FrameBuffer, except depth must be True or False.
+           Call release when finished with the buffer."""
+        size = _power_of_two_size(size)
+        key = size, bool(depth)
+        if self._free.get(key):
+            fb = self._free[key].pop()
+            fb.clear_color = clear_color
+            fb.set_perspective(view_angle, near, far)
+            fb.set_clear(clear)
+        else:
+            if depth and self.share_depth:
+                depth = self.get_depth(size)
+            fb = FrameBuffer(size, clear_color, depth, view_angle, near, far, clear)
+            fb.pool = weakref.proxy(self) #a strong reference would make a cycle the GC can't break (FrameBuffer has a __del__)
+        return fb
+
+    def release(self, fb):
+        """Return fb to the pool for reuse."""
+        key = fb.size, bool(fb.depth)
+        free = self._free.setdefault(key, [])
+        if not fb in free:
+            free.append(fb)
+
+    def get_free_count(self):
+        """Return the number of buffers waiting to be reused."""
+        return sum([len(i) for i in self._free.values()])
+
+    def clear(self):
+        """Drop all the free buffers and shared depth buffers, so their GL objects can be deleted."""
+        self._free = {}
+        self._depth = {}
+
+class TextureBuffer(_RenderTarget):
     """An object contains functions to render to a texture, using the main display.
        This object renders using the main display, copying to the texture, and then clearing.
        This object is considerably slower than teh FrameBuffer object, and less versatile,
        because you cannot use these objects mid-render, if you do you will lose whatever was rendered before them!"""
-    def __init__(self, size=(512,512), clear_color=(0,0,0,0)):
+    def __init__(self, size=(512,512), clear_color=(0,0,0,0), depth=True,
+                 view_angle=45, near=0.1, far=100.0, clear=True):
         """Create the FrameBuffer.
            size must be the (x,y) size of the buffer, will round up to the next power of two
                if size is greater than the display size, it will be rounded down to the previous power of two
-           clear_color must be the (r,g,b) or (r,g,b,a) color of the background of the texture"""
-        _x, _y = size
-        x = y = 2
-        while x < _x:
-            x *= 2
-        while y < _y:
-            y *= 2
+           clear_color must be the (r,g,b) or (r,g,b,a) color of the background of the texture
+           depth is only here for compatability with FrameBuffer, the display's depth buffer is always used
+           view_angle/near/far are the perspective settings used while rendering to the buffer
+           clear controls whether the display is cleared each time the buffer is enabled"""
+        x, y = _power_of_two_size(size)
         while x > view.screen.screen_size[0]:
             x /= 2
         while y > view.screen.screen_size[1]:
@@ -595,25 +1296,22 @@ class TextureBuffer(object):
 
         self.size = size
         self.clear_color = clear_color
+        self.set_perspective(view_angle, near, far)
+        self.clear = clear
 
-        self.texture = BlankTexture(self.size, self.clear_color)
+        self.texture = BlankTexture(self.size, self.clear_color, True)
         self.worked = True
 
     def enable(self):
         """Turn on rendering to this buffer, clears display buffer and preps it for this object."""
-        r,g,b = self.clear_color[:3]
+        if self.clear:
+            r,g,b = self.clear_color[:3]
 
-        glClearColor(r, g, b, 1)
-        glClear(GL_DEPTH_BUFFER_BIT|GL_COLOR_BUFFER_BIT)
-        glClearColor(*view.screen.clear_color)
+            glClearColor(r, g, b, 1)
+            glClear(GL_DEPTH_BUFFER_BIT|GL_COLOR_BUFFER_BIT)
+            glClearColor(*view.screen.clear_color)
 
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        glViewport(0,0,*self.size)
-        gluPerspective(45, 1.0*self.size[0]/self.size[1], 0.1, 100.0)
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-        glEnable(GL_DEPTH_TEST)
+        self._set_view()
 
     def disable(self):
         """Turn of this buffer, and clear the display."""
@@ -882,12 +882,7 @@ class FontImage(BaseSceneObject):
             return
         self._color = color
 
-        _c = []
-
-        for i in xrange(len(color)):
-            for j in xrange(6):
-                _c.append(color[i])
-        self.text_array.reset_colors(_c)
+        self.text_array.reset_colors(numpy.repeat(numpy.array(color, "f"), 6, 0))
 
     def get_color(self):
         return self._color
@@ -91,8 +91,6 @@ class Cube(BaseSceneObject):
 
         self.scale = 1
 
-        self.display_list = data.DisplayList()
-
         self._compile()
 
     def get_dimensions(self):
@@ -104,16 +102,14 @@ class Cube(BaseSceneObject):
         return self.pos
 
     def _compile(self):
-        """Compile the cube's rendering into a data.DisplayList"""
-        self.display_list.begin()
-
+        """Compile the cube's rendering into a data.Geometry"""
         ox = .25
         oy = .33
-        last_tex = None
 
-        glBegin(GL_QUADS)
+        verts = []
+        norms = []
+        texcs = []
         for i in self.sides:
-            ix = 0
             x, y = self.split_coords[i[5]]
             x *= ox
             y *= oy
@@ -122,15 +118,13 @@ class Cube(BaseSceneObject):
             else:
                 coords = ((x+ox, y+oy), (x+ox, y), (x, y), (x, y+oy))
 
-            glNormal3f(*self.normals[i[6]])
+            for ix in xrange(4):
+                verts.append(self.corners[i[ix]])
+                norms.append(self.normals[i[6]])
+                texcs.append(coords[ix])
 
-            for x in i[:4]:
-                glTexCoord2fv(coords[ix])
-                a, b, c = self.corners[x]
-                glVertex3f(a,b,c)
-                ix += 1
-        glEnd()
-        self.display_list.end()
+        self.display_list = data.Geometry(verts, norms, texcs,
+                                          indices=data.fan_indices([4]*len(self.sides)))
 
     def render(self, camera=None):
         """Render the cube
@@ -194,38 +188,28 @@ class Quad(Cube, BaseSceneObject):
 
         self.scale = 1
 
-        self.display_list = data.DisplayList()
-
         self.hide_faces = hide_faces
 
         self._compile()
 
     def _compile(self):
-        """Compile the Quad into a data.DisplayList"""
-        self.display_list.begin()
+        """Compile the Quad into a data.Geometry"""
+        self._compile_faces(((1,1), (0,1), (0,0), (1,0)),
+                            ((1,0), (0,0), (0,1), (1,1)))
 
-        glBegin(GL_QUADS)
-        glNormal3f(0,1,0)
+    def _compile_faces(self, back_texcs, front_texcs):
+        """Build the data.Geometry for the (not hidden) back and front faces, using the given texture coords"""
+        verts = []
+        texcs = []
         if not "back" in self.hide_faces:
-            glTexCoord2f(1,1)
-            glVertex3f(-1,1,0)
-            glTexCoord2f(0,1)
-            glVertex3f(1, 1, 0)
-            glTexCoord2f(0,0)
-            glVertex3f(1, -1, 0)
-            glTexCoord2f(1,0)
-            glVertex3f(-1, -1, 0)
+            verts.extend(((-1,1,0), (1,1,0), (1,-1,0), (-1,-1,0)))
+            texcs.extend(back_texcs)
         if not "front" in self.hide_faces:
-            glTexCoord2f(1,0)
-            glVertex3f(-1, -1, 0)
-            glTexCoord2f(0,0)
-            glVertex3f(1, -1, 0)
-            glTexCoord2f(0,1)
-            glVertex3f(1, 1, 0)
-            glTexCoord2f(1,1)
-            glVertex3f(-1, 1, 0)
-        glEnd()
-        self.display_list.end()
+            verts.extend(((-1,-1,0), (1,-1,0), (1,1,0), (-1,1,0)))
+            texcs.extend(front_texcs)
+
+        self.display_list = data.Geometry(verts, [(0,1,0)]*len(verts), texcs,
+                                          indices=data.fan_indices([4]*(len(verts)/4)))
 
     def copy(self):
         """Return a copy of the Quad, sharing the same display list"""
@@ -257,35 +241,10 @@ class Plane(Quad):
         Quad.__init__(self, size, pos, rotation, colorize, texture, hide_faces)
 
     def _compile(self):
-        """Compile Plane into a data.DisplayList"""
-        self.display_list.begin()
-
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_R, GL_REPEAT)
-
-        glBegin(GL_QUADS)
-        glNormal3f(0,1,0)
-        if not "back" in self.hide_faces:
-            glTexCoord2f(self.tile,0)
-            glVertex3f(-1,1,0)
-            glTexCoord2f(self.tile,self.tile)
-            glVertex3f(1, 1, 0)
-            glTexCoord2f(self.tile,0)
-            glVertex3f(1, -1, -0)
-            glTexCoord2f(0,0)
-            glVertex3f(-1, -1, -0)
-        if not "front" in self.hide_faces:
-            glTexCoord2f(0,0)
-            glVertex3f(-1, -1, -0)
-            glTexCoord2f(self.tile, 0)
-            glVertex3f(1, -1, -0)
-            glTexCoord2f(self.tile,self.tile)
-            glVertex3f(1, 1, 0)
-            glTexCoord2f(0, self.tile)
-            glVertex3f(-1,1,0)
-        glEnd()
-        self.display_list.end()
+        """Compile Plane into a data.Geometry"""
+        t = self.tile
+        self._compile_faces(((t,0), (t,t), (t,0), (0,0)),
+                            ((0,0), (t,0), (t,t), (0,t)))
 
     def render(self, camera=None):
         """Render the Plane
@@ -305,6 +264,9 @@ class Plane(Quad):
             glScalef(self.scale, self.scale, self.scale)
         glColor(*self.colorize)
         self.texture.bind()
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_R, GL_REPEAT)
         self.display_list.render()
         glPopMatrix()
 
@@ -344,7 +306,7 @@ class Skybox(Cube):
             glEnable(GL_CULL_FACE)
 
     def copy(self):
-        """Return a copy of the Skybox - sharing the same data.DisplayList"""
+        """Return a copy of the Skybox - sharing the same data.Geometry"""
         n = Skybox(self.texture, self.colorize)
         n.scale = self.scale
         n.display_list = self.display_list
@@ -380,8 +342,6 @@ class Sphere(BaseSceneObject):
 
         self.show_inside = show_inside
 
-        self.display_list = data.DisplayList()
-
         self._compile()
 
     def get_dimensions(self):
@@ -393,49 +353,38 @@ class Sphere(BaseSceneObject):
         return self.pos
 
     def _compile(self):
-        self.display_list.begin()
-
-        verts = []
-        texcs = []
-        norms = []
-
-        space=self.detail
-
-        for b in xrange(0, 180, space):
-            b *= 1.0
-            for a in xrange(0, 360, space):
-                a *= 1.0
-                _v = []
-                _t = []
-                for i in xrange(2):
-                    for j in xrange(2):
-                        s1 = space*i
-                        s2 = space*j
-                        x=self.size * math.sin(math3d.safe_div(a+s1, 180)*math.pi) * math.sin(math3d.safe_div(b+s2, 180)*math.pi)
-                        z=self.size * math.cos(math3d.safe_div(a+s1, 180)*math.pi) * math.sin(math3d.safe_div(b+s2, 180)*math.pi)
-                        y=self.size * math.cos(math3d.safe_div(b+s2, 180)*math.pi)
-                        u=math3d.safe_div(a+s1,360)
-                        v=math3d.safe_div(b+s2,360)
-                        _v.append((x,y,z))
-                        _t.append((u,1-v*2))
-                verts.extend([_v[0], _v[1], _v[3], _v[0], _v[3], _v[2]])
-                texcs.extend([_t[0], _t[1], _t[3], _t[0], _t[3], _t[2]])
-                norms.extend([math3d.calcTriNormal(*verts[-6:-3])]*3)
-                norms.extend([math3d.calcTriNormal(*verts[-3::])]*3)
-                if self.show_inside:
-                    verts.extend(reversed(verts[-6::]))
-                    texcs.extend(reversed(texcs[-6::]))
-                    norms.extend([math3d.calcTriNormal(*verts[-6:-3])]*3)
-                    norms.extend([math3d.calcTriNormal(*verts[-3::])]*3)
-        glBegin(GL_TRIANGLES)
-        for i in xrange(len(verts)):
-            u,v = texcs[i]
-            glTexCoord2f(u,v)
-            glNormal3f(*norms[i])
-            x,y,z = verts[i]
-            glVertex3f(x,y,z)
-        glEnd()
-        self.display_list.end()
+        """Compile the Sphere into a data.Geometry"""
+        space = self.detail
+
+        #every cell of the lat/long grid, in the order b (0-180) then a (0-360)
+        b, a = numpy.mgrid[0:180:space, 0:360:space]
+        a = a.ravel() * 1.0
+        b = b.ravel() * 1.0
+
+        #the 4 corners of each cell, corner i*2+j is offset by (space*i, space*j)
+        ca = numpy.array((a, a, a+space, a+space)).T
+        cb = numpy.array((b, b+space, b, b+space)).T
+        ra = ca / 180 * math.pi
+        rb = cb / 180 * math.pi
+        corners = numpy.empty(ca.shape + (3,), "f")
+        corners[...,0] = self.size * numpy.sin(ra) * numpy.sin(rb)
+        corners[...,1] = self.size * numpy.cos(rb)
+        corners[...,2] = self.size * numpy.cos(ra) * numpy.sin(rb)
+        coords = numpy.empty(ca.shape + (2,), "f")
+        coords[...,0] = ca / 360
+        coords[...,1] = 1 - cb / 360 * 2
+
+        order = [0, 1, 3, 0, 3, 2]
+        if self.show_inside:
+            order += [2, 3, 0, 3, 1, 0]
+        verts = corners[:,order]
+        texcs = coords[:,order]
+
+        tris = verts.reshape((-1,3,3))
+        norms = numpy.cross(tris[:,1]-tris[:,0], tris[:,2]-tris[:,0])
+        norms = numpy.repeat(norms, 3, 0)
+
+        self.display_list = data.Geometry(verts.reshape((-1,3)), norms, texcs.reshape((-1,2)))
 
     def render(self, camera=None):
         """Render the Sphere
@@ -495,7 +444,7 @@ class Skyball(Sphere):
             glEnable(GL_LIGHTING)
 
     def copy(self):
-        """Return a copy of teh Skyball - sharing the same dadta.DisplayList"""
+        """Return a copy of teh Skyball - sharing the same data.Geometry"""
         n = Skyball(self.texture, self.colorize, self.detail)
         n.scale = self.scale
         n.display_list = self.display_list
@@ -525,14 +474,10 @@ class Pyramid(BaseSceneObject):
 
         self.scale = 1
 
-        self.display_list = data.DisplayList()
-
         self._compile()
 
     def _compile(self):
-        """Compile the cube's rendering into a data.DisplayList"""
-        self.display_list.begin()
-
+        """Compile the pyramid's rendering into a data.Geometry"""
         top = (0,0.5,0)
         bottomleft = (-math.sqrt(3)*0.25,-0.5,0.25)
         bottomright = (math.sqrt(3)*0.25,-0.5,0.25)
@@ -553,18 +498,17 @@ class Pyramid(BaseSceneObject):
         if not "left" in self.hide_faces:
             ttp.append(tpoints[3])
 
-        glBegin(GL_TRIANGLES)
-        for i in ttp:
-            coords = ((0.5,1), (0,0), (1,0))
-
-            glNormal3f(*math3d.calcTriNormal(i[0],i[1],i[2],False))
+        self._compile_triangles(ttp)
 
-            for p in xrange(3):
-                glTexCoord2fv(coords[p])
-                glVertex3f(*i[p])
-        glEnd()
+    def _compile_triangles(self, triangles):
+        """Build the data.Geometry from a list of 3-point triangles, all sharing the same texture mapping"""
+        verts = []
+        norms = []
+        for i in triangles:
+            verts.extend(i)
+            norms.extend([math3d.calcTriNormal(i[0],i[1],i[2],False)]*3)
 
-        self.display_list.end()
+        self.display_list = data.Geometry(verts, norms, [(0.5,1), (0,0), (1,0)]*len(triangles))
 
     def render(self, camera=None):
         """Render the cube
@@ -595,9 +539,7 @@ class DoublePyramid(Pyramid):
         Pyramid.__init__(self, size, pos, rotation, colorize, texture, hide_faces)
 
     def _compile(self):
-        """Compile the cube's rendering into a data.DisplayList"""
-        self.display_list.begin()
-
+        """Compile the double-pyramid's rendering into a data.Geometry"""
         top = (0,0.5,0)
         bottom = (0,-0.5,0)
         midleft = (-math.sqrt(3)*0.25,0,0.25)
@@ -626,15 +568,4 @@ class DoublePyramid(Pyramid):
         if not "bottomleft" in self.hide_faces:
             ttp.append(tpoints[5])
 
-        glBegin(GL_TRIANGLES)
-        for i in ttp:
-            coords = ((0.5,1), (0,0), (1,0))
-
-            glNormal3f(*math3d.calcTriNormal(i[0],i[1],i[2],False))
-
-            for p in xrange(3):
-                glTexCoord2fv(coords[p])
-                glVertex3f(*i[p])
-        glEnd()
-
-        self.display_list.end()
+        self._compile_triangles(ttp)
@@ -48,12 +48,9 @@ class Image(BaseSceneObject):
         return Image(self.texture, self.pos, self.rotation, self.scale, self.colorize)
 
     def _compile(self):
-        """Compile the Image into a data.DisplayList"""
+        """Compile the Image into a data.Geometry"""
         off = self.get_width()/2.0, self.get_height()/2.0
 
-        self.display_list = data.DisplayList()
-        self.display_list.begin()
-
         l = -off[0]
         r = off[0]
         t = -off[1]
@@ -61,22 +58,10 @@ class Image(BaseSceneObject):
 
         w, h = self.texture.size_mult
 
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, 0)
-        glVertex3f(l, t, 0)
-
-        glTexCoord2f(0, h)
-        glVertex3f(l, b, 0)
-
-        glTexCoord2f(w, h)
-        glVertex3f(r, b, 0)
-
-        glTexCoord2f(w, 0)
-        glVertex3f(r, t, 0)
-
-        glEnd()
-
-        self.display_list.end()
+        self.display_list = data.Geometry(((l, t, 0), (l, b, 0), (r, b, 0), (r, t, 0)),
+                                          [(0, 0, 1)]*4,
+                                          ((0, 0), (0, h), (w, h), (w, 0)),
+                                          render_type=GL_QUADS)
 
     def render(self, camera=None):
         """Render the image
@@ -184,12 +169,7 @@ class Image3D(Image):
         return Image3D(self.filename, self.pos, self.rotation, self.scale, self.colorize)
 
     def _compile(self):
-        """Compile the rendering data into a data.DisplayList"""
-        off = self.get_width()/2, self.get_height()/2
-
-        self.display_list = data.DisplayList()
-        self.display_list.begin()
-
+        """Compile the rendering data into a data.Geometry"""
         w, h = self.texture.size_mult
 
         gw, gh = self.get_size()
@@ -203,21 +183,10 @@ class Image3D(Image):
         else:
             uw = uh = 1
 
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, h)
-        glVertex3f(-uw, -uh, 0)
-
-        glTexCoord2f(w, h)
-        glVertex3f(uw, -uh, 0)
-
-        glTexCoord2f(w, 0)
-        glVertex3f(uw, uh, 0)
-
-        glTexCoord2f(0, 0)
-        glVertex3f(-uw, uh, 0)
-        glEnd()
-
-        self.display_list.end()
+        self.display_list = data.Geometry(((-uw, -uh, 0), (uw, -uh, 0), (uw, uh, 0), (-uw, uh, 0)),
+                                          [(0, 0, 1)]*4,
+                                          ((0, h), (w, h), (w, 0), (0, 0)),
+                                          render_type=GL_QUADS)
 
 def create_empty_image(size=(2,2), color=(1,1,1,1)):
     """Same as create_empty_texture, except returns an image.Image instead"""
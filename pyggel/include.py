@@ -32,6 +32,19 @@ try:
 except:
     VBO_AVAILABLE = False
 
+try:
+    from OpenGL.GL import shaders
+    SHADER_AVAILABLE = True
+except:
+    SHADER_AVAILABLE = False
+
+try:
+    from OpenGL.GL.ARB.instanced_arrays import glVertexAttribDivisorARB
+    from OpenGL.GL.ARB.draw_instanced import glDrawArraysInstancedARB, glDrawElementsInstancedARB
+    INSTANCING_AVAILABLE = True
+except:
+    INSTANCING_AVAILABLE = False
+
 try:
     from OpenGL.GL.EXT.texture_filter_anisotropic import *
     ANI_AVAILABLE = True
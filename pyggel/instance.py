@@ -0,0 +1,266 @@
+"""
+pyggel.instance
+This library (PYGGEL) is licensed under the LGPL by Matthew Roe and PYGGEL contributors.
+
+The instance module contains classes to render one piece of geometry many times,
+with the per-instance data stored in numpy arrays.
+"""
+
+from include import *
+import view, data, shader, resource, math3d
+from scene import BaseSceneObject
+
+import math
+
+_vertex_source = """
+#version 120
+attribute vec4 inst_m0;
+attribute vec4 inst_m1;
+attribute vec4 inst_m2;
+attribute vec4 inst_m3;
+attribute vec4 inst_color;
+uniform int lighting;
+varying vec4 color;
+
+void main()
+{
+    mat4 model = mat4(inst_m0, inst_m1, inst_m2, inst_m3);
+    vec4 pos = gl_ModelViewMatrix * (model * gl_Vertex);
+    gl_Position = gl_ProjectionMatrix * pos;
+    gl_TexCoord[0] = gl_MultiTexCoord0;
+
+    color = inst_color;
+    if (lighting != 0)
+    {
+        vec3 norm = normalize(gl_NormalMatrix * (mat3(model) * gl_Normal));
+        vec4 lpos = gl_LightSource[0].position;
+        vec3 ldir = normalize(lpos.xyz - pos.xyz * lpos.w);
+        vec4 shade = gl_LightModel.ambient + gl_LightSource[0].ambient +
+                     gl_LightSource[0].diffuse * max(dot(norm, ldir), 0.0);
+        color.rgb = min(inst_color * shade, 1.0).rgb;
+    }
+}
+"""
+
+_fragment_source = """
+#version 120
+uniform sampler2D tex;
+varying vec4 color;
+
+void main()
+{
+    gl_FragColor = texture2D(tex, gl_TexCoord[0].st) * color;
+}
+"""
+
+def compose_matrices(pos, rotation, scale):
+    """Return an (N, 4, 4) array of the model matrices for N objects, in pyggel's usual order:
+           translate(x, y, -z), rotate x, rotate y, rotate z, then scale
+       pos/rotation/scale must be (N, 3) arrays - rotation is in degrees
+       Each matrix is stored transposed (column-major), ready for glMultMatrixf or a vertex attribute."""
+    pos = numpy.array(pos, "f")
+    pos[:,2] *= -1
+    return math3d.compose_trs(pos, rotation, scale).transpose((0,2,1)).copy()
+
+class InstancedGroup(BaseSceneObject):
+    """Renders one piece of geometry many times, each instance with its own pos/rotation/scale/colorize.
+       The instance data lives in the numpy arrays positions, rotations, scales and colors - change them in bulk
+       (through set_* or directly, followed by invalidate()) and they are rebuilt and uploaded once before the next render.
+       If hardware instancing is available everything is drawn in one call with a small shader,
+       otherwise each instance is drawn from the geometry using its precomputed matrix."""
+    def __init__(self, verts, norms=None, texcs=None, texture=None,
+                 render_type=GL_TRIANGLES, use_instancing=True):
+        """Create the group
+           verts must be a data.Geometry, or a list/array of the (x,y,z) vertices of the geometry
+           norms can be None or a list/array of matching (x,y,z) normals
+           texcs can be None or a list/array of matching (u,v) texture coordinates
+           texture can be None, a string filename or a data.Texture object
+           render_type is the OpenGL constant used in rendering, ie GL_TRIANGLES, GL_QUADS, etc.
+           use_instancing can be set to False to always use the fallback path
+           norms/texcs/render_type are ignored if verts is a data.Geometry"""
+        BaseSceneObject.__init__(self)
+
+        if isinstance(verts, data.Geometry):
+            self.geometry = verts
+        else:
+            self.geometry = data.Geometry(verts, norms, texcs, render_type=render_type)
+
+        if type(texture) is type(""):
+            texture = data.Texture(texture)
+        if texture:
+            self.texture = texture
+
+        self.positions = numpy.zeros((0,3), "f")
+        self.rotations = numpy.zeros((0,3), "f")
+        self.scales = numpy.zeros((0,3), "f")
+        self.colors = numpy.zeros((0,4), "f")
+        self.matrices = numpy.zeros((0,4,4), "f")
+        self._dirty = False
+
+        self.pickable = False
+
+        self.instanced = bool(use_instancing and INSTANCING_AVAILABLE and SHADER_AVAILABLE and VBO_AVAILABLE and\
+                              bool(glVertexAttribDivisorARB) and bool(glDrawArraysInstancedARB))
+        if self.instanced:
+            self._build_instanced()
+
+    def _build_instanced(self):
+        """Create the buffers and shader used for hardware instancing."""
+        self.program = shader.Program(_vertex_source, _fragment_source)
+        self.program.set_uniform("tex", 0)
+        self._matrix_locs = [self.program.get_attribute("inst_m%s"%i) for i in xrange(4)]
+        self._color_loc = self.program.get_attribute("inst_color")
+
+        self._matrix_vbo = vbo.VBO(numpy.zeros((1,16), "f"), "GL_DYNAMIC_DRAW")
+        self._color_vbo = vbo.VBO(numpy.zeros((1,4), "f"), "GL_DYNAMIC_DRAW")
+        self._res = [resource.register("vbo", i, i.data.nbytes) for i in (self._matrix_vbo, self._color_vbo)]
+
+    def __len__(self):
+        """Return the number of instances."""
+        return len(self.positions)
+
+    def add_instances(self, positions, rotations=None, scales=None, colors=None):
+        """Add several instances at once, returns the indices of the new instances
+           positions must be a list/array of (x,y,z) positions
+           rotations/scales/colors can be None (no rotation, scale of 1, white) or matching lists/arrays,
+               a single value is used for every new instance"""
+        positions = numpy.array(positions, "f").reshape((-1,3))
+        n = len(positions)
+        if rotations is None:
+            rotations = (0,0,0)
+        if scales is None:
+            scales = (1,1,1)
+        if colors is None:
+            colors = (1,1,1,1)
+        start = len(self.positions)
+        self.positions = numpy.concatenate((self.positions, positions))
+        self.rotations = numpy.concatenate((self.rotations, numpy.resize(numpy.array(rotations, "f"), (n,3))))
+        self.scales = numpy.concatenate((self.scales, self._expand_scale(scales, n)))
+        self.colors = numpy.concatenate((self.colors, numpy.resize(numpy.array(colors, "f"), (n,4))))
+        self._dirty = True
+        return numpy.arange(start, start+n)
+
+    def add_instance(self, pos=(0,0,0), rotation=(0,0,0), scale=1, colorize=(1,1,1,1)):
+        """Add a single instance, returns its index."""
+        return self.add_instances([pos], [rotation], [self._expand_scale(scale, 1)[0]], [colorize])[0]
+
+    def remove_instances(self, indices):
+        """Remove the instances at indices - later instances shift down to fill the gaps."""
+        self.positions = numpy.delete(self.positions, indices, 0)
+        self.rotations = numpy.delete(self.rotations, indices, 0)
+        self.scales = numpy.delete(self.scales, indices, 0)
+        self.colors = numpy.delete(self.colors, indices, 0)
+        self._dirty = True
+
+    def _expand_scale(self, scale, n):
+        scale = numpy.array(scale, "f")
+        if scale.ndim == 0 or (scale.ndim == 1 and scale.shape[0] != 3):
+            scale = scale.reshape((-1,1)) * numpy.ones(3, "f")
+        return numpy.resize(scale, (n,3))
+
+    def set_positions(self, indices, positions):
+        """Set the positions of the instances at indices."""
+        self.positions[indices] = positions
+        self._dirty = True
+
+    def set_rotations(self, indices, rotations):
+        """Set the rotations of the instances at indices."""
+        self.rotations[indices] = rotations
+        self._dirty = True
+
+    def set_scales(self, indices, scales):
+        """Set the scales of the instances at indices - scales may be single numbers or (x,y,z) tuples."""
+        self.scales[indices] = self._expand_scale(scales, len(numpy.arange(len(self.scales))[indices]))
+        self._dirty = True
+
+    def set_colors(self, indices, colors):
+        """Set the colorize values of the instances at indices."""
+        self.colors[indices] = colors
+        self._dirty = True
+
+    def invalidate(self):
+        """Mark the instance data as changed - call after writing to the arrays directly."""
+        self._dirty = True
+
+    def _rebuild(self):
+        """Recompute every instance matrix and upload the instance data."""
+        self.matrices = compose_matrices(self.positions, self.rotations, self.scales)
+        if self.instanced and len(self.matrices):
+            self._matrix_vbo.set_array(self.matrices.reshape((-1,16)))
+            self._color_vbo.set_array(numpy.ascontiguousarray(self.colors))
+            for res, i in zip(self._res, (self._matrix_vbo, self._color_vbo)):
+                resource.resize(res, i.data.nbytes)
+        self._dirty = False
+
+    def render(self, camera=None):
+        """Render all instances
+           camera can be None or the camera the scene is using"""
+        if self._dirty:
+            self._rebuild()
+        if not len(self.matrices):
+            return None
+
+        glPushMatrix()
+        x, y, z = self.pos
+        glTranslatef(x, y, -z)
+        a, b, c = self.rotation
+        glRotatef(a, 1, 0, 0)
+        glRotatef(b, 0, 1, 0)
+        glRotatef(c, 0, 0, 1)
+        try:
+            glScalef(*self.scale)
+        except:
+            glScalef(self.scale, self.scale, self.scale)
+        self.texture.bind()
+
+        if self.instanced:
+            self._render_instanced()
+        else:
+            for i in xrange(len(self.matrices)):
+                glPushMatrix()
+                glMultMatrixf(self.matrices[i])
+                glColor4f(*self.colors[i])
+                self.geometry.render()
+                glPopMatrix()
+        glPopMatrix()
+
+    def _render_instanced(self):
+        """Draw every instance with a single instanced draw call."""
+        self.program.set_uniform("lighting", int(view.screen.lighting))
+        last = shader.use(self.program)
+
+        self._matrix_vbo.bind()
+        for i in xrange(4):
+            loc = self._matrix_locs[i]
+            glEnableVertexAttribArray(loc)
+            glVertexAttribPointer(loc, 4, GL_FLOAT, GL_FALSE, 64, self._matrix_vbo + 16*i)
+            glVertexAttribDivisorARB(loc, 1)
+        self._color_vbo.bind()
+        glEnableVertexAttribArray(self._color_loc)
+        glVertexAttribPointer(self._color_loc, 4, GL_FLOAT, GL_FALSE, 16, self._color_vbo)
+        glVertexAttribDivisorARB(self._color_loc, 1)
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.geometry.render_instanced(len(self.matrices))
+
+        for loc in self._matrix_locs + [self._color_loc]:
+            glVertexAttribDivisorARB(loc, 0)
+            glDisableVertexAttribArray(loc)
+        shader.use(last)
+
+    def copy(self):
+        """Return a copy of the group, sharing the geometry but with its own copy of the instance data."""
+        new = InstancedGroup(self.geometry, texture=self.texture,
+                             use_instancing=self.instanced)
+        new.add_instances(self.positions, self.rotations, self.scales, self.colors)
+        new.pos = self.pos
+        new.rotation = self.rotation
+        new.scale = self.scale
+        new.visible = self.visible
+        return new
+
+    def __del__(self):
+        """Clean up..."""
+        for i in getattr(self, "_res", []):
+            resource.release(i)
@@ -0,0 +1,142 @@
+"""
+pyggel.loader
+This library (PYGGEL) is licensed under the LGPL by Matthew Roe and PYGGEL contributors.
+
+The loader module loads batches of assets (OBJ meshes and images) at once.
+Files are parsed and decoded in a pool of worker processes, which hand plain numpy/string data
+back to the main process, so the main process only has to create the OpenGL objects.
+"""
+
+from include import *
+import mesh, data, view
+import os, time
+import multiprocessing
+
+MESH_EXTS = (".obj",)
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tga", ".pcx", ".tif", ".tiff", ".lbm", ".pbm", ".pgm", ".ppm", ".xpm")
+
+def _decode_image(filename):
+    """Decode an image file into an (RGBA string, size) tuple."""
+    image = pygame.image.load(filename)
+    return pygame.image.tostring(image, "RGBA"), image.get_size()
+
+def _load_worker(job):
+    """Parse/decode one file, runs in a worker process.
+       job is a (filename, cache, skip) tuple, where skip is a list of image files that are already loaded.
+       Returns (filename, mesh payload or None, dict of image filename:(RGBA string, size), seconds taken)
+       For meshes with a valid compiled cache the payload is None - the main process maps the cache itself,
+       which is faster than sending the arrays back."""
+    filename, cache, skip = job
+    start = time.time()
+    payload = None
+    textures = []
+    if os.path.splitext(filename)[1].lower() in MESH_EXTS:
+        compiled = cache and mesh.load_compiled_payload(filename+mesh.CACHE_EXT)
+        if compiled:
+            textures = [i["texture"] for i in compiled["materials"]]
+        else:
+            payload = mesh.load_payload(filename, cache)
+            textures = [i["texture"] for i in payload["materials"]]
+    else:
+        textures = [filename]
+
+    images = {}
+    for i in textures:
+        if i and not (i in skip or i in images):
+            images[i] = _decode_image(i)
+    return filename, payload, images, time.time() - start
+
+class LoadReport(object):
+    """The timings of a load_many call."""
+    def __init__(self):
+        """Create the report."""
+        self.assets = []
+        self.total = 0
+        self.processes = 0
+
+    def add(self, filename, decode_time, upload_time):
+        """Add the timings of one asset
+           filename is the file loaded
+           decode_time is the seconds spent parsing/decoding it (in a worker process)
+           upload_time is the seconds spent creating its GL objects (in the main process)"""
+        self.assets.append((filename, decode_time, upload_time))
+
+    def get_decode_time(self):
+        """Return the total seconds spent parsing/decoding - across all processes."""
+        return sum(i[1] for i in self.assets)
+
+    def get_upload_time(self):
+        """Return the total seconds spent creating GL objects."""
+        return sum(i[2] for i in self.assets)
+
+    def __str__(self):
+        lines = ["Loaded %s assets in %.3fs using %s processes (%.3fs decoding, %.3fs uploading)"%(
+                    len(self.assets), self.total, self.processes or 1,
+                    self.get_decode_time(), self.get_upload_time())]
+        for filename, decode_time, upload_time in self.assets:
+            lines.append("  %s: decode %.3fs, upload %.3fs"%(filename, decode_time, upload_time))
+        return "\n".join(lines)
+
+def load_many(filenames, processes=None, cache=True):
+    """Load several OBJ meshes and images at once, parsing/decoding them in a pool of processes
+       filenames must be a list of OBJ and image filenames
+       processes is the number of worker processes - None uses one per cpu, 0 loads everything in this process
+       cache is passed on to mesh.OBJ
+       Returns a list of the loaded assets in the same order as filenames
+       (a mesh.BasicMesh for each mesh and a data.Texture for each image), and a LoadReport.
+       Files listed more than once are only loaded once - repeated meshes are copies sharing the same geometry."""
+    view.require_init()
+    start = time.time()
+
+    for i in filenames:
+        ext = os.path.splitext(i)[1].lower()
+        if not (ext in MESH_EXTS or ext in IMAGE_EXTS):
+            raise ValueError("Don't know how to load %s"%i)
+
+    unique = []
+    for i in filenames:
+        if not i in unique:
+            unique.append(i)
+
+    skip = [i for i in data.Texture._all_loaded if type(i) is type("")]
+    jobs = [(i, cache, skip) for i in unique]
+
+    report = LoadReport()
+    if processes == 0 or len(jobs) < 2:
+        results = map(_load_worker, jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_load_worker, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        report.processes = processes or multiprocessing.cpu_count()
+
+    loaded = {}
+    for filename, payload, images, decode_time in results:
+        t = time.time()
+        for i in images:
+            if not i in data.Texture._all_loaded:
+                string, size = images[i]
+                data.Texture(i, image=pygame.image.fromstring(string, size, "RGBA"))
+        if os.path.splitext(filename)[1].lower() in MESH_EXTS:
+            if payload is None:
+                payload = mesh.load_payload(filename, cache)
+            loaded[filename] = mesh.build_mesh(payload)
+        else:
+            loaded[filename] = data.Texture(filename)
+        report.add(filename, decode_time, time.time() - t)
+
+    assets = []
+    used = set()
+    for i in filenames:
+        asset = loaded[i]
+        if i in used:
+            asset = asset.copy() #repeats of a mesh get their own copy, sharing its geometry
+        elif isinstance(asset, mesh.BasicMesh):
+            used.add(i)
+        assets.append(asset)
+
+    report.total = time.time() - start
+    return assets, report
@@ -3,9 +3,12 @@ pyggel.math3d
 This library (PYGGEL) is licensed under the LGPL by Matthew Roe and PYGGEL contributors.
 
 The math3d module contains general 3d math functions, as well as collision detection primitives.
+It also has numpy-backed batch types (Vec3Array, Mat4, Mat4Array, Quat, QuatArray) that transform,
+normalize, interpolate and compose many vectors/matrices/rotations at once.
 """
 
 import math
+from include import numpy
 
 def move_with_rotation(pos, rot, amount):
     """Returns a new position that is calculated based on
@@ -26,33 +29,52 @@ def move_with_rotation(pos, rot, amount):
 
 def get_distance(a, b):
     """Return the distance between two points"""
-    return Vector(a).distance(Vector(b))
+    return math.sqrt(get_fast_distance(a, b))
+
+def get_fast_distance(a, b):
+    """Return the squared distance between two points - compare it against a squared distance to skip the sqrt"""
+    x = a[0] - b[0]
+    y = a[1] - b[1]
+    z = a[2] - b[2]
+    return x*x + y*y + z*z
 
 def safe_div(a, b):
     if a and b:
         return a/b
     return 0
 
+_scalars = (int, long, float, numpy.number)
+
 class Vector(object):
-    """A simple, 3d Vector class"""
+    """A simple, 3d Vector class
+       Arithmetic works with another Vector (per axis) or a number (applied to every axis),
+       and the in-place operators (+=, -=, *=, /=) change the Vector itself instead of making a new one."""
+    __slots__ = ("x", "y", "z")
     ctype = "Vector"
     def __init__(self, pos):
         """Create the Vector
            pos must be a three part tuple of the position of the Vector"""
         self.x, self.y, self.z = pos
 
+    def __getstate__(self):
+        return dict((i, getattr(self, i)) for cls in type(self).__mro__
+                    for i in cls.__dict__.get("__slots__", ()))
+
+    def __setstate__(self, state):
+        for i in state:
+            setattr(self, i, state[i])
+
     def copy(self):
         """Return a copy of the Vector"""
         return Vector((self.x, self.y, self.z))
 
     def distance(self, other):
         """Return the distance between this Vector and other Vector"""
-        n = self - other
-        return math.sqrt(n.x**2 + n.y**2 + n.z**2)
+        return math.sqrt(self.fast_distance(other))
 
     def magnitude(self):
         """Return the magnititude of the Vector"""
-        return math.sqrt(self.x**2 + self.y**2 + self.z**2)
+        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
 
     def perpendicular(self):
         """Return a perpendicular Vector"""
@@ -62,8 +84,10 @@ class Vector(object):
         """Return the distance between this Vector and other Vector.
            This method is the same as distance, except it does not sqrt the result,
            so the comparison must be squared to be accurate, but it is faster."""
-        n = self - other
-        return n.x**2 + n.y**2 + n.z**2
+        x = self.x - other.x
+        y = self.y - other.y
+        z = self.z - other.z
+        return x*x + y*y + z*z
 
     def rotate(self, vec, amount):
         """Return a new Vector that represents this Vector rotated around Vector vec by amount.
@@ -112,23 +136,38 @@ class Vector(object):
         """Return an inverted Vector"""
         return Vector((-self.x, -self.y, -self.z))
 
-    def length(self):
-        """Return the distance of this Vector from (0,0,0)"""
-        return self.distance(Vector((0,0,0)))
+    length = magnitude
 
     def fast_length(self):
-        """Return the fast_distance of this Vector from (0,0,0)"""
-        return self.fast_distance(Vector((0,0,0)))
+        """Return the squared length of this Vector"""
+        return self.x*self.x + self.y*self.y + self.z*self.z
 
     def normalize(self):
-        """Return a normalized Vector"""
-        L = self.length()
-        return self / Vector((L, L, L))
+        """Return a normalized Vector - (0,0,0) stays (0,0,0)"""
+        L = self.magnitude()
+        if not L:
+            return Vector((0, 0, 0))
+        return Vector((self.x/L, self.y/L, self.z/L))
+
+    def normalize_ip(self):
+        """Normalize this Vector in place - (0,0,0) stays (0,0,0)"""
+        L = self.magnitude()
+        if L:
+            self.x /= L
+            self.y /= L
+            self.z /= L
+        return self
+
+    def add_scaled(self, other, amount):
+        """Add other Vector times amount to this Vector in place - ie pos.add_scaled(velocity, time)"""
+        self.x += other.x * amount
+        self.y += other.y * amount
+        self.z += other.z * amount
+        return self
 
     def dot(self, other):
         """Return the dot product between this Vector and other Vector"""
-        x = self * other
-        return x.x + x.y + x.z
+        return self.x*other.x + self.y*other.y + self.z*other.z
 
     def get_pos(self):
         """Return the position of this Vector as a tuple"""
@@ -143,30 +182,50 @@ class Vector(object):
         return math.acos(self.normalize().dot(other.normalize()))
 
     def __sub__(self, other):
-        """Return a Vector representing this Vector subtracting other Vector"""
-        return Vector((self.x-other.x, self.y-other.y, self.z-other.z))
+        """Return a Vector representing this Vector subtracting other Vector or number"""
+        if isinstance(other, Vector):
+            return Vector((self.x-other.x, self.y-other.y, self.z-other.z))
+        if isinstance(other, _scalars):
+            return Vector((self.x-other, self.y-other, self.z-other))
+        return NotImplemented
 
     def __add__(self, other):
-        """Return a Vector representing this Vector adding other Vector"""
-        return Vector((self.x+other.x, self.y+other.y, self.z+other.z))
+        """Return a Vector representing this Vector adding other Vector or number"""
+        if isinstance(other, Vector):
+            return Vector((self.x+other.x, self.y+other.y, self.z+other.z))
+        if isinstance(other, _scalars):
+            return Vector((self.x+other, self.y+other, self.z+other))
+        return NotImplemented
 
     __radd__ = __add__
 
     def __mul__(self, other):
-        """Return a Vector representing this Vector multiplying other Vector"""
-        return Vector((self.x*other.x, self.y*other.y, self.z*other.z))
+        """Return a Vector representing this Vector multiplying other Vector or number"""
+        if isinstance(other, Vector):
+            return Vector((self.x*other.x, self.y*other.y, self.z*other.z))
+        if isinstance(other, _scalars):
+            return Vector((self.x*other, self.y*other, self.z*other))
+        return NotImplemented
     __rmul__ = __mul__
 
     def __div__(self, other):
-        """Return a Vector representing this Vector divided by other Vector"""
-        x = self.x/other.x if (self.x and other.x) else 0
-        y = self.y/other.y if (self.y and other.y) else 0
-        z = self.z/other.z if (self.z and other.z) else 0
-        return Vector((x, y, z))
+        """Return a Vector representing this Vector divided by other Vector or number
+           Dividing by zero gives zero on that axis"""
+        if isinstance(other, Vector):
+            x = self.x/other.x if (self.x and other.x) else 0
+            y = self.y/other.y if (self.y and other.y) else 0
+            z = self.z/other.z if (self.z and other.z) else 0
+            return Vector((x, y, z))
+        if isinstance(other, _scalars):
+            if not other:
+                return Vector((0, 0, 0))
+            return Vector((self.x/other, self.y/other, self.z/other))
+        return NotImplemented
+    __truediv__ = __div__
 
     def __eq__(self, other):
         """Return whether this Vector is at the same position as other Vector"""
-        return self.x == other.x and self.y == other.y and self.z == other.z
+        return isinstance(other, Vector) and self.x == other.x and self.y == other.y and self.z == other.z
 
     def __ne__(self, other):
         """Return whether this Vector is not at the same position as other Vector"""
@@ -174,30 +233,79 @@ class Vector(object):
 
     def __nonzero__(self):
         """Return whether this Vector is not at (0,0,0)"""
-        return self != Vector((0,0,0))
+        return bool(self.x or self.y or self.z)
 
     def __iadd__(self, other):
-        """Adds other Vector to this Vector"""
-        self.set_pos((self + other).get_pos())
+        """Adds other Vector or number to this Vector"""
+        if isinstance(other, Vector):
+            self.x += other.x
+            self.y += other.y
+            self.z += other.z
+        elif isinstance(other, _scalars):
+            self.x += other
+            self.y += other
+            self.z += other
+        else:
+            return NotImplemented
+        return self
 
     def __rsub__(self, other):
-        """Returns a Vector representing other Vector subtracting this Vector"""
-        return Vector(*(other - self).get_pos())
+        """Returns a Vector representing other number subtracting this Vector"""
+        if isinstance(other, _scalars):
+            return Vector((other-self.x, other-self.y, other-self.z))
+        return NotImplemented
 
     def __isub__(self, other):
-        """Subtracts other Vector from this Vector"""
-        self.set_pos((self - other).get_pos())
+        """Subtracts other Vector or number from this Vector"""
+        if isinstance(other, Vector):
+            self.x -= other.x
+            self.y -= other.y
+            self.z -= other.z
+        elif isinstance(other, _scalars):
+            self.x -= other
+            self.y -= other
+            self.z -= other
+        else:
+            return NotImplemented
+        return self
 
     def __imul__(self, other):
-        """Multiplies this Vector by other Vector"""
-        self.set_pos((self * other).get_pos())
+        """Multiplies this Vector by other Vector or number"""
+        if isinstance(other, Vector):
+            self.x *= other.x
+            self.y *= other.y
+            self.z *= other.z
+        elif isinstance(other, _scalars):
+            self.x *= other
+            self.y *= other
+            self.z *= other
+        else:
+            return NotImplemented
+        return self
 
     def __rdiv__(self, other):
-        """Returns a Vector representing other Vector divided by this Vector"""
-        return Vector((other / self).get_pos())
+        """Returns a Vector representing other number divided by this Vector"""
+        if isinstance(other, _scalars):
+            return Vector((other, other, other)) / self
+        return NotImplemented
+    __rtruediv__ = __rdiv__
+
     def __idiv__(self, other):
-        """Divides this Vector by other Vector"""
-        self.set_pos((self / other).get_pos())
+        """Divides this Vector by other Vector or number - dividing by zero gives zero on that axis"""
+        if isinstance(other, Vector):
+            self.x = self.x/other.x if (self.x and other.x) else 0
+            self.y = self.y/other.y if (self.y and other.y) else 0
+            self.z = self.z/other.z if (self.z and other.z) else 0
+        elif not isinstance(other, _scalars):
+            return NotImplemented
+        elif other:
+            self.x /= other
+            self.y /= other
+            self.z /= other
+        else:
+            self.x = self.y = self.z = 0
+        return self
+    __itruediv__ = __idiv__
 
     __neg__ = invert
 
@@ -206,12 +314,14 @@ class Vector(object):
         return Vector((abs(self.x), abs(self.y), abs(self.z)))
 
     def __pow__(self, other):
-        """Return a Vector representing this Vector raised to other Vector"""
-        return Vector((self.x**other.x, self.y**other.y, self.z**other.z))
+        """Return a Vector representing this Vector raised to other Vector or number"""
+        if isinstance(other, Vector):
+            return Vector((self.x**other.x, self.y**other.y, self.z**other.z))
+        return Vector((self.x**other, self.y**other, self.z**other))
 
     def __rpow__(self, other):
-        """Return other Vector raised to this Vector"""
-        return other ** self
+        """Return other number raised to this Vector"""
+        return Vector((other**self.x, other**self.y, other**self.z))
 
     def cross(self, other):
         """Return the cross product between this Vector and other Vector"""
@@ -221,10 +331,9 @@ class Vector(object):
 
     def collide(self, other):
         """Return whether this Vector collides with another object"""
-        if other.ctype == "Vector":
-            return self == other
-        else:
+        if isinstance(other, (Sphere, AABox)):
             return other.collide(self)
+        return self == other
 
     def get_plane_distance(self, plane):
         return plane[0] * self.x + plane[1] * self.y +\
@@ -238,24 +347,25 @@ class Vector(object):
 
 class Sphere(Vector):
     """A simple Sphere object - same as Vector except has a radius"""
+    __slots__ = ("radius", "scale")
     ctype = "Sphere"
     def __init__(self, pos, radius):
         """Create the Sphere
            pos must be a three part tuple of the position of the Sphere
            radius must be a positive number"""
-        Vector.__init__(self, pos)
+        self.x, self.y, self.z = pos
         self.radius = radius
         self.scale = 1
 
     def collide(self, other):
         """Return whether this Sphere is colliding with another object"""
         r = self.radius * self.scale
-        if other.ctype == "Vector":
-            return other.fast_distance(self) <= r ** 2 #this so we avoid the sqrt call ;)
-        elif other.ctype == "Sphere":
-            return other.fast_distance(self) <= (r + other.radius * other.scale) ** 2
-        else:
+        if isinstance(other, Sphere):
+            r += other.radius * other.scale
+            return self.fast_distance(other) <= r * r
+        if isinstance(other, AABox):
             return other.collide(self)
+        return self.fast_distance(other) <= r * r #this so we avoid the sqrt call ;)
 
     def in_frustum(self, frustum):
         for plane in frustum:
@@ -265,13 +375,14 @@ class Sphere(Vector):
 
 class AABox(Vector):
     """A simple, axis-aligned Cube object - same as Vector except has a size(width/height/depth)"""
+    __slots__ = ("width", "height", "depth", "scale")
     ctype = "AABox"
     def __init__(self, pos, size):
         """Create the AABox
            pos must be a three part tuple of the position of the AABox
            size must be either a number representing the size of the AABox - if all sides are equal,
                otherwise, must be a three-part tuple representing the size of each direction of the AABox"""
-        Vector.__init__(self, pos)
+        self.x, self.y, self.z = pos
 
         try:
             self.width, self.height, self.depth = size
@@ -280,68 +391,64 @@ class AABox(Vector):
 
         self.scale = 1,1,1
 
+    def get_half_size(self):
+        """Return the scaled (width, height, depth) / 2 of the box"""
+        return (self.width / 2.0 * self.scale[0],
+                self.height / 2.0 * self.scale[1],
+                self.depth / 2.0 * self.scale[2])
+
+    def fast_distance_to_point(self, other):
+        """Return the squared distance from the surface of the box to other Vector - 0 if it is inside"""
+        w, h, d = self.get_half_size()
+        x = abs(other.x - self.x) - w
+        y = abs(other.y - self.y) - h
+        z = abs(other.z - self.z) - d
+        dist = 0
+        if x > 0:
+            dist += x*x
+        if y > 0:
+            dist += y*y
+        if z > 0:
+            dist += z*z
+        return dist
+
+    def contains(self, x, y, z):
+        """Return whether the point x, y, z is inside the box"""
+        w, h, d = self.get_half_size()
+        return self.x - w <= x <= self.x + w and\
+               self.y - h <= y <= self.y + h and\
+               self.z - d <= z <= self.z + d
+
+    def get_corners(self):
+        """Return the 8 (x,y,z) corners of the box"""
+        w, h, d = self.get_half_size()
+        left, right = self.x - w, self.x + w
+        bottom, top = self.y - h, self.y + h
+        front, back = self.z - d, self.z + d
+        return ((left, bottom, front),
+                (right, bottom, front),
+                (right, top, front),
+                (left, top, front),
+                (left, bottom, back),
+                (right, bottom, back),
+                (right, top, back),
+                (left, top, back))
+
     def collide(self, other):
         """Return whether this AABox is colliding with another object"""
-
-        width = self.width / 2 * self.scale[0]
-        height = self.height / 2 * self.scale[1]
-        depth = self.depth / 2 * self.scale[2]
-
-        left = self.x - width
-        right = self.x + width
-        bottom = self.y - height
-        top = self.y + height
-        front = self.z - depth
-        back = self.z + depth
-
-        if other.ctype == "Vector":
-            return left <= other.x <= right and\
-                   bottom <= other.y <= top and\
-                   front <= other.z <= back
-        elif other.ctype == "Sphere":
-            r = other.radius
-            return left -r <= other.x <= right + r and\
-                   bottom -r <= other.y <= top + r and\
-                   front - r <= other.z <= back + r
-        elif other.ctype == "AABox":
-            points = ((left, bottom, front),
-                      (right, bottom, front),
-                      (right, top, front),
-                      (left, top, front),
-                      (left, bottom, back),
-                      (right, bottom, back),
-                      (right, top, back),
-                      (left, top, back))
-            for i in points:
-                if other.collide(Vector(i)):
-                    return True
-
-            #test them against us now...
-            width = other.width / 2 * other.scale[0]
-            height = other.height / 2 * other.scale[1]
-            depth = other.depth / 2 * other.scale[2]
-
-            left = other.x - width
-            right = other.x + width
-            bottom = other.y - height
-            top = other.y + height
-            front = other.z - depth
-            back = other.z + depth
-            points = ((left, bottom, front),
-                      (right, bottom, front),
-                      (right, top, front),
-                      (left, top, front),
-                      (left, bottom, back),
-                      (right, bottom, back),
-                      (right, top, back),
-                      (left, top, back))
-
-            for i in points:
-                if self.collide(Vector(i)):
-                    return True
-            return False
-        else:
-            return other.collide(self)
+        if isinstance(other, AABox):
+            #overlapping boxes overlap on every axis
+            w, h, d = self.get_half_size()
+            ow, oh, od = other.get_half_size()
+            return abs(self.x - other.x) <= w + ow and\
+                   abs(self.y - other.y) <= h + oh and\
+                   abs(self.z - other.z) <= d + od
+        if isinstance(other, Sphere):
+            r = other.radius * other.scale
+            return self.fast_distance_to_point(other) <= r * r
+        if isinstance(other, Vector):
+            return self.contains(other.x, other.y, other.z)
+        return other.collide(self)
 
 def calcTriNormal(t1, t2, t3, flip=False):
     """Return a normal for lighting based on 3 points.
@@ -356,3 +463,634 @@ def calcTriNormal(t1, t2, t3, flip=False):
         vy = -vy
         vz = -vz
     return (vx, vy, vz)
+
+def collide_spheres(centers_a, radii_a, centers_b, radii_b):
+    """Return a bool array of which spheres a overlap spheres b - element by element, numpy broadcasting applies,
+       so one sphere can be tested against many
+       centers must be (...,3) arrays, radii (...) arrays/numbers"""
+    diff = numpy.asarray(centers_a, "f") - numpy.asarray(centers_b, "f")
+    r = numpy.asarray(radii_a, "f") + numpy.asarray(radii_b, "f")
+    return (diff * diff).sum(-1) <= r * r
+
+def collide_boxes(centers_a, halves_a, centers_b, halves_b):
+    """Return a bool array of which axis-aligned boxes a overlap boxes b - element by element (broadcasting)
+       halves are the (...,3) half width/height/depth of the boxes"""
+    gap = numpy.abs(numpy.asarray(centers_a, "f") - numpy.asarray(centers_b, "f"))
+    return (gap <= numpy.asarray(halves_a, "f") + numpy.asarray(halves_b, "f")).all(-1)
+
+def collide_sphere_box(centers, radii, box_centers, box_halves):
+    """Return a bool array of which spheres overlap which axis-aligned boxes - element by element (broadcasting)"""
+    outside = numpy.abs(numpy.asarray(centers, "f") - numpy.asarray(box_centers, "f")) - numpy.asarray(box_halves, "f")
+    outside = numpy.maximum(outside, 0)
+    r = numpy.asarray(radii, "f")
+    return (outside * outside).sum(-1) <= r * r
+
+def ray_boxes(origin, direction, centers, halves, length=None):
+    """Return an (N,) array of where a ray first hits each of N axis-aligned boxes, or inf where it misses
+       origin and direction are the (x,y,z) start and direction of the ray -
+           the results are in multiples of direction, so a normalized direction gives distances
+       centers/halves are the (N,3) centers and half width/height/depth of the boxes
+       length can be None or the furthest along the ray to look
+       Rays that start inside a box hit it at 0."""
+    origin = numpy.asarray(origin, "f")
+    direction = numpy.asarray(direction, "f")
+    low = numpy.asarray(centers, "f") - halves - origin
+    high = low + 2 * numpy.asarray(halves, "f")
+    flat = direction == 0
+    inv = 1.0 / numpy.where(flat, 1, direction)
+    t1 = low * inv
+    t2 = high * inv
+    #rays parallel to a slab either always or never are within it
+    inside = (low <= 0) & (high >= 0)
+    near = numpy.where(flat, numpy.where(inside, -numpy.inf, numpy.inf), numpy.minimum(t1, t2)).max(-1)
+    far = numpy.where(flat, numpy.where(inside, numpy.inf, -numpy.inf), numpy.maximum(t1, t2)).min(-1)
+    hit = (near <= far) & (far >= 0)
+    if length is not None:
+        hit &= near <= length
+    return numpy.where(hit, numpy.maximum(near, 0), numpy.inf)
+
+def ray_spheres(origin, direction, centers, radii, length=None):
+    """Return an (N,) array of where a ray first hits each of N spheres, or inf where it misses
+       origin/direction/length work like in ray_boxes
+       centers are the (N,3) centers and radii the (N,) radii of the spheres"""
+    origin = numpy.asarray(origin, "f")
+    direction = numpy.asarray(direction, "f")
+    offset = origin - numpy.asarray(centers, "f")
+    radii = numpy.asarray(radii, "f")
+    a = (direction * direction).sum(-1)
+    b = (offset * direction).sum(-1)
+    c = (offset * offset).sum(-1) - radii * radii
+    disc = b * b - a * c
+    root = numpy.sqrt(numpy.maximum(disc, 0))
+    if not a:
+        return numpy.where(c <= 0, 0, numpy.inf)
+    near = numpy.where(c <= 0, 0, (-b - root) / a)
+    hit = (disc >= 0) & ((-b + root) / a >= 0)
+    if length is not None:
+        hit &= near <= length
+    return numpy.where(hit, near, numpy.inf)
+
+def segment_boxes(start, end, centers, halves):
+    """Return an (N,) array of how far (0-1) along the segment start-end it first hits each box, or inf."""
+    start = numpy.asarray(start, "f")
+    return ray_boxes(start, numpy.asarray(end, "f") - start, centers, halves, 1)
+
+def segment_spheres(start, end, centers, radii):
+    """Return an (N,) array of how far (0-1) along the segment start-end it first hits each sphere, or inf."""
+    start = numpy.asarray(start, "f")
+    return ray_spheres(start, numpy.asarray(end, "f") - start, centers, radii, 1)
+
+def sweep_sphere_boxes(start, end, radius, centers, halves):
+    """Return an (N,) array of how far (0-1) a sphere of radius moving from start to end gets
+       before touching each static box, or inf if it never does.
+       The boxes are grown by radius and the sphere's center traced against them,
+       so near a box's edges and corners the hit comes slightly early - never late, so nothing tunnels through."""
+    return segment_boxes(start, end, centers, numpy.asarray(halves, "f") + radius)
+
+def segments_intersect_2d(starts_a, ends_a, starts_b, ends_b):
+    """Return (hit, t) arrays for 2d segments a against segments b - element by element (broadcasting)
+       hit is whether they cross, t is how far (0-1) along a they do
+       Handy for line of sight/movement on a flat (x,z) floor plan. Parallel segments never cross."""
+    pa = numpy.asarray(starts_a, "f")
+    ra = numpy.asarray(ends_a, "f") - pa
+    pb = numpy.asarray(starts_b, "f")
+    rb = numpy.asarray(ends_b, "f") - pb
+    diff = pb - pa
+    denom = ra[...,0] * rb[...,1] - ra[...,1] * rb[...,0]
+    parallel = denom == 0
+    denom = numpy.where(parallel, 1, denom)
+    t = (diff[...,0] * rb[...,1] - diff[...,1] * rb[...,0]) / denom
+    u = (diff[...,0] * ra[...,1] - diff[...,1] * ra[...,0]) / denom
+    hit = ~parallel & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    return hit, t
+
+def _as_array(value, width):
+    """Return value (a Vector, array type, sequence or number) as a float array with rows of width values."""
+    if isinstance(value, (Vec3Array, QuatArray, Mat4, Mat4Array, Quat)):
+        return value.data
+    if isinstance(value, Vector):
+        return numpy.array((value.x, value.y, value.z), "f")
+    return numpy.asarray(value, "f")
+
+def rotation_matrices(rotation):
+    """Return an (N,3,3) array of the rotation matrices for N (x,y,z) rotations in degrees,
+       in pyggel's usual order - rotate x, then y, then z (ie Rx*Ry*Rz)"""
+    rad = numpy.radians(numpy.asarray(rotation, "f").reshape((-1,3)))
+    ca, cb, cc = numpy.cos(rad).T
+    sa, sb, sc = numpy.sin(rad).T
+    mat = numpy.empty((len(rad), 3, 3), "f")
+    #written out so no per-object matrix products are needed
+    mat[:,0,0] = cb*cc
+    mat[:,0,1] = -cb*sc
+    mat[:,0,2] = sb
+    mat[:,1,0] = sa*sb*cc + ca*sc
+    mat[:,1,1] = -sa*sb*sc + ca*cc
+    mat[:,1,2] = -sa*cb
+    mat[:,2,0] = -ca*sb*cc + sa*sc
+    mat[:,2,1] = ca*sb*sc + sa*cc
+    mat[:,2,2] = ca*cb
+    return mat
+
+def compose_trs(pos, rotation, scale):
+    """Return an (N,4,4) array of row-major matrices that scale, then rotate (see rotation_matrices), then translate
+       pos/rotation/scale must be (N,3) arrays (or anything that broadcasts to them) - rotation is in degrees"""
+    rot = rotation_matrices(rotation)
+    n = len(rot)
+    mat = numpy.zeros((n,4,4), "f")
+    mat[:,:3,:3] = rot * numpy.resize(numpy.asarray(scale, "f"), (n,3))[:,numpy.newaxis,:]
+    mat[:,:3,3] = numpy.resize(numpy.asarray(pos, "f"), (n,3))
+    mat[:,3,3] = 1
+    return mat
+
+class Vec3Array(object):
+    """An array of 3d vectors, stored as an (N,3) numpy array in data - every operation runs over all of them at once.
+       Operators take another Vec3Array, a Vector, an (N,3)/(3,) array or a number, and return a new Vec3Array,
+       except the in-place ones (+=, -=, *=, /=), which change data itself.
+       For * and / a 1-D numpy array is always one number per vector (it must have N of them),
+       while a Vector, tuple or list is always one number per axis."""
+    def __init__(self, data=()):
+        """Create the array
+           data can be a list of (x,y,z) tuples, a list of Vectors or an (N,3) array"""
+        if not isinstance(data, numpy.ndarray):
+            data = [_as_array(i, 3) for i in data]
+        self.data = numpy.array(data, "f").reshape((-1,3))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        """Return the Vector at index, or a Vec3Array of the vectors in a slice/index array."""
+        if isinstance(index, (int, long)):
+            return Vector(self.data[index].tolist())
+        return Vec3Array(self.data[index])
+
+    def __setitem__(self, index, value):
+        self.data[index] = _as_array(value, 3)
+
+    def copy(self):
+        """Return a copy of the array."""
+        return Vec3Array(self.data)
+
+    def to_vectors(self):
+        """Return a list of Vectors."""
+        return [Vector(i) for i in self.data.tolist()]
+
+    def __add__(self, other):
+        return Vec3Array(self.data + _as_array(other, 3))
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Vec3Array(self.data - _as_array(other, 3))
+
+    def __rsub__(self, other):
+        return Vec3Array(_as_array(other, 3) - self.data)
+
+    def _scale_array(self, other):
+        """Return other as an array for * and / - a 1-D numpy array (one number per vector) becomes an (N,1) column."""
+        if isinstance(other, numpy.ndarray) and other.ndim == 1:
+            if len(other) != len(self.data):
+                raise ValueError("Need one number per vector - use a tuple to scale each axis")
+            return numpy.asarray(other, "f")[:,numpy.newaxis]
+        return _as_array(other, 3)
+
+    def __mul__(self, other):
+        return Vec3Array(self.data * self._scale_array(other))
+    __rmul__ = __mul__
+
+    def __div__(self, other):
+        return Vec3Array(self.data / self._scale_array(other))
+    __truediv__ = __div__
+
+    def __iadd__(self, other):
+        self.data += _as_array(other, 3)
+        return self
+
+    def __isub__(self, other):
+        self.data -= _as_array(other, 3)
+        return self
+
+    def __imul__(self, other):
+        self.data *= self._scale_array(other)
+        return self
+
+    def __idiv__(self, other):
+        self.data /= self._scale_array(other)
+        return self
+    __itruediv__ = __idiv__
+
+    def __neg__(self):
+        return Vec3Array(-self.data)
+
+    def dot(self, other):
+        """Return an (N,) array of the dot products with other."""
+        return (self.data * _as_array(other, 3)).sum(-1)
+
+    def cross(self, other):
+        """Return a Vec3Array of the cross products with other."""
+        return Vec3Array(numpy.cross(self.data, _as_array(other, 3)))
+
+    def fast_length(self):
+        """Return an (N,) array of the squared lengths of the vectors."""
+        return (self.data**2).sum(1)
+
+    def length(self):
+        """Return an (N,) array of the lengths of the vectors."""
+        return numpy.sqrt(self.fast_length())
+
+    def fast_distance(self, other):
+        """Return an (N,) array of the squared distances to other."""
+        return ((self.data - _as_array(other, 3))**2).sum(-1)
+
+    def distance(self, other):
+        """Return an (N,) array of the distances to other."""
+        return numpy.sqrt(self.fast_distance(other))
+
+    def normalize(self):
+        """Return a Vec3Array of the vectors scaled to a length of 1 - zero length vectors stay zero."""
+        lengths = self.length()
+        return Vec3Array(self.data / numpy.where(lengths, lengths, 1)[:,numpy.newaxis])
+
+    def lerp(self, other, amount):
+        """Return a Vec3Array part way (amount is 0-1, a number or an (N,) array) from these vectors to other."""
+        amount = numpy.asarray(amount, "f")
+        if amount.ndim:
+            amount = amount[:,numpy.newaxis]
+        return Vec3Array(self.data + (_as_array(other, 3) - self.data) * amount)
+
+    def in_frustum(self, frustum):
+        """Return an (N,) bool array of which points are inside all planes of frustum."""
+        planes = numpy.asarray(frustum, "f").reshape((-1,4))
+        return (numpy.dot(self.data, planes[:,:3].T) + planes[:,3] >= 0).all(1)
+
+class Mat4(object):
+    """A 4x4 transformation matrix, stored row-major (so matrix * point) as a (4,4) numpy array in data.
+       Use get_gl for the column-major values glLoadMatrixf/glMultMatrixf take."""
+    def __init__(self, data=None):
+        """Create the matrix
+           data can be None (the identity) or 16 values/a (4,4) array, row-major"""
+        if data is None:
+            self.data = numpy.identity(4, "f")
+        else:
+            self.data = numpy.array(data, "f").reshape((4,4))
+
+    def from_gl(cls, values):
+        """Return a Mat4 from the 16 column-major values OpenGL uses."""
+        return cls(numpy.asarray(values, "f").reshape((4,4)).T)
+    from_gl = classmethod(from_gl)
+
+    def translation(cls, x, y, z):
+        """Return a matrix that moves by x, y, z."""
+        mat = cls()
+        mat.data[:3,3] = x, y, z
+        return mat
+    translation = classmethod(translation)
+
+    def rotation(cls, x, y, z):
+        """Return a matrix that rotates by x, y, z degrees, in pyggel's order (see rotation_matrices)."""
+        mat = cls()
+        mat.data[:3,:3] = rotation_matrices((x, y, z))[0]
+        return mat
+    rotation = classmethod(rotation)
+
+    def scaling(cls, x, y=None, z=None):
+        """Return a matrix that scales by x, y, z - or by x on every axis, if y and z are None."""
+        if y is None:
+            y = z = x
+        return cls(numpy.diag((x, y, z, 1)))
+    scaling = classmethod(scaling)
+
+    def compose(cls, pos=(0,0,0), rotation=(0,0,0), scale=(1,1,1)):
+        """Return a matrix that scales, then rotates, then moves to pos."""
+        return cls(compose_trs(pos, rotation, scale)[0])
+    compose = classmethod(compose)
+
+    def look_at(cls, eye, target, up=(0,1,0)):
+        """Return a view matrix looking from eye at target, like gluLookAt."""
+        eye = _as_array(eye, 3)
+        forward = _as_array(target, 3) - eye
+        forward = forward / numpy.sqrt((forward**2).sum())
+        side = numpy.cross(forward, _as_array(up, 3))
+        side = side / numpy.sqrt((side**2).sum())
+        up = numpy.cross(side, forward)
+        mat = cls()
+        mat.data[0,:3] = side
+        mat.data[1,:3] = up
+        mat.data[2,:3] = -forward
+        mat.data[:3,3] = -numpy.dot(mat.data[:3,:3], eye)
+        return mat
+    look_at = classmethod(look_at)
+
+    def perspective(cls, fovy, aspect, near, far):
+        """Return a projection matrix like gluPerspective - fovy is in degrees."""
+        f = 1.0 / math.tan(math.radians(fovy) / 2)
+        near, far = float(near), float(far)
+        mat = cls(numpy.zeros((4,4)))
+        mat.data[0,0] = f / aspect
+        mat.data[1,1] = f
+        mat.data[2,2] = (far + near) / (near - far)
+        mat.data[2,3] = 2 * far * near / (near - far)
+        mat.data[3,2] = -1
+        return mat
+    perspective = classmethod(perspective)
+
+    def ortho(cls, left, right, bottom, top, near=-1, far=1):
+        """Return a projection matrix like glOrtho."""
+        mat = cls()
+        mat.data[0,0] = 2.0 / (right - left)
+        mat.data[1,1] = 2.0 / (top - bottom)
+        mat.data[2,2] = -2.0 / (far - near)
+        mat.data[:3,3] = (-(right + left) / float(right - left), -(top + bottom) / float(top - bottom),
+                          -(far + near) / float(far - near))
+        return mat
+    ortho = classmethod(ortho)
+
+    def copy(self):
+        """Return a copy of the matrix."""
+        return Mat4(self.data)
+
+    def get_gl(self):
+        """Return the 16 column-major values of the matrix, for glLoadMatrixf/glMultMatrixf."""
+        return self.data.T.ravel()
+
+    def __mul__(self, other):
+        """Return this matrix times other - a Mat4 (or Mat4Array) gives the combined transform,
+           a Vector gives the transformed point"""
+        if isinstance(other, Mat4):
+            return Mat4(numpy.dot(self.data, other.data))
+        if isinstance(other, Mat4Array):
+            return Mat4Array(numpy.einsum("ij,njk->nik", self.data, other.data))
+        if isinstance(other, Vector):
+            return Vector(self.transform_points((other.x, other.y, other.z))[0].tolist())
+        return NotImplemented
+
+    def __imul__(self, other):
+        self.data[:] = numpy.dot(self.data, other.data)
+        return self
+
+    def inverse(self):
+        """Return the inverse of the matrix."""
+        return Mat4(numpy.linalg.inv(self.data))
+
+    def transpose(self):
+        """Return the transpose of the matrix."""
+        return Mat4(self.data.T)
+
+    def transform_points(self, points):
+        """Return an (N,3) array of points (a Vec3Array or (N,3) array) moved by the matrix,
+           including the perspective divide if the matrix is a projection"""
+        points = _as_array(points, 3).reshape((-1,3))
+        out = numpy.dot(points, self.data[:3,:3].T) + self.data[:3,3]
+        w = numpy.dot(points, self.data[3,:3]) + self.data[3,3]
+        if (w != 1).any():
+            out /= w[:,numpy.newaxis]
+        return out
+
+    def transform_vectors(self, vectors):
+        """Return an (N,3) array of directions (a Vec3Array or (N,3) array) rotated/scaled but not moved by the matrix."""
+        return numpy.dot(_as_array(vectors, 3).reshape((-1,3)), self.data[:3,:3].T)
+
+class Mat4Array(object):
+    """An array of 4x4 row-major matrices, stored as an (N,4,4) numpy array in data."""
+    def __init__(self, data=()):
+        """Create the array
+           data can be a list of Mat4s or an (N,4,4)/(N,16) array, row-major"""
+        if len(data) and isinstance(data[0], Mat4):
+            data = [i.data for i in data]
+        self.data = numpy.array(data, "f").reshape((-1,4,4))
+
+    def identity(cls, count):
+        """Return an array of count identity matrices."""
+        return cls(numpy.resize(numpy.identity(4, "f"), (count,4,4)))
+    identity = classmethod(identity)
+
+    def compose(cls, pos, rotation, scale):
+        """Return matrices that scale, then rotate, then move - see compose_trs."""
+        return cls(compose_trs(pos, rotation, scale))
+    compose = classmethod(compose)
+
+    def from_gl(cls, values):
+        """Return a Mat4Array from (N,16) column-major values, like instance.compose_matrices gives."""
+        return cls(numpy.asarray(values, "f").reshape((-1,4,4)).transpose((0,2,1)))
+    from_gl = classmethod(from_gl)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        """Return the Mat4 at index, or a Mat4Array of the matrices in a slice/index array."""
+        if isinstance(index, (int, long)):
+            return Mat4(self.data[index])
+        return Mat4Array(self.data[index])
+
+    def copy(self):
+        """Return a copy of the array."""
+        return Mat4Array(self.data)
+
+    def get_gl(self):
+        """Return an (N,16) array of the column-major values of each matrix."""
+        return self.data.transpose((0,2,1)).reshape((-1,16))
+
+    def __mul__(self, other):
+        """Return each matrix times other - a Mat4 (applied to every matrix) or a Mat4Array of the same length."""
+        if isinstance(other, Mat4):
+            return Mat4Array(numpy.einsum("nij,jk->nik", self.data, other.data))
+        if isinstance(other, Mat4Array):
+            return Mat4Array(numpy.einsum("nij,njk->nik", self.data, other.data))
+        return NotImplemented
+
+    def inverse(self):
+        """Return the inverse of every matrix."""
+        return Mat4Array(numpy.linalg.inv(self.data))
+
+    def transform_points(self, points):
+        """Return an (N,3) array of points moved by their matrices - one point per matrix,
+           or a single point moved by every matrix"""
+        points = _as_array(points, 3)
+        return numpy.einsum("nij,nj->ni", self.data[:,:3,:3], numpy.resize(points, (len(self.data),3))) +\
+               self.data[:,:3,3]
+
+    def get_positions(self):
+        """Return an (N,3) array of the translation of each matrix."""
+        return self.data[:,:3,3].copy()
+
+class Quat(object):
+    """A rotation quaternion, stored as (w,x,y,z) in a numpy array in data."""
+    def __init__(self, data=(1,0,0,0)):
+        """Create the quaternion
+           data must be the (w,x,y,z) values"""
+        self.data = numpy.array(data, "f").reshape(4)
+
+    def from_axis_angle(cls, axis, angle):
+        """Return a quaternion rotating angle degrees around axis."""
+        return cls(QuatArray.from_axis_angle([_as_array(axis, 3)], [angle]).data[0])
+    from_axis_angle = classmethod(from_axis_angle)
+
+    def from_euler(cls, x, y, z):
+        """Return a quaternion for an x, y, z degree rotation in pyggel's order (see rotation_matrices)."""
+        return cls(QuatArray.from_euler([(x, y, z)]).data[0])
+    from_euler = classmethod(from_euler)
+
+    def copy(self):
+        """Return a copy of the quaternion."""
+        return Quat(self.data)
+
+    def __mul__(self, other):
+        """Return the combined rotation (other first) for a Quat, or the rotated point for a Vector."""
+        if isinstance(other, Quat):
+            return Quat(_quat_mul(self.data, other.data))
+        if isinstance(other, Vector):
+            return Vector(_quat_rotate(self.data, numpy.array((other.x, other.y, other.z), "f")).tolist())
+        return NotImplemented
+
+    def __imul__(self, other):
+        self.data[:] = _quat_mul(self.data, other.data)
+        return self
+
+    def conjugate(self):
+        """Return the inverse rotation."""
+        return Quat(self.data * (1,-1,-1,-1))
+
+    def normalize(self):
+        """Return the quaternion scaled to a length of 1."""
+        return Quat(self.data / numpy.sqrt((self.data**2).sum()))
+
+    def dot(self, other):
+        """Return the dot product with other Quat."""
+        return float(numpy.dot(self.data, other.data))
+
+    def rotate(self, points):
+        """Return an (N,3) array of points (a Vec3Array or (N,3) array) rotated by the quaternion."""
+        return _quat_rotate(self.data, _as_array(points, 3))
+
+    def slerp(self, other, amount):
+        """Return the rotation amount (0-1) of the way from this one to other, along the shortest arc."""
+        return Quat(_quat_slerp(self.data[numpy.newaxis], other.data[numpy.newaxis],
+                                numpy.array([amount], "f"))[0])
+
+    def to_matrix(self):
+        """Return the rotation as a Mat4."""
+        mat = Mat4()
+        mat.data[:3,:3] = _quat_matrices(self.data[numpy.newaxis])[0]
+        return mat
+
+class QuatArray(object):
+    """An array of rotation quaternions, stored as an (N,4) numpy array of (w,x,y,z) in data."""
+    def __init__(self, data=()):
+        """Create the array
+           data can be a list of Quats or an (N,4) array"""
+        if len(data) and isinstance(data[0], Quat):
+            data = [i.data for i in data]
+        self.data = numpy.array(data, "f").reshape((-1,4))
+
+    def from_axis_angle(cls, axes, angles):
+        """Return quaternions rotating each angle (degrees) around each (x,y,z) axis."""
+        axes = numpy.asarray(axes, "f").reshape((-1,3))
+        axes = axes / numpy.sqrt((axes**2).sum(1))[:,numpy.newaxis]
+        half = numpy.radians(numpy.asarray(angles, "f")) / 2
+        data = numpy.empty((len(axes),4), "f")
+        data[:,0] = numpy.cos(half)
+        data[:,1:] = axes * numpy.sin(half)[:,numpy.newaxis]
+        return cls(data)
+    from_axis_angle = classmethod(from_axis_angle)
+
+    def from_euler(cls, rotation):
+        """Return quaternions for (N,3) x, y, z degree rotations in pyggel's order (see rotation_matrices)."""
+        rotation = numpy.asarray(rotation, "f").reshape((-1,3))
+        n = len(rotation)
+        qx = cls.from_axis_angle(numpy.resize(numpy.array((1,0,0), "f"), (n,3)), rotation[:,0])
+        qy = cls.from_axis_angle(numpy.resize(numpy.array((0,1,0), "f"), (n,3)), rotation[:,1])
+        qz = cls.from_axis_angle(numpy.resize(numpy.array((0,0,1), "f"), (n,3)), rotation[:,2])
+        return qx * qy * qz
+    from_euler = classmethod(from_euler)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        """Return the Quat at index, or a QuatArray of the quaternions in a slice/index array."""
+        if isinstance(index, (int, long)):
+            return Quat(self.data[index])
+        return QuatArray(self.data[index])
+
+    def copy(self):
+        """Return a copy of the array."""
+        return QuatArray(self.data)
+
+    def __mul__(self, other):
+        """Return the combined rotations (other first) - other can be a Quat or a QuatArray of the same length."""
+        if isinstance(other, (Quat, QuatArray)):
+            return QuatArray(_quat_mul(self.data, other.data))
+        return NotImplemented
+
+    def conjugate(self):
+        """Return the inverse rotations."""
+        return QuatArray(self.data * (1,-1,-1,-1))
+
+    def normalize(self):
+        """Return the quaternions scaled to a length of 1."""
+        return QuatArray(self.data / numpy.sqrt((self.data**2).sum(1))[:,numpy.newaxis])
+
+    def rotate(self, points):
+        """Return an (N,3) array of each point rotated by its quaternion."""
+        return _quat_rotate(self.data, _as_array(points, 3))
+
+    def slerp(self, other, amount):
+        """Return the rotations amount (0-1, a number or an (N,) array) of the way to other, along the shortest arcs."""
+        amount = numpy.resize(numpy.asarray(amount, "f"), len(self.data))
+        return QuatArray(_quat_slerp(self.data, _as_array(other, 4).reshape((-1,4)), amount))
+
+    def to_matrices(self, pos=None, scale=None):
+        """Return a Mat4Array of the rotations - optionally scaled by (N,3) scale, then moved to (N,3) pos."""
+        mats = Mat4Array.identity(len(self.data))
+        mats.data[:,:3,:3] = _quat_matrices(self.data)
+        if scale is not None:
+            mats.data[:,:3,:3] *= numpy.resize(numpy.asarray(scale, "f"), (len(self.data),3))[:,numpy.newaxis,:]
+        if pos is not None:
+            mats.data[:,:3,3] = pos
+        return mats
+
+def _quat_mul(a, b):
+    """Return the Hamilton products of (...,4) quaternion arrays a and b."""
+    aw, ax, ay, az = numpy.rollaxis(numpy.asarray(a), -1)
+    bw, bx, by, bz = numpy.rollaxis(numpy.asarray(b), -1)
+    return numpy.array((aw*bw - ax*bx - ay*by - az*bz,
+                        aw*bx + ax*bw + ay*bz - az*by,
+                        aw*by - ax*bz + ay*bw + az*bx,
+                        aw*bz + ax*by - ay*bx + az*bw), "f").T
+
+def _quat_rotate(q, points):
+    """Return points (...,3) rotated by quaternions q (...,4)."""
+    w = q[...,0:1]
+    u = q[...,1:4]
+    t = 2 * numpy.cross(u, points)
+    return points + w * t + numpy.cross(u, t)
+
+def _quat_matrices(q):
+    """Return the (N,3,3) rotation matrices of (N,4) unit quaternions."""
+    w, x, y, z = q.T
+    mat = numpy.empty((len(q),3,3), "f")
+    mat[:,0,0] = 1 - 2*(y*y + z*z)
+    mat[:,0,1] = 2*(x*y - z*w)
+    mat[:,0,2] = 2*(x*z + y*w)
+    mat[:,1,0] = 2*(x*y + z*w)
+    mat[:,1,1] = 1 - 2*(x*x + z*z)
+    mat[:,1,2] = 2*(y*z - x*w)
+    mat[:,2,0] = 2*(x*z - y*w)
+    mat[:,2,1] = 2*(y*z + x*w)
+    mat[:,2,2] = 1 - 2*(x*x + y*y)
+    return mat
+
+def _quat_slerp(a, b, amount):
+    """Spherically interpolate (N,4) quaternions a towards b by (N,) amount."""
+    dot = (a * b).sum(1)
+    #q and -q are the same rotation, go the short way round
+    b = numpy.where((dot < 0)[:,numpy.newaxis], -b, b)
+    dot = numpy.abs(dot)
+    angle = numpy.arccos(numpy.minimum(dot, 1))
+    sin = numpy.sin(angle)
+    close = sin < 1e-4
+    sin[close] = 1
+    wa = numpy.where(close, 1 - amount, numpy.sin((1 - amount) * angle) / sin)
+    wb = numpy.where(close, amount, numpy.sin(amount * angle) / sin)
+    out = a * wa[:,numpy.newaxis] + b * wb[:,numpy.newaxis]
+    return out / numpy.sqrt((out**2).sum(1))[:,numpy.newaxis]
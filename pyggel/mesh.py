@@ -6,166 +6,860 @@ The mesh module contains mesh classes for different kinds of meshes, as well as
 """
 
 from include import *
-import os
-import image, view, data, misc, math3d
+import os, struct, ast
+import image, view, data, misc, math3d, instance, shader, resource
 from scene import BaseSceneObject
 import time
 import random
 import math
+import heapq
 
-def OBJ(filename, pos=(0,0,0), rotation=(0,0,0), colorize=(1,1,1,1)):
+def _load_mtl(filename):
+    """Load a WaveFront MTL material library without touching OpenGL,
+       returns a dict of name:{"name", "color", "texture" filename or None}."""
+    path = os.path.split(filename)[0]
+    mtls = {}
+    cur_mtl = None
+    for line in open(filename, "r"):
+        if line.startswith('#'): continue
+        values = line.split()
+        if not values: continue
+        if values[0] == 'newmtl':
+            cur_mtl = {"name":values[1], "color":(1,1,1,1), "texture":None}
+            mtls[cur_mtl["name"]] = cur_mtl
+        elif cur_mtl is None:
+            raise ValueError, "mtl file doesn't start with newmtl stmt"
+        elif values[0] == 'map_Kd':
+            cur_mtl["texture"] = os.path.join(path, values[1])
+        elif values[0]=="Kd":
+            color = tuple(map(float, values[1:]))
+            if len(color) == 3:
+                color += (1,)
+            cur_mtl["color"] = color
+    return mtls
+
+def _parse_floats(lines, width):
+    """Convert a list of "x y z ..." strings into a (len(lines), width) float array in one go.
+       Extra values on a line (like the w of a vertex) are dropped."""
+    if not lines:
+        return numpy.zeros((0, width), "f")
+    flat = numpy.fromstring(" ".join(lines), "f", sep=" ")
+    n = len(flat) // len(lines)
+    if n >= width and n * len(lines) == len(flat) and len(lines[0].split()) == n:
+        return flat.reshape((-1, n))[:,:width].copy()
+    #lines have different lengths, slow path
+    return numpy.array([i.split()[:width] for i in lines], "f")
+
+def _parse_corners(tokens):
+    """Convert a list of "v", "v/t", "v//n" or "v/t/n" face corner strings into a (len(tokens), 3) int array,
+       with 0 where an index is missing."""
+    corners = numpy.zeros((len(tokens), 3), "i")
+    if not tokens:
+        return corners
+    text = " ".join(tokens)
+    slashes = tokens[0].count("/")
+    double = "//" in tokens[0]
+    if text.count("/") == slashes * len(tokens) and text.count("//") == (len(tokens) if double else 0):
+        #every corner has the same layout, so parse them all at once
+        if double:
+            text = text.replace("//", "/0/")
+        flat = numpy.fromstring(text.replace("/", " "), "i", sep=" ")
+        corners[:,:slashes+1] = flat.reshape((-1, slashes+1))
+        return corners
+    for i in xrange(len(tokens)):
+        w = tokens[i].split("/")
+        for j in xrange(min(len(w), 3)):
+            if w[j]:
+                corners[i,j] = int(w[j])
+    return corners
+
+def _resolve_corners(tokens, counts, defined):
+    """Convert the face corner strings of faces into an (N,3) array of 0 based vertex/normal/texcoord indices,
+       -1 where missing - the layout ObjGroup uses
+       counts must be an array of the number of corners of each face
+       defined must be a list of how many (v, vt, vn) had been defined at each face, for negative (relative) indices"""
+    corners = _parse_corners(tokens)
+    defined = numpy.repeat(numpy.array(defined, "i").reshape((-1,3)), counts, 0)
+    corners = numpy.where(corners > 0, corners - 1, numpy.where(corners < 0, defined + corners, -1))
+    #corners are stored as v/t/n, switch to v/n/t
+    return corners[:,(0,2,1)]
+
+class _ArrayBuilder(object):
+    """Collects "x y z ..." lines into a growing float array, parsing them a block at a time."""
+    def __init__(self, width, block=4096):
+        """width is the number of floats kept from each line
+           block is how many lines are collected before they are parsed"""
+        self.width = width
+        self.block = block
+        self.array = numpy.zeros((block, width), "f")
+        self.size = 0
+        self.pending = []
+
+    def __len__(self):
+        return self.size + len(self.pending)
+
+    def add(self, line):
+        """Add a line of values."""
+        self.pending.append(line)
+        if len(self.pending) >= self.block:
+            self.flush()
+
+    def flush(self):
+        """Parse any pending lines into the array."""
+        if not self.pending:
+            return
+        new = _parse_floats(self.pending, self.width)
+        self.pending = []
+        if self.size + len(new) > len(self.array):
+            grown = numpy.zeros((max(len(self.array)*2, self.size+len(new)), self.width), "f")
+            grown[:self.size] = self.array[:self.size]
+            self.array = grown
+        self.array[self.size:self.size+len(new)] = new
+        self.size += len(new)
+
+    def get(self):
+        """Return the array of all lines added so far."""
+        self.flush()
+        return self.array[:self.size]
+
+def _compile_chunk(group, tokens, counts, defined, vertices, normals, texcoords):
+    """Compile one chunk of faces of an ObjGroup into a payload group - see iter_obj."""
+    chunk = ObjGroup(group.name)
+    chunk.counts = numpy.array(counts, "i")
+    chunk.corners = _resolve_corners(tokens, chunk.counts, defined)
+    chunk = chunk.compile(vertices.get(), normals.get(), texcoords.get())
+    chunk["material"] = group.material
+    return chunk
+
+def iter_obj(filename, chunk_faces=16384):
+    """Parse an OBJ file a piece at a time - a generator yielding payload groups (see load_payload)
+       of at most chunk_faces faces each, as soon as they are parsed, without touching OpenGL.
+       Only the vertices/normals/texcoords are kept for the whole file (as float arrays, since faces may use any of them),
+       everything else is dropped once its chunk is yielded, so memory use doesn't grow with the face count.
+       A group with more than chunk_faces faces is yielded as several chunks with the same name,
+       and the "material" of each chunk is the material dict (or None) instead of an index."""
+    mtls = {}
+    attribs = {"v":_ArrayBuilder(3), "vn":_ArrayBuilder(3), "vt":_ArrayBuilder(2)}
+    vertices, normals, texcoords = attribs["v"], attribs["vn"], attribs["vt"]
+    group = ObjGroup("default")
+
+    tokens = []
+    counts = []
+    defined = []
+
+    for line in open(filename, "r"):
+        values = line.split(None, 1)
+        if not values: continue
+        key = values[0]
+        if key in attribs:
+            attribs[key].add(values[1])
+        elif key == 'f':
+            corners = values[1].split()
+            tokens.extend(corners)
+            counts.append(len(corners))
+            defined.append((len(vertices), len(texcoords), len(normals)))
+            if len(counts) < chunk_faces:
+                continue
+        elif not key in ("o", "g", "usemtl", "usemat", "mtllib"):
+            continue
+
+        #faces are done for this chunk (it is full, or the group/material changes), compile them
+        if counts:
+            yield _compile_chunk(group, tokens, counts, defined, vertices, normals, texcoords)
+            tokens = []
+            counts = []
+            defined = []
+
+        if key in ("o","g"):
+            group = ObjGroup(values[1].strip() if len(values) > 1 else "default")
+        elif key in ('usemtl', 'usemat'):
+            group.material = mtls[values[1].strip()]
+        elif key == 'mtllib':
+            mtls.update(_load_mtl(os.path.join(os.path.split(filename)[0], values[1].strip())))
+
+    if counts:
+        yield _compile_chunk(group, tokens, counts, defined, vertices, normals, texcoords)
+
+def OBJ(filename, pos=(0,0,0), rotation=(0,0,0), colorize=(1,1,1,1), cache=True):
     """Load a WaveFront OBJ mesh.
        filename must be the filename of the mesh to load
-       pos/rotation/colorize are the starting attributes of the mesh object."""
+       pos/rotation/colorize are the starting attributes of the mesh object.
+       cache controls whether the compiled mesh is saved next to the file (as filename+CACHE_EXT),
+           and loaded from there instead of parsing the file again while the file (and its mtl files) are unchanged"""
     view.require_init()
 
+    return build_mesh(load_payload(filename, cache), pos, rotation, colorize)
+
+def load_payload(filename, cache=True):
+    """Load an OBJ mesh (or its compiled cache) into plain python/numpy data, without touching OpenGL,
+       so it can be done in another process - see build_mesh and loader.load_many.
+       Returns a dict of "sources" (files it was loaded from), "materials" (a list of name/color/texture dicts)
+       and "groups" (a list of dicts of name, material index or None, dimensions, pos, render_type,
+       the "inter" (N,8) interleaved vertex and "indices" arrays of the group's geometry,
+       and "lods", a list of the index arrays of its simpler levels of detail, if it has any)
+       cache is the same as for OBJ"""
+    if cache:
+        payload = load_compiled_payload(filename+CACHE_EXT)
+        if payload:
+            return payload
+
+    payload = _parse_obj(filename)
+    if cache:
+        try:
+            _write_compiled(filename+CACHE_EXT, payload)
+        except (IOError, OSError):
+            pass #can't write next to the mesh, just don't cache it
+    return payload
+
+def build_mesh(payload, pos=(0,0,0), rotation=(0,0,0), colorize=(1,1,1,1)):
+    """Create a BasicMesh from the data returned by load_payload - creates the materials, textures and geometry.
+       pos/rotation/colorize are the starting attributes of the mesh object."""
+    materials = [_build_material(i) for i in payload["materials"]]
+
+    objs = []
+    for i in payload["groups"]:
+        if i["material"] is None:
+            objs.append(_build_group(i, None))
+        else:
+            objs.append(_build_group(i, materials[i["material"]]))
+
+    return BasicMesh(objs, pos, rotation, 1, colorize)
+
+def _build_material(mat):
+    """Create a data.Material from a payload material dict."""
+    material = data.Material(mat["name"])
+    material.color = mat["color"]
+    if mat["texture"]:
+        material.texture = data.Texture(mat["texture"])
+    return material
+
+def _build_group(group, material):
+    """Create a CompiledGroup from a payload group and its data.Material, or None for a blank one."""
+    if material is None:
+        material = data.Material("null")
+    geometry = data.interleaved_geometry(group["inter"], group["indices"], render_type=group["render_type"])
+    obj = CompiledGroup(group["name"], material, geometry, group["dimensions"], group["pos"])
+    obj.lods = [geometry.with_indices(i) for i in group.get("lods", ())]
+    return obj
+
+def _parse_obj(filename):
+    """Parse an OBJ file into the payload described in load_payload."""
     objs = []
     mtls = {}
+    sources = [filename]
 
     vertices = []
     normals = []
     texcoords = []
 
+    #face data, tokenized here and converted to arrays in bulk afterwards
+    tokens = []
+    counts = []
+    defined = [] #how many v/vt/vn had been defined at each face, for negative (relative) indices
+
     for line in open(filename, "r"):
-        if line.startswith('#'): continue
-        values = line.split()
+        values = line.split(None, 1)
         if not values: continue
-        if values[0] in ("o","g"):
-            objs.append(ObjGroup(values[1]))
-        elif values[0] == 'v':
-            vertices.append(map(float, values[1:4]))
-        elif values[0] == 'vn':
-            normals.append(map(float, values[1:4]))
-        elif values[0] == 'vt':
-            texcoords.append(map(float, values[1:3]))
-        elif values[0] in ('usemtl', 'usemat'):
-            objs[-1].material = mtls[values[1]]
-        elif values[0] == 'mtllib':
-            path = os.path.split(filename)[0]
-            cur_mtl = None
-            for line in open(os.path.join(path, values[1]), "r"):
-                if line.startswith('#'): continue
-                values = line.split()
-                if not values: continue
-                if values[0] == 'newmtl':
-                    cur_mtl = data.Material(values[1])
-                    mtls[cur_mtl.name] = cur_mtl
-                elif cur_mtl is None:
-                    raise ValueError, "mtl file doesn't start with newmtl stmt"
-                elif values[0] == 'map_Kd':
-                    cur_mtl.texture = data.Texture(os.path.join(path, values[1]))
-                elif values[0]=="Kd":
-                    cur_mtl.set_color(map(float, values[1:]))
-        elif values[0] == 'f':
-            face = []
-            texcs = []
-            norms = []
-            for v in values[1:]:
-                w = v.split('/')
-                face.append(int(w[0]))
-                if len(w) >= 2 and len(w[1]) > 0:
-                    texcs.append(int(w[1]))
-                else:
-                    texcs.append(0)
-                if len(w) >= 3 and len(w[2]) > 0:
-                    norms.append(int(w[2]))
-                else:
-                    norms.append(0)
-            objs[-1].faces.append((face, norms, texcs))
-
-    fin = []
-    for i in objs:
-        fin.append(i.compile(vertices, normals, texcoords))
+        key = values[0]
+        if key == 'v':
+            vertices.append(values[1])
+        elif key == 'vn':
+            normals.append(values[1])
+        elif key == 'vt':
+            texcoords.append(values[1])
+        elif key == 'f':
+            corners = values[1].split()
+            if not objs:
+                objs.append(ObjGroup("default"))
+                objs[-1].first_face = 0
+            tokens.extend(corners)
+            counts.append(len(corners))
+            defined.append((len(vertices), len(texcoords), len(normals)))
+        elif key in ("o","g"):
+            objs.append(ObjGroup(values[1].strip() if len(values) > 1 else "default"))
+            objs[-1].first_face = len(counts)
+        elif key in ('usemtl', 'usemat'):
+            if not objs:
+                objs.append(ObjGroup("default"))
+                objs[-1].first_face = len(counts)
+            objs[-1].material = mtls[values[1].strip()]
+        elif key == 'mtllib':
+            sources.append(os.path.join(os.path.split(filename)[0], values[1].strip()))
+            mtls.update(_load_mtl(sources[-1]))
+
+    vertices = _parse_floats(vertices, 3)
+    normals = _parse_floats(normals, 3)
+    texcoords = _parse_floats(texcoords, 2)
+
+    counts = numpy.array(counts, "i")
+    corners = _resolve_corners(tokens, counts, defined)
+    starts = numpy.concatenate(([0], numpy.cumsum(counts)))
+
+    materials = []
+    groups = []
+    for i in xrange(len(objs)):
+        first = objs[i].first_face
+        last = objs[i+1].first_face if i+1 < len(objs) else len(counts)
+        objs[i].counts = counts[first:last]
+        objs[i].corners = corners[starts[first]:starts[last]]
+        group = objs[i].compile(vertices, normals, texcoords)
+        if objs[i].material is not None:
+            if not objs[i].material in materials:
+                materials.append(objs[i].material)
+            group["material"] = materials.index(objs[i].material)
+        groups.append(group)
+
+    return {"sources":sources, "materials":materials, "groups":groups}
+
+CACHE_EXT = ".pgmesh"
+_CACHE_MAGIC = "PGMESH\x00\x01"
+_CACHE_VERSION = 1
+
+def _align(offset):
+    """Round offset up to the next 16 bytes."""
+    return (offset + 15) & ~15
+
+def _get_sources(path, sources):
+    """Return a list of (filename relative to path, mtime, size) for the source files of a compiled mesh."""
+    return [(os.path.relpath(i, path), os.path.getmtime(i), os.path.getsize(i)) for i in sources]
+
+def save_compiled(filename, mesh, sources=()):
+    """Write a BasicMesh (made of CompiledGroups holding data.Geometry) to filename in the compiled mesh format.
+       sources is a list of the files the mesh was loaded from - the compiled mesh is only used while they are unchanged"""
+    materials = []
+    groups = []
+    for obj in mesh.objs:
+        if not obj.material in materials:
+            materials.append(obj.material)
+        geom = obj.full_geometry
+        if geom.indices is None:
+            indices = numpy.arange(len(geom.verts))
+        else:
+            indices = geom.indices
+        groups.append({"name":obj.name, "material":materials.index(obj.material),
+                       "dimensions":tuple(obj.dimensions), "pos":tuple(obj.base_pos),
+                       "render_type":int(geom.render_type),
+                       "inter":geom.get_interleaved(), "indices":indices,
+                       "lods":[i.indices for i in obj.lods]})
+
+    mats = []
+    for mat in materials:
+        tex = getattr(mat.texture, "filename", None)
+        if not (type(tex) is type("") and os.path.isfile(tex)):
+            tex = None
+        mats.append({"name":mat.name, "color":tuple(mat.color), "texture":tex})
+
+    _write_compiled(filename, {"sources":list(sources), "materials":mats, "groups":groups})
+
+def _write_compiled(filename, payload):
+    """Write a payload (see load_payload) to filename in the compiled mesh format.
+       The format is a small header (a python literal of the groups, materials and array offsets)
+       followed by each group's interleaved vertex and index arrays, so it can be memory mapped straight back."""
+    path = os.path.split(filename)[0]
+    groups = []
+    arrays = []
+    offset = 0
+    for i in payload["groups"]:
+        inter = numpy.ascontiguousarray(i["inter"], "<f4")
+        indices = numpy.ascontiguousarray(i["indices"], "<u4")
+        group = dict((key, i[key]) for key in ("name", "material", "dimensions", "pos", "render_type"))
+        group["vertices"] = (offset, len(inter))
+        arrays.append(inter)
+        offset = _align(offset + inter.nbytes)
+        group["indices"] = (offset, len(indices))
+        arrays.append(indices)
+        offset = _align(offset + indices.nbytes)
+        group["lods"] = []
+        for lod in i.get("lods", ()):
+            lod = numpy.ascontiguousarray(lod, "<u4")
+            group["lods"].append((offset, len(lod)))
+            arrays.append(lod)
+            offset = _align(offset + lod.nbytes)
+        groups.append(group)
+
+    mats = []
+    for i in payload["materials"]:
+        mat = dict(i)
+        if mat["texture"]:
+            mat["texture"] = os.path.relpath(mat["texture"], path)
+        mats.append(mat)
+
+    header = repr({"version":_CACHE_VERSION, "sources":_get_sources(path, payload["sources"]),
+                   "materials":mats, "groups":groups})
+    start = _align(len(_CACHE_MAGIC) + 4 + len(header))
+
+    #written to a temporary file and renamed into place, so a crash never leaves a half written cache
+    temp = "%s.%d.tmp"%(filename, os.getpid())
+    f = open(temp, "wb")
+    f.write(_CACHE_MAGIC + struct.pack("<I", len(header)) + header)
+    for i in arrays:
+        f.write("\x00" * (start - f.tell()))
+        f.write(i.tostring())
+        start = _align(f.tell())
+    f.close()
+    if os.name == "nt" and os.path.isfile(filename):
+        os.remove(filename) #rename won't replace a file on windows
+    os.rename(temp, filename)
+
+def load_compiled_payload(filename):
+    """Read a file written by save_compiled into a payload (see load_payload) without touching OpenGL.
+       The vertex and index arrays are memory mapped views of the file.
+       Returns None if the file is missing, cut short, from another version, or its source files have changed since it was written."""
+    path = os.path.split(filename)[0]
+    try:
+        f = open(filename, "rb")
+        magic = f.read(len(_CACHE_MAGIC))
+        size = struct.unpack("<I", f.read(4))[0]
+        header = ast.literal_eval(f.read(size))
+        f.close()
+    except (IOError, OSError, ValueError, SyntaxError, struct.error):
+        return None
+    if magic != _CACHE_MAGIC or header.get("version") != _CACHE_VERSION:
+        return None
+    try:
+        sources = [os.path.join(path, i[0]) for i in header["sources"]]
+        if _get_sources(path, sources) != header["sources"]:
+            return None
+    except OSError:
+        return None #a source was removed
 
-    return BasicMesh(fin, pos, rotation, 1, colorize)
+    start = _align(len(_CACHE_MAGIC) + 4 + size)
+    try:
+        blob = numpy.memmap(filename, "u1", "r")[start:]
+    except (IOError, OSError, ValueError):
+        return None
+    for i in header["groups"]:
+        spans = [i["vertices"] + (32,), i["indices"] + (4,)] + [lod + (4,) for lod in i.get("lods", ())]
+        if max([offset + count*size for offset, count, size in spans]) > len(blob):
+            return None #the file was cut short
+
+    for i in header["materials"]:
+        if i["texture"]:
+            i["texture"] = os.path.join(path, i["texture"])
+
+    for i in header["groups"]:
+        offset, count = i.pop("vertices")
+        i["inter"] = blob[offset:offset+count*32].view("<f4").reshape((count, 8))
+        offset, count = i["indices"]
+        i["indices"] = blob[offset:offset+count*4].view("<u4")
+        i["lods"] = [blob[offset:offset+count*4].view("<u4") for offset, count in i.get("lods", ())]
+
+    header["sources"] = sources
+    return header
+
+def load_compiled(filename, pos=(0,0,0), rotation=(0,0,0), colorize=(1,1,1,1)):
+    """Load a mesh written by save_compiled, returns a BasicMesh, or None if the file is missing,
+       from another version, or its source files have changed since it was written.
+       The vertex and index arrays are memory mapped, and uploaded straight from the file.
+       pos/rotation/colorize are the starting attributes of the mesh object."""
+    payload = load_compiled_payload(filename)
+    if payload:
+        return build_mesh(payload, pos, rotation, colorize)
+    return None
  
+def simplify(verts, indices, ratio=0.5, max_error=None, texcs=None, norms=None):
+    """Simplify a triangle mesh by quadric error edge collapses, returns the GL_TRIANGLES indices of the simplified mesh.
+       Each collapse moves one vertex onto a neighbour, so the result reuses the original vertices - a level of detail
+       only needs a new index array
+       verts must be an (N,3) array of the vertex positions
+       indices must be a list/array of the triangle indices
+       ratio is how much of the triangles to keep
+       max_error can be None or the largest error (a squared distance) a collapse may add
+       texcs can be None or the matching (N,2) texture coords - used to find UV seams
+       norms can be None or the matching (N,3) normals - used to pick which of the vertices at a hard edge
+           a collapsed vertex is replaced with, without them collapses across hard edges are skipped
+       Vertices on an open edge, and vertices sharing their position with others that have other texture coords
+       (UV seams), are never removed - so seams, holes and the borders between material groups keep their shape."""
+    verts = numpy.asarray(verts, "d")
+    tris = numpy.asarray(indices, "i").reshape((-1,3))
+    target = int(len(tris) * ratio)
+    if not len(tris) or target >= len(tris):
+        return numpy.array(tris, "I").ravel()
+
+    points, pid = numpy.unique(verts, axis=0, return_inverse=True)
+    pid = pid.ravel()
+    n = len(points)
+    ptris = pid[tris]
+    keep = (ptris[:,0] != ptris[:,1]) & (ptris[:,1] != ptris[:,2]) & (ptris[:,2] != ptris[:,0])
+    tris = tris[keep]
+    ptris = ptris[keep]
+
+    #UV seams, and the ends of every edge that doesn't have exactly two triangles, are locked
+    if norms is not None:
+        norms = numpy.asarray(norms, "d")
+    if texcs is None:
+        locked = numpy.zeros(n, bool)
+    else:
+        first = numpy.unique(numpy.column_stack((verts, texcs)), axis=0, return_index=True)[1]
+        locked = numpy.bincount(pid[first], minlength=n) > 1
+    edges = numpy.sort(numpy.concatenate((ptris[:,[0,1]], ptris[:,[1,2]], ptris[:,[2,0]])), 1)
+    edges, edge_counts = numpy.unique(edges[:,0].astype("int64") * n + edges[:,1], return_counts=True)
+    open_edges = edges[edge_counts != 2]
+    locked[open_edges // n] = True
+    locked[open_edges % n] = True
+    edges = numpy.column_stack((edges // n, edges % n)).astype("i")
+
+    #the quadric of each point is the sum of its triangles' planes, weighted by area
+    p0, p1, p2 = points[ptris[:,0]], points[ptris[:,1]], points[ptris[:,2]]
+    normals = numpy.cross(p1 - p0, p2 - p0)
+    areas = numpy.sqrt((normals**2).sum(1))
+    planes = numpy.empty((len(ptris), 4))
+    planes[:,:3] = normals / numpy.maximum(areas, 1e-20)[:,numpy.newaxis]
+    planes[:,3] = -(planes[:,:3] * p0).sum(1)
+    quads = planes[:,:,numpy.newaxis] * planes[:,numpy.newaxis,:] * (areas / 2)[:,numpy.newaxis,numpy.newaxis]
+    quadrics = numpy.zeros((n,4,4))
+    for i in xrange(3):
+        numpy.add.at(quadrics, ptris[:,i], quads)
+    homog = numpy.ones((n,4))
+    homog[:,:3] = points
+
+    #every edge can collapse either way, unless the point that would be removed is locked
+    heap = []
+    for a, b in ((0, 1), (1, 0)):
+        u, v = edges[:,a], edges[:,b]
+        free = ~locked[u]
+        u, v = u[free], v[free]
+        costs = numpy.einsum("ni,nij,nj->n", homog[v], quadrics[u] + quadrics[v], homog[v])
+        heap.extend(zip(costs.tolist(), u.tolist(), v.tolist(), [0]*len(u), [0]*len(u)))
+    heapq.heapify(heap)
+
+    tri_list = tris.tolist()
+    alive = [True] * len(tri_list)
+    around = [set() for i in xrange(n)]
+    for t, (a, b, c) in enumerate(ptris.tolist()):
+        around[a].add(t)
+        around[b].add(t)
+        around[c].add(t)
+    pid = pid.tolist()
+    version = [0] * n
+    removed = [False] * n
+    count = len(tri_list)
+
+    def neighbours(p):
+        return set(pid[i] for t in around[p] for i in tri_list[t]) - set((p,))
+
+    while count > target and heap:
+        cost, u, v, vu, vv = heapq.heappop(heap)
+        if max_error is not None and cost > max_error:
+            break
+        if removed[u] or removed[v] or version[u] != vu or version[v] != vv:
+            continue
+        shared = around[u] & around[v]
+        if not shared:
+            continue
+        #the vertices u's corners can become - v's corners in the triangles being removed
+        targets = list(set(i for t in shared for i in tri_list[t] if pid[i] == v))
+        if len(targets) > 1 and norms is None:
+            continue
+        #only the far corners of the shared triangles may be neighbours of both, or the surface would fold
+        opposite = set(pid[i] for t in shared for i in tri_list[t]) - set((u, v))
+        if neighbours(u) & neighbours(v) != opposite:
+            continue
+        moved = around[u] - shared
+        flipped = False
+        for t in moved:
+            corners = [points[pid[i]] for i in tri_list[t]]
+            old = numpy.cross(corners[1] - corners[0], corners[2] - corners[0])
+            corners = [points[v] if pid[i] == u else points[pid[i]] for i in tri_list[t]]
+            new = numpy.cross(corners[1] - corners[0], corners[2] - corners[0])
+            #reject collapses that flip a triangle, or turn it more than about 75 degrees
+            if numpy.dot(old, new) <= 0.25 * math.sqrt(numpy.dot(old, old) * numpy.dot(new, new)):
+                flipped = True
+                break
+        if flipped:
+            continue
+
+        for t in shared:
+            alive[t] = False
+            for i in tri_list[t]:
+                around[pid[i]].discard(t)
+            count -= 1
+        for t in moved:
+            tri = tri_list[t]
+            for c in xrange(3):
+                if pid[tri[c]] == u:
+                    if len(targets) == 1:
+                        tri[c] = targets[0]
+                    else:
+                        #at a hard edge, keep the normal closest to the one the corner had
+                        tri[c] = max(targets, key=lambda i: numpy.dot(norms[i], norms[tri[c]]))
+            around[v].add(t)
+        around[u] = set()
+        removed[u] = True
+        quadrics[v] += quadrics[u]
+        version[u] += 1
+        version[v] += 1
+
+        for w in neighbours(v):
+            for a, b in ((v, w), (w, v)):
+                if not locked[a]:
+                    h = homog[b]
+                    cost = float(h.dot(quadrics[a] + quadrics[b]).dot(h))
+                    heapq.heappush(heap, (cost, a, b, version[a], version[b]))
+
+    return numpy.array([tri_list[t] for t in xrange(len(tri_list)) if alive[t]], "I").ravel()
+
+def add_lods(payload, ratios=(0.5, 0.25, 0.125), max_error=None):
+    """Simplify every GL_TRIANGLES group of a payload (see load_payload), adding a "lods" list of index arrays to each
+       ratios is how much of the triangles each level of detail keeps
+       max_error is passed on to simplify"""
+    for group in payload["groups"]:
+        group["lods"] = []
+        if group["render_type"] != GL_TRIANGLES:
+            continue
+        inter = group["inter"]
+        for ratio in ratios:
+            group["lods"].append(simplify(inter[:,0:3], group["indices"], ratio, max_error,
+                                          inter[:,6:8], inter[:,3:6]))
+    return payload
+
+def generate_lods(filename, ratios=(0.5, 0.25, 0.125), max_error=None):
+    """Build a level of detail chain for every group of an OBJ mesh, offline, and save it with the mesh's compiled cache
+       (filename+CACHE_EXT) - OBJ loads the levels into each CompiledGroup's lods while the cache is valid
+       ratios/max_error are passed on to add_lods"""
+    payload = add_lods(_parse_obj(filename), ratios, max_error)
+    _write_compiled(filename+CACHE_EXT, payload)
+    return payload
+
+def get_acmr(indices, cache_size=32):
+    """Return the average cache miss ratio of GL_TRIANGLES indices - how many times a vertex has to be transformed
+       per triangle, with a FIFO post-transform cache of cache_size vertices (0.5 is ideal, 3 is no reuse at all)"""
+    indices = numpy.asarray(indices, "i").ravel().tolist()
+    if not indices:
+        return 0.0
+    cache = set()
+    fifo = []
+    misses = 0
+    for i in indices:
+        if not i in cache:
+            misses += 1
+            cache.add(i)
+            fifo.append(i)
+            if len(fifo) > cache_size:
+                cache.discard(fifo.pop(0))
+    return misses * 3.0 / len(indices)
+
+def weld(arrays, indices=None):
+    """Merge identical vertices
+       arrays must be a list of the (N,X) vertex attribute arrays (vertices, normals, texture coords, etc.)
+       indices can be None (the vertices are drawn in order) or the indices drawing them
+       Returns (list of the welded arrays, new indices, remap) - remap is the new index of each old vertex"""
+    count = len(arrays[0])
+    if indices is None:
+        indices = numpy.arange(count)
+    key = numpy.ascontiguousarray(numpy.column_stack([numpy.asarray(i, "f").reshape((count, -1)) for i in arrays]))
+    key = key.view(numpy.dtype((numpy.void, key.dtype.itemsize * key.shape[1]))).ravel()
+    first, remap = numpy.unique(key, return_index=True, return_inverse=True)[1:]
+    return [numpy.asarray(i)[first] for i in arrays], remap[numpy.asarray(indices).ravel()].astype("I"), remap
+
+def _vertex_scores(cache_size):
+    """Return Forsyth's score of a vertex for each position in the cache - the last entry is for vertices not in it."""
+    scores = [0.0] * (cache_size + 1)
+    for i in xrange(cache_size):
+        if i < 3:
+            #the last triangle's vertices get a fixed score, so its neighbours don't always win
+            scores[i] = 0.75
+        else:
+            scores[i] = (1.0 - (i - 3) / float(cache_size - 3)) ** 1.5
+    return scores
+
+def optimize_cache(indices, cache_size=32):
+    """Reorder GL_TRIANGLES indices so vertices are reused while they are still in the post-transform cache,
+       using Tom Forsyth's linear-speed vertex cache optimisation - returns the new indices"""
+    tris = numpy.asarray(indices, "i").reshape((-1,3))
+    if not len(tris):
+        return numpy.zeros(0, "I")
+    flat = tris.ravel()
+    count = flat.max() + 1
+    valence = numpy.bincount(flat, minlength=count)
+    starts = numpy.concatenate(([0], numpy.cumsum(valence))).tolist()
+    by_vertex = (numpy.argsort(flat, kind="mergesort") // 3).tolist()
+    active = [by_vertex[starts[v]:starts[v+1]] for v in xrange(count)]
+
+    position_scores = _vertex_scores(cache_size)
+    boost = [0.0] + [2.0 / math.sqrt(i) for i in xrange(1, valence.max() + 1)]
+    position = [cache_size] * count
+    def score(v):
+        if not active[v]:
+            return -1.0
+        return position_scores[position[v]] + boost[len(active[v])]
+
+    vscore = [score(v) for v in xrange(count)]
+    tri_list = tris.tolist()
+    tscore = numpy.array([vscore[a] + vscore[b] + vscore[c] for a, b, c in tri_list])
+    emitted = numpy.zeros(len(tri_list), bool)
+    cache = []
+    out = []
+    best = int(tscore.argmax())
+    while best >= 0:
+        tri = tri_list[best]
+        out.append(tri)
+        emitted[best] = True
+        tscore[best] = -1
+        for v in tri:
+            active[v].remove(best)
+        changed = tri + [v for v in cache if not v in tri]
+        cache, evicted = changed[:cache_size], changed[cache_size:]
+        for v in evicted:
+            position[v] = cache_size
+        for i, v in enumerate(cache):
+            position[v] = i
+
+        best = -1
+        best_score = -1.0
+        for v in changed:
+            vscore[v] = score(v)
+        for v in changed:
+            for t in active[v]:
+                a, b, c = tri_list[t]
+                s = vscore[a] + vscore[b] + vscore[c]
+                tscore[t] = s
+                if s > best_score:
+                    best, best_score = t, s
+        if best < 0 and len(out) < len(tri_list):
+            #nothing left touching the cache, start again from the best triangle anywhere
+            best = int(tscore.argmax())
+    return numpy.array(out, "I").ravel()
+
+def optimize_fetch(indices, count=None):
+    """Renumber vertices in the order the indices first use them, so vertex fetches walk memory forwards
+       indices must be the indices drawing the vertices
+       count can be None or the number of vertices, if some might not be used
+       Returns (new indices, order) - order is the old index of each new vertex, unused vertices are dropped"""
+    indices = numpy.asarray(indices, "i").ravel()
+    used, first = numpy.unique(indices, return_index=True)
+    order = used[numpy.argsort(first)]
+    remap = numpy.zeros(max(count or 0, indices.max() + 1 if len(indices) else 0), "i")
+    remap[order] = numpy.arange(len(order))
+    return remap[indices].astype("I"), order
+
+class OptimizeReport(object):
+    """The results of optimize_mesh/optimize_payload."""
+    def __init__(self, cache_size):
+        """Create the report
+           cache_size is the post-transform cache size the meshes were optimized for"""
+        self.cache_size = cache_size
+        self.groups = []
+
+    def add(self, name, verts_before, verts_after, acmr_before, acmr_after, triangles):
+        """Add the results for one group - triangles is how many triangles the group has."""
+        self.groups.append((name, verts_before, verts_after, acmr_before, acmr_after, triangles))
+
+    def get_acmr(self):
+        """Return the (before, after) average cache miss ratio over all groups, weighted by triangles."""
+        return tuple(sum(i[n] * i[5] for i in self.groups) / float(max(sum(i[5] for i in self.groups), 1))
+                     for n in (3, 4))
+
+    def __str__(self):
+        before, after = self.get_acmr()
+        lines = ["Optimized %s groups for a %s vertex cache, ACMR %.3f -> %.3f"%(len(self.groups), self.cache_size,
+                                                                              before, after)]
+        for name, verts_before, verts_after, acmr_before, acmr_after, triangles in self.groups:
+            lines.append("  %s: %s -> %s vertices, ACMR %.3f -> %.3f"%(name, verts_before, verts_after,
+                                                                     acmr_before, acmr_after))
+        return "\n".join(lines)
+
+def _optimize_arrays(arrays, indices, lods, cache_size):
+    """Weld, cache-order and fetch-order one group - returns (arrays, indices, lods)."""
+    arrays, indices, remap = weld(arrays, indices)
+    indices = optimize_cache(indices, cache_size)
+    indices, order = optimize_fetch(indices, len(arrays[0]))
+    final = numpy.zeros(len(arrays[0]), "i")
+    final[order] = numpy.arange(len(order))
+    lods = [optimize_cache(final[remap[numpy.asarray(i, "i")]], cache_size) for i in lods]
+    return [i[order] for i in arrays], indices, lods
+
+def optimize_payload(payload, cache_size=32):
+    """Optimize every GL_TRIANGLES group of a payload (see load_payload) in place - weld identical vertices,
+       order the triangles for the vertex cache and the vertices for fetching - returns an OptimizeReport"""
+    report = OptimizeReport(cache_size)
+    for group in payload["groups"]:
+        if group["render_type"] != GL_TRIANGLES or not len(group["indices"]):
+            continue
+        before = get_acmr(group["indices"], cache_size)
+        count = len(group["inter"])
+        arrays, group["indices"], group["lods"] = _optimize_arrays([group["inter"]], group["indices"],
+                                                                   group.get("lods", ()), cache_size)
+        group["inter"] = arrays[0]
+        report.add(group["name"], count, len(group["inter"]), before, get_acmr(group["indices"], cache_size),
+                   len(group["indices"]) // 3)
+    return report
+
+def optimize_mesh(mesh, cache_size=32):
+    """Optimize every GL_TRIANGLES data.Geometry group of a loaded BasicMesh, replacing its geometry (and lods)
+       - weld identical vertices, order the triangles for the vertex cache and the vertices for fetching.
+       Returns an OptimizeReport"""
+    report = OptimizeReport(cache_size)
+    for obj in mesh.objs:
+        geom = obj.full_geometry
+        if not isinstance(geom, data.Geometry) or geom.render_type != GL_TRIANGLES or not len(geom):
+            continue
+        indices = geom.indices
+        if indices is None:
+            indices = numpy.arange(len(geom.verts))
+        before = get_acmr(indices, cache_size)
+        arrays = [geom.verts, geom.norms, geom.texcs]
+        if geom.colors is not None:
+            arrays.append(geom.colors)
+        arrays, indices, lods = _optimize_arrays(arrays, indices, [i.indices for i in obj.lods], cache_size)
+        colors = arrays[3] if len(arrays) > 3 else None
+        new = data.Geometry(arrays[0], arrays[1], arrays[2], colors, indices, geom.render_type)
+        obj.full_geometry = new
+        obj.lods = [new.with_indices(i) for i in lods]
+        obj.set_lod(obj.lod)
+        report.add(obj.name, len(geom.verts), len(new.verts), before, get_acmr(indices, cache_size), len(indices) // 3)
+    return report
+
 class ObjGroup(object):
     """Class to keep track of an objects verts and such while being loaded."""
     def __init__(self, name):
         """name is the name of the object."""
         self.name = name
-        self.faces = []
         self.material = None
 
-        self.dlist = None
+        self.first_face = 0
+        self.counts = numpy.zeros(0, "i")
+        self.corners = numpy.zeros((0,3), "i")
 
     def compile(self, vertices, normals, texcoords):
-        """Compile the ObjGroup into a CompiledGroup for rendering/using.
-           vertices/normals/texcoords are a list of all attributes in the mesh file, fo reference"""
-        faces = []
-        for face in self.faces:
-            v,n,t = face
-            uv, un, ut = [], [], []
-            for i in xrange(len(v)):
-                if n[i] > 0:
-                    un.append(normals[n[i]-1])
-                else:
-                    un.append(None)
-
-                if t[i] > 0:
-                    ut.append(texcoords[t[i]-1])
-                else:
-                    ut.append(None)
-                uv.append(vertices[v[i]-1])
-            faces.append((uv, un, ut))
-
-        final = []
-        for face in faces:
-            v,n,t = face
-            nv = []
-            for i in v:
-                a,b,c = i
-                nv.append((a,b,c))
-            final.append((nv,n,t))
-
-        #now build our display list!
-        dlist = data.DisplayList()
-        dlist.begin()
+        """Compile the ObjGroup into the arrays of a payload group (see load_payload), without touching OpenGL.
+           vertices/normals/texcoords are a list (or array) of all attributes in the mesh file, fo reference
+           self.counts must be an array of the number of corners of each face in the group, and
+           self.corners an (N,3) array of the 0 based vertex/normal/texcoord index of each corner, -1 if missing"""
+        vertices = numpy.asarray(vertices, "f").reshape((-1,3))
+        normals = numpy.asarray(normals, "f").reshape((-1,3))
+        texcoords = numpy.asarray(texcoords, "f").reshape((-1,2))
+
+        #every distinct vertex/normal/texcoord combination becomes one vertex of the buffer
+        vi, ni, ti = self.corners.T.astype("int64") #a C long is 32 bit on windows, too small for the key
+        key = (vi * (len(normals)+1) + ni + 1) * (len(texcoords)+1) + ti + 1
+        key, first, inverse = numpy.unique(key, return_index=True, return_inverse=True)
+        vi, ni, ti = vi[first], ni[first], ti[first]
+
+        inter = numpy.zeros((len(vi), 8), "f")
+        verts = inter[:,0:3]
+        verts[:] = vertices[vi]
+        norms = inter[:,3:6]
+        norms[:,1] = 1
+        has = ni >= 0
+        norms[has] = normals[ni[has]]
+        has = ti >= 0
+        inter[has,6:8] = texcoords[ti[has]]
+
+        if len(verts):
+            avgx, avgy, avgz = vertices[self.corners[:,0]].mean(0).tolist()
+            minx, miny, minz = numpy.minimum(verts.min(0), 0).tolist()
+            maxx, maxy, maxz = numpy.maximum(verts.max(0), 0).tolist()
+        else:
+            avgx = avgy = avgz = 0
+            minx = miny = minz = maxx = maxy = maxz = 0
 
-        minx = miny = minz = 0
-        maxx = maxy = maxz = 0
+        verts -= (avgx, avgy, avgz)
 
-        avgx, avgy, avgz = 0,0,0
-        num = 0
-
-        for face in final:
-            v = face[0]
-            for i in xrange(len(v)):
-                num += 1
-                x, y, z = v[i]
-                avgx += x
-                avgy += y
-                avgz += z
-
-        avgx = math3d.safe_div(float(avgx), num)
-        avgy = math3d.safe_div(float(avgy), num)
-        avgz = math3d.safe_div(float(avgz), num)
-
-        for face in final:
-            v, n, t = face
-            glBegin(GL_POLYGON)
-            for i in xrange(len(v)):
-                if n[i]:
-                    glNormal3fv(n[i])
-                if t[i]:
-                    glTexCoord2fv(t[i])
-                x, y, z = v[i]
-                glVertex3f(x-avgx, y-avgy, z-avgz)
-                minx = min((minx, x))
-                maxx = max((maxx, x))
-                miny = min((miny, y))
-                maxy = max((maxy, y))
-                minz = min((minz, z))
-                maxz = max((maxz, z))
-            glEnd()
-
-        dlist.end()
-
-        if self.material == None:
-            self.material = data.Material("null")
-
-        return CompiledGroup(self.name, self.material, dlist, (minx,miny,minz, maxx, maxy, maxz),
-                             (avgx, avgy, avgz))
+        #every face is a convex polygon, so split them into triangle fans
+        return {"name":self.name, "material":None, "render_type":int(GL_TRIANGLES),
+                "dimensions":(minx,miny,minz, maxx, maxy, maxz), "pos":(avgx, avgy, avgz),
+                "inter":inter, "indices":inverse[data.fan_indices(self.counts)].astype("I")}
 
 class CompiledGroup(BaseSceneObject):
     """The core object in a mesh, each mesh object (head, torso, w/e) has one of these.
@@ -174,7 +868,7 @@ class CompiledGroup(BaseSceneObject):
         """Create the Group
            name is the name of the object
            material is the data.Material object the group uses
-           dlist is the display list of the object
+           dlist is the data.Geometry (or data.DisplayList) of the object
            dimensions/pos are the size/center of the vertices in the object."""
         BaseSceneObject.__init__(self)
         self.name = name
@@ -185,6 +879,16 @@ class CompiledGroup(BaseSceneObject):
         self.base_pos = pos
         self.pos = pos
 
+        self.full_geometry = dlist
+        self.lods = []
+        self.lod = 0
+
+    def set_lod(self, level):
+        """Draw with level of detail level - 0 is the full geometry, 1 the first of lods, and so on.
+           Levels past the last of lods use the last one."""
+        self.lod = min(max(level, 0), len(self.lods))
+        self.display_list = ([self.full_geometry] + self.lods)[self.lod]
+
     def get_dimensions(self):
         """Return the dimensions of the object."""
         d = self.dimensions
@@ -202,9 +906,10 @@ class CompiledGroup(BaseSceneObject):
         elif type(name) is type(1):
             return self.dimensions[name]
 
-    def render(self, camera=None):
+    def render(self, camera=None, colorize=None):
         """Render the object.
-           camera must be None of the camera object the scene is using to render."""
+           camera must be None of the camera object the scene is using to render.
+           colorize can be None or an (r,g,b,a) color the material color is multiplied by"""
         glPushMatrix()
 
         x,y,z = self.pos
@@ -220,8 +925,27 @@ class CompiledGroup(BaseSceneObject):
             glScalef(self.scale, self.scale, self.scale)
 
         if self.outline:
-            misc.outline(self.dlist, self.outline_color, self.outline_size)
-        glColor4f(*self.material.color)
+            misc.outline(self.display_list, self.outline_color, self.outline_size)
+        color = self.material.color
+        if colorize:
+            glColor4f(color[0]*colorize[0], color[1]*colorize[1], color[2]*colorize[2], color[3]*colorize[3])
+        else:
+            glColor4f(*color)
+        self.material.texture.bind()
+        self.display_list.render()
+        glPopMatrix()
+
+    def render_matrix(self, matrix, colorize=None):
+        """Render the object with matrix in place of its own pos/rotation/scale.
+           matrix must be a column-major matrix, like the ones MatrixSkeleton.get_matrices returns
+           colorize can be None or an (r,g,b,a) color the material color is multiplied by"""
+        glPushMatrix()
+        glMultMatrixf(matrix)
+        color = self.material.color
+        if colorize:
+            glColor4f(color[0]*colorize[0], color[1]*colorize[1], color[2]*colorize[2], color[3]*colorize[3])
+        else:
+            glColor4f(*color)
         self.material.texture.bind()
         self.display_list.render()
         glPopMatrix()
@@ -230,9 +954,11 @@ class CompiledGroup(BaseSceneObject):
         """Return a copy of the object."""
         new = CompiledGroup(str(self.name),
                              self.material.copy(),
-                             self.display_list,
+                             self.full_geometry,
                              self.dimensions,
                             self.base_pos)
+        new.lods = self.lods
+        new.set_lod(self.lod)
         new.pos = self.pos
         new.rotation = self.rotation
         new.scale = self.scale
@@ -260,6 +986,64 @@ class BasicMesh(BaseSceneObject):
         self.scale = scale
         self.colorize = colorize
 
+        self._batches = None
+        self._batch_state = None
+        self._unbatched = []
+
+    def _get_batch_state(self):
+        """Return everything about the groups that batch bakes in, to tell when the batches are out of date."""
+        return [(i, i.pos, i.rotation, i.scale, i.material.color, i.material.texture, i.display_list, i.outline)
+                for i in self.objs]
+
+    def _batch_valid(self):
+        """Return whether the batches still match the groups - compares identities only, so nothing is allocated."""
+        state = self._batch_state
+        objs = self.objs
+        if len(state) != len(objs):
+            return False
+        for n in xrange(len(objs)):
+            i = objs[n]
+            obj, pos, rotation, scale, color, texture, dlist, outline = state[n]
+            if not (i is obj and i.pos is pos and i.rotation is rotation and i.scale is scale and
+                    i.material.color is color and i.material.texture is texture and
+                    i.display_list is dlist and i.outline is outline):
+                return False
+        return True
+
+    def batch(self):
+        """Merge the groups that share a material (color and texture) into single data.Geometry draws.
+           Each group's pos/rotation/scale are baked into the merged geometry, so this is for groups that don't move -
+           if a group is moved, changed, added or removed the mesh goes back to drawing every group on its own,
+           until batch is called again. Outlined groups, and groups that aren't data.Geometry, are always drawn on their own."""
+        merge = {}
+        order = []
+        self._unbatched = []
+        for obj in self.objs:
+            geom = obj.display_list
+            if obj.outline or not isinstance(geom, data.Geometry):
+                self._unbatched.append(obj)
+                continue
+            key = (tuple(obj.material.color), obj.material.texture, geom.render_type, geom.colors is None)
+            if not key in merge:
+                merge[key] = []
+                order.append(key)
+            x, y, z = obj.pos
+            scale = obj.scale
+            if not type(scale) in (list, tuple):
+                scale = (scale, scale, scale)
+            #group positions are not flipped on z like scene objects, so flip them here to cancel compose_matrices'
+            matrix = instance.compose_matrices([(x, y, -z)], [obj.rotation], [scale])[0]
+            merge[key].append(geom.transformed(matrix))
+
+        self._batches = [(key[0], key[1], data.merge_geometry(merge[key])) for key in order]
+        self._batch_state = self._get_batch_state()
+
+    def unbatch(self):
+        """Stop using the merged batches, and draw every group on its own again."""
+        self._batches = None
+        self._batch_state = None
+        self._unbatched = []
+
     def get_dimensions(self):
         """Return the width, height and depth of the mesh..."""
         minx = miny = minz = 0
@@ -276,13 +1060,22 @@ class BasicMesh(BaseSceneObject):
         return abs(minx-maxx), abs(miny-maxy), abs(minz-maxz)
 
     def copy(self):
-        """Return a copy of the mesh, sharing the same data.DisplayList"""
+        """Return a copy of the mesh, sharing the same data.Geometry (and merged batches, if any)"""
         new_objs = []
         for i in self.objs:
             new_objs.append(i.copy())
         new = BasicMesh(new_objs, self.pos, self.rotation, self.scale, self.colorize)
+        if self._batches is not None and self._batch_valid():
+            new._batches = self._batches
+            new._batch_state = new._get_batch_state()
+            new._unbatched = [new_objs[self.objs.index(i)] for i in self._unbatched]
         return new
 
+    def set_lod(self, level):
+        """Draw every group with level of detail level, see CompiledGroup.set_lod"""
+        for i in self.objs:
+            i.set_lod(level)
+
     def get_names(self):
         """Return the names of all the objects in the mesh."""
         return [i.name for i in self.objs]
@@ -321,22 +1114,73 @@ class BasicMesh(BaseSceneObject):
             misc.outline(misc.OutlineGroup(new),
                          self.outline_color, self.outline_size)
 
-        for i in self.objs:
-            old = tuple(i.material.color)
-            r,g,b,a = old
-            r2,g2,b2,a2 = self.colorize
-            r *= r2
-            g *= g2
-            b *= b2
-            a = a2
-            i.material.color = r,g,b,a
-            i.render(camera)
-            i.material.color = old
+        if self._batches is not None and self._batch_valid():
+            r, g, b, a = self.colorize
+            for color, texture, geometry in self._batches:
+                glColor4f(color[0]*r, color[1]*g, color[2]*b, color[3]*a)
+                texture.bind()
+                geometry.render()
+            for i in self._unbatched:
+                i.render(camera, self.colorize)
+        else:
+            for i in self.objs:
+                i.render(camera, self.colorize)
         glPopMatrix()
 
 
+class StreamedOBJ(BasicMesh):
+    """A BasicMesh that loads an OBJ file a chunk of faces at a time (see iter_obj),
+       uploading each chunk as soon as it is parsed - so the first parts of the mesh are drawn while the rest is still loading,
+       and the whole file never has to be held in memory as python objects.
+       Each chunk becomes its own CompiledGroup, named after the group it belongs to."""
+    def __init__(self, filename, pos=(0,0,0), rotation=(0,0,0), colorize=(1,1,1,1),
+                 chunk_faces=16384, chunks_per_frame=1):
+        """Start loading the mesh
+           filename must be the filename of the mesh to load
+           pos/rotation/colorize are the starting attributes of the mesh object.
+           chunk_faces is the most faces uploaded in one chunk
+           chunks_per_frame is how many chunks are loaded each time the mesh is rendered,
+               0 to only load them when load_chunks is called"""
+        view.require_init()
+        BasicMesh.__init__(self, [], pos, rotation, 1, colorize)
+
+        self.chunks_per_frame = chunks_per_frame
+        self.loading = iter_obj(filename, chunk_faces)
+        self.finished = False
+        self._materials = {}
+
+    def load_chunks(self, count=1):
+        """Load and upload up to count more chunks - None loads the rest of the file.
+           Returns True once the whole file has been loaded."""
+        while not self.finished and (count is None or count > 0):
+            try:
+                group = self.loading.next()
+            except StopIteration:
+                self.finished = True
+                self.loading = None
+                break
+            mat = group["material"]
+            if mat is None:
+                material = None
+            else:
+                if not mat["name"] in self._materials:
+                    self._materials[mat["name"]] = _build_material(mat)
+                material = self._materials[mat["name"]]
+            self.objs.append(_build_group(group, material))
+            if count is not None:
+                count -= 1
+        return self.finished
+
+    def render(self, camera=None):
+        """Load the next chunks (if still loading), and render the mesh
+           camera must be None of the camera the scene is using"""
+        if self.chunks_per_frame and not self.finished:
+            self.load_chunks(self.chunks_per_frame)
+        BasicMesh.render(self, camera)
+
 class Exploder(BaseSceneObject):
-    """A simple class to explode/dismember a mesh object."""
+    """A simple class to explode/dismember a mesh object.
+       The direction and spin of every part are kept in numpy arrays and updated together each frame."""
     def __init__(self, root_mesh, speed=0.025, frame_duration=10,
                  kill_when_finished=True):
         """Create the exploder
@@ -350,27 +1194,10 @@ class Exploder(BaseSceneObject):
         self.kill_when_finished = kill_when_finished
 
         self.root_mesh = root_mesh
-        self.angles = {}
-        self.rots = {}
-        for i in self.root_mesh.get_names():
-            a = math3d.Vector(self.root_mesh.get_obj_by_name(i).base_pos)
-            x, y, z = a.x, a.y, a.z
-            if x == y == z == 0:
-                x, y, z = misc.randfloat(-2,2), misc.randfloat(0,2), misc.randfloat(-2,2)
-            else:
-                a = a.normalize()
-                x, y, z = a.x, a.y, a.z
-
-            y += misc.randfloat(1.5,2.5)
-            self.angles[i] = x+misc.randfloat(-1,1), y+misc.randfloat(-1,1), z+misc.randfloat(-1,1)
-            self.rots[i] = (misc.randfloat(-10, 10),
-                            misc.randfloat(-10, 10),
-                            misc.randfloat(-10, 10))
-
-        self.root_vals = {}
-        for i in self.root_mesh.get_names():
-            self.root_vals[i] = (self.root_mesh.get_obj_by_name(i).pos,
-                                 self.root_mesh.get_obj_by_name(i).rotation)
+        self.root_vals = [(i.pos, i.rotation) for i in self.root_mesh.objs]
+        self.positions = numpy.array([i[0] for i in self.root_vals], "f").reshape((-1,3))
+        self.rotations = numpy.array([i[1] for i in self.root_vals], "f").reshape((-1,3))
+        self._scatter((-2,0,-2), (2,2,2))
 
         self.speed = speed
         self.age = 0
@@ -378,28 +1205,27 @@ class Exploder(BaseSceneObject):
         self.dead = False
         self.down_delta = 0
 
+    def _scatter(self, low, high):
+        """Pick a new random direction and spin for every part
+           low/high are the range of each axis of the direction of parts sitting right at the mesh center"""
+        n = len(self.root_mesh.objs)
+        base = numpy.array([i.base_pos for i in self.root_mesh.objs], "f").reshape((-1,3))
+        lengths = numpy.sqrt((base**2).sum(1))
+        self.angles = base / numpy.maximum(lengths, 1e-9)[:,numpy.newaxis]
+        still = lengths == 0
+        self.angles[still] = numpy.random.uniform(low, high, (still.sum(), 3))
+        self.angles[:,1] += numpy.random.uniform(1.5, 2.5, n)
+        self.angles += numpy.random.uniform(-1, 1, (n,3))
+        self.rots = numpy.random.uniform(-10, 10, (n,3)).astype("f")
+
     def reset(self):
         """Reset he explosion to run again!"""
-        self.angles = {}
-        self.rots = {}
-        for i in self.root_mesh.get_names():
-            a = math3d.Vector(self.root_mesh.get_obj_by_name(i).base_pos)
-            x, y, z = a.x, a.y, a.z
-            if x == y == z == 0:
-                x, y, z = misc.randfloat(-1,1), misc.randfloat(-1,1), misc.randfloat(-1,1)
-            else:
-                a = a.normalize()
-                x, y, z = a.x, a.y, a.z
+        self._scatter((-1,-1,-1), (1,1,1))
 
-            y += misc.randfloat(1.5,2.5)
-            self.angles[i] = x+misc.randfloat(-1,1), y+misc.randfloat(-1,1), z+misc.randfloat(-1,1)
-            self.rots[i] = (misc.randfloat(-10, 10),
-                            misc.randfloat(-10, 10),
-                            misc.randfloat(-10, 10))
-
-        for i in self.root_vals:
-            self.root_mesh.get_obj_by_name(i).pos = self.root_vals[i][0]
-            self.root_mesh.get_obj_by_name(i).rotation = self.root_vals[i][1]
+        for i, vals in zip(self.root_mesh.objs, self.root_vals):
+            i.pos, i.rotation = vals
+        self.positions[:] = [i[0] for i in self.root_vals]
+        self.rotations[:] = [i[1] for i in self.root_vals]
 
         self.age = 0
         self.dead = False
@@ -409,22 +1235,16 @@ class Exploder(BaseSceneObject):
         """Update and render the explosion
            camera must be None or the camera the scene is using."""
         if self.age <= self.frame_duration:
-            for i in self.root_mesh.objs:
-                a, b, c = i.pos
-                d,e,f = self.angles[i.name]
-                a += d *self.speed
-                b += e *self.speed
-                c += f *self.speed
-                i.pos = a, b, c
-                e -= self.down_delta
-                self.down_delta += self.speed / self.frame_duration / 2
-                self.angles[i.name] = d,e,f
-                a,b,c = i.rotation
-                d,e,f = self.rots[i.name]
-                a += d *self.speed*2
-                b += e *self.speed*2
-                c += f *self.speed*2
-                i.rotation = (a,b,c)
+            n = len(self.positions)
+            self.positions += self.angles * self.speed
+            #every part falls a little faster than the one updated before it, like they always have
+            step = self.speed / self.frame_duration / 2
+            self.angles[:,1] -= self.down_delta + numpy.arange(n) * step
+            self.down_delta += n * step
+            self.rotations += self.rots * (self.speed * 2)
+            for i, pos, rot in zip(self.root_mesh.objs, self.positions.tolist(), self.rotations.tolist()):
+                i.pos = tuple(pos)
+                i.rotation = tuple(rot)
         self.root_mesh.render(camera)
 
         if self.age >= self.frame_duration:
@@ -434,6 +1254,172 @@ class Exploder(BaseSceneObject):
         else:
             self.age += 1
 
+def _cluster_triangles(verts, size):
+    """Return the cluster index of each triangle in an (N*3,3) array of GL_TRIANGLES vertices
+       size is about how many triangles go in each cluster - triangles are sorted through a grid over the
+       vertices first, so each cluster is a patch of neighbouring triangles"""
+    centroids = verts.reshape((-1,3,3)).mean(1)
+    count = len(centroids)
+    cells = max(int(round((count / float(size)) ** (1/3.0))), 1)
+    low = centroids.min(0)
+    extent = numpy.maximum(centroids.max(0) - low, 1e-9)
+    cell = numpy.minimum(((centroids - low) / extent * cells).astype("i"), cells-1)
+    order = numpy.lexsort((cell[:,2], cell[:,1], cell[:,0]))
+    ids = numpy.empty(count, "i")
+    ids[order] = numpy.arange(count) // size
+    return ids
+
+class Debris(BaseSceneObject):
+    """An explosion that breaks a mesh into fragments - whole groups, or clusters of a few triangles each.
+       The position, velocity, rotation and spin of every fragment live in numpy arrays and are integrated in one step,
+       and all fragments with the same texture are drawn as a single dynamic data.Geometry,
+       moved by their fragment's matrix the same way a SkinnedMesh moves vertices by their bone's."""
+    def __init__(self, root_mesh, cluster_size=0, speed=0.025, gravity=None, frame_duration=10,
+                 kill_when_finished=True):
+        """Create the debris
+           root_mesh must be a BasicMesh object built from data.Geometry, to explode
+           cluster_size can be 0 (every group is one fragment) or about how many triangles each fragment has
+           speed is how fast you want each fragment to move/rotate
+           gravity is how much the fragments fall faster each frame - None uses speed / frame_duration
+           frame_duration is how many times it will update before dying
+           kill_when_finished indicates whether the debris should be removed from the scene when it ends"""
+        BaseSceneObject.__init__(self)
+
+        self.root_mesh = root_mesh
+        self.speed = speed
+        if gravity is None:
+            gravity = speed / float(frame_duration)
+        self.gravity = gravity
+        self.frame_duration = frame_duration
+        self.kill_when_finished = kill_when_finished
+
+        self.pos = root_mesh.pos
+        self.rotation = root_mesh.rotation
+        self.scale = root_mesh.scale
+        self.colorize = root_mesh.colorize
+
+        self._build(cluster_size)
+        self.reset()
+
+    def _build(self, cluster_size):
+        """Split the mesh into fragments and merge them into one geometry per texture."""
+        parts = {}
+        order = []
+        offset = 0
+        for obj in self.root_mesh.objs:
+            geom = obj.display_list
+            if not isinstance(geom, data.Geometry):
+                raise ValueError("Mesh part %s was not built from a data.Geometry!"%obj.name)
+            x, y, z = obj.pos
+            scale = obj.scale
+            if not type(scale) in (list, tuple):
+                scale = (scale, scale, scale)
+            matrix = instance.compose_matrices([(x, y, -z)], [obj.rotation], [scale])[0]
+            geom = geom.transformed(matrix).expanded()
+            colors = numpy.resize(numpy.array(obj.material.color, "f"), (len(geom.verts), 4))
+            if geom.colors is not None:
+                colors = colors * geom.colors
+            if cluster_size and geom.render_type == GL_TRIANGLES and len(geom.verts) >= 3:
+                ids = numpy.repeat(_cluster_triangles(geom.verts, cluster_size), 3)
+            else:
+                ids = numpy.zeros(len(geom.verts), "i")
+            key = obj.material.texture.gl_tex
+            if not key in parts:
+                parts[key] = (obj.material.texture, [])
+                order.append(key)
+            parts[key][1].append((geom, colors, ids + offset))
+            offset += ids.max() + 1 if len(ids) else 0
+
+        #fragment centers, from every vertex of every fragment
+        verts = [geom.verts for key in order for geom, colors, ids in parts[key][1]]
+        ids = [i for key in order for geom, colors, i in parts[key][1]]
+        verts = numpy.concatenate(verts) if verts else numpy.zeros((0,3), "f")
+        ids = numpy.concatenate(ids) if ids else numpy.zeros(0, "i")
+        counts = numpy.maximum(numpy.bincount(ids, minlength=offset), 1)
+        self.centers = numpy.column_stack([numpy.bincount(ids, verts[:,i], offset) / counts for i in xrange(3)])
+
+        self.batches = []
+        for key in order:
+            texture, groups = parts[key]
+            ids = numpy.concatenate([i[2] for i in groups])
+            merged = data.merge_geometry([data.Geometry(geom.verts, geom.norms, geom.texcs, colors,
+                                                        None, geom.render_type)
+                                          for geom, colors, i in groups])
+            local = merged.verts - self.centers[ids]
+            geometry = data.Geometry(local, merged.norms, merged.texcs, merged.colors, None,
+                                     merged.render_type, usage="dynamic")
+            self.batches.append((texture, geometry, local, merged.norms, ids.reshape((-1,1)),
+                                 numpy.ones((len(ids),1), "f")))
+
+    def __len__(self):
+        """Return the number of fragments."""
+        return len(self.centers)
+
+    def reset(self):
+        """Put the fragments back together and throw them apart again."""
+        n = len(self.centers)
+        lengths = numpy.sqrt((self.centers**2).sum(1))
+        dirs = self.centers / numpy.maximum(lengths, 1e-9)[:,numpy.newaxis]
+        still = lengths == 0
+        dirs[still] = numpy.random.uniform(-1, 1, (still.sum(), 3))
+        dirs[:,1] += numpy.random.uniform(1.5, 2.5, n)
+        dirs += numpy.random.uniform(-1, 1, (n,3))
+
+        self.positions = self.centers.astype("f")
+        self.velocities = (dirs * self.speed).astype("f")
+        self.rotations = numpy.zeros((n,3), "f")
+        self.spins = numpy.random.uniform(-10, 10, (n,3)).astype("f") * (self.speed * 2)
+
+        self.age = 0
+        self.dead = False
+
+    def step(self):
+        """Move every fragment one frame on."""
+        self.velocities[:,1] -= self.gravity
+        self.positions += self.velocities
+        self.rotations += self.spins
+
+    def get_matrices(self):
+        """Return the (N,4,4) row-major matrices that move each fragment from its center to where it is now."""
+        n = len(self.positions)
+        matrices = instance.compose_matrices(numpy.zeros((n,3), "f"), self.rotations,
+                                             numpy.ones((n,3), "f")).transpose((0,2,1))
+        matrices[:,:3,3] = self.positions
+        return matrices
+
+    def render(self, camera=None):
+        """Update and render the debris
+           camera must be None or the camera the scene is using."""
+        if self.age <= self.frame_duration:
+            self.step()
+        palette = self.get_matrices()
+
+        glPushMatrix()
+        x,y,z = self.pos
+        glTranslatef(x,y,-z)
+        a, b, c = self.rotation
+        glRotatef(a, 1, 0, 0)
+        glRotatef(b, 0, 1, 0)
+        glRotatef(c, 0, 0, 1)
+        try:
+            glScalef(*self.scale)
+        except:
+            glScalef(self.scale, self.scale, self.scale)
+        glColor(*self.colorize)
+        for texture, geometry, verts, norms, ids, weights in self.batches:
+            if self.age <= self.frame_duration:
+                geometry.update(*skin_vertices(verts, norms, ids, weights, palette))
+            texture.bind()
+            geometry.render()
+        glPopMatrix()
+
+        if self.age >= self.frame_duration:
+            if self.kill_when_finished:
+                self.dead_remove_from_scene = True
+            self.dead = True
+        else:
+            self.age += 1
+
 
 class Bone(object):
     """A simple bone used to animate a part of a mesh."""
@@ -588,20 +1574,20 @@ class CoreAnimationCommand(object):
             obj = skeleton.bones[self.obj]
         else:
             return None
-        pos, rotation, scale = obj.get_center(), obj.rotation, obj.scale
         if tstamp_last > self.end or tstamp_cur < self.start:
             return None
         _s = max((tstamp_last, self.start))
         _e = min((tstamp_cur, self.end))
         mult = math3d.safe_div(float(_e-_s), self.end-_s)
+        #only read what this command needs - a MatrixSkeleton re-evaluates the hierarchy for get_center
         if self.ident == "RT":
-            a,b,c = self._d(self.val, rotation, mult)
+            a,b,c = self._d(self.val, obj.rotation, mult)
             obj.rotate(a,b,c)
         if self.ident == "MT":
-            pos = self._d(self.val, pos, mult)
+            pos = self._d(self.val, obj.get_center(), mult)
             obj.move(*pos)
         if self.ident == "ST":
-            scale = self._d(self.val, scale, mult)
+            scale = self._d(self.val, obj.scale, mult)
             obj.scaled(*scale)
 
     def reset(self, skeleton):
@@ -657,6 +1643,80 @@ class Action(object):
             self.reset()
             self.finished_frame = True
 
+class Clip(object):
+    """An Action baked into keyframe tracks - the rotation, movement and scale of every bone, sampled fps times a second.
+       Clips are shared by every Animation using them: each Animation samples the clip at its own time,
+       and the bone matrices for a time are cached, so Animations at the same point of a clip
+       only evaluate it once between them."""
+    def __init__(self, action, skeleton, fps=30, cache_size=256):
+        """Bake the clip
+           action must be the Action to bake - for each sample the clip's skeleton is reset and the commands are
+               stepped from the last sample time to this one, just like Animation.render does each frame,
+               so the clip matches the action played at fps frames a second
+           skeleton must be the Skeleton or MatrixSkeleton the clip is for
+           fps is how many samples are taken each second, values between samples are interpolated
+           cache_size is how many sets of bone matrices are kept"""
+        self.skeleton = MatrixSkeleton(skeleton)
+        self.duration = action.duration
+        self.fps = fps
+        self.cache_size = cache_size
+        self._cache = {}
+
+        n = len(self.skeleton.names)
+        frames = int(math.ceil(self.duration * fps)) + 1
+        times = numpy.minimum(numpy.arange(frames) / float(fps), self.duration)
+        self.rotation = numpy.zeros((frames, n, 3), "f")
+        self.movement = numpy.zeros((frames, n, 3), "f")
+        self.scale = numpy.ones((frames, n, 3), "f")
+
+        skeleton = self.skeleton
+        last = 0
+        for i in xrange(frames):
+            skeleton.reset()
+            for command in action.commands:
+                command.update(skeleton, last, times[i])
+            last = times[i]
+            self.rotation[i] = skeleton.rotation
+            self.movement[i] = skeleton.movement
+            self.scale[i] = skeleton.scale
+        skeleton.reset()
+
+    def copy(self):
+        """Return the clip - clips are shared, not copied."""
+        return self
+
+    def sample(self, t, loop=True):
+        """Return the interpolated (rotation, movement, scale) (N,3) arrays of the bones at t seconds into the clip
+           loop controls whether times past the end wrap around, or hold the last frame"""
+        if loop and self.duration:
+            t %= self.duration
+        else:
+            t = min(max(t, 0), self.duration)
+        pos = t * self.fps
+        last = len(self.rotation) - 1
+        i = min(int(pos), last)
+        j = min(i + 1, last)
+        f = pos - i
+        return [track[i] + (track[j] - track[i]) * f for track in (self.rotation, self.movement, self.scale)]
+
+    def get_matrices(self, t, loop=True):
+        """Return the (N,4,4) column-major matrices the mesh parts are drawn with at t seconds into the clip,
+           see MatrixSkeleton.get_matrices - times are rounded to the millisecond, and shared through the cache"""
+        if loop and self.duration:
+            t %= self.duration
+        else:
+            t = min(max(t, 0), self.duration)
+        key = int(t * 1000)
+        if key in self._cache:
+            return self._cache[key]
+        rotation, movement, scale = self.sample(key / 1000.0, False)
+        self.skeleton.set_pose(rotation, movement, scale)
+        matrices = self.skeleton.get_matrices().copy()
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[key] = matrices
+        return matrices
+
 class Skeleton(object):
     """Basic object to store several bones."""
     def __init__(self):
@@ -688,13 +1748,240 @@ class Skeleton(object):
         for i in self.bones:
             self.bones[i].push()
 
+class _MatrixBone(object):
+    """A view of one bone of a MatrixSkeleton, with the same interface as Bone -
+       so the animation commands can drive a MatrixSkeleton just like a Skeleton."""
+    def __init__(self, skeleton, index):
+        """Create the view
+           skeleton is the MatrixSkeleton the bone is in
+           index is the index of the bone in the skeleton's arrays"""
+        self.skeleton = skeleton
+        self.index = index
+
+    def _get_rotation(self):
+        return tuple(self.skeleton.rotation[self.index].tolist())
+    rotation = property(_get_rotation)
+
+    def _get_movement(self):
+        return tuple(self.skeleton.movement[self.index].tolist())
+    movement = property(_get_movement)
+
+    def _get_scale(self):
+        #summed up the parent chain, so reading it doesn't re-evaluate the whole skeleton
+        skeleton = self.skeleton
+        scale = skeleton.scale[self.index].copy()
+        parent = skeleton.parents[self.index]
+        while parent >= 0:
+            scale += skeleton.scale[parent] - 1
+            parent = skeleton.parents[parent]
+        return tuple(scale.tolist())
+    scale = property(_get_scale)
+
+    def get_rotation(self):
+        """Return the current rotation of the bone."""
+        return self.rotation
+
+    def rotate(self, x, y, z):
+        """Rotate the bone and children around the anchor point."""
+        self.skeleton.rotation[self.index] += (x, y, z)
+        self.skeleton.changed()
+
+    def move(self, x, y, z):
+        """Move the bone and all children."""
+        self.skeleton.movement[self.index] += (x, y, z)
+        self.skeleton.changed()
+
+    def scaled(self, x, y, z):
+        """Scale the bone and all children."""
+        self.skeleton.scale[self.index] += (x, y, z)
+        self.skeleton.changed()
+
+    def get_center(self):
+        """Return the current center point of the bone."""
+        m = self.skeleton.get_matrices()[self.index]
+        return tuple(m[3,:3].tolist())
+
+    def reset(self):
+        """Reset the current values of the bone."""
+        self.skeleton.rotation[self.index] = 0
+        self.skeleton.movement[self.index] = 0
+        self.skeleton.scale[self.index] = 1
+        self.skeleton.changed()
+
+class MatrixSkeleton(object):
+    """A skeleton that keeps every bone's local rotation/movement/scale in numpy arrays,
+       and evaluates the whole hierarchy at once with batched matrix math, one level of the hierarchy at a time.
+       The resulting matrices are cached until the pose changes, so an idle skeleton costs nothing to render.
+       It can be used in place of a Skeleton in an Animation - bones are looked up the same way, by name."""
+    def __init__(self, skeleton=None):
+        """Create the skeleton
+           skeleton can be None or a Skeleton or MatrixSkeleton to copy the bones of"""
+        self.bones = {}
+        self.names = []
+        self.parents = numpy.zeros(0, "i")
+        self.depths = numpy.zeros(0, "i")
+        self.anchors = numpy.zeros((0,3), "f")
+        self.centers = numpy.zeros((0,3), "f")
+
+        self.rotation = numpy.zeros((0,3), "f")
+        self.movement = numpy.zeros((0,3), "f")
+        self.scale = numpy.ones((0,3), "f")
+
+        self._levels = []
+        self._matrices = None
+        self._world = None
+        self._scales = None
+        self._posed = False
+
+        if isinstance(skeleton, MatrixSkeleton):
+            self.names = list(skeleton.names)
+            self.parents = skeleton.parents.copy()
+            self.depths = skeleton.depths.copy()
+            self.anchors = skeleton.anchors.copy()
+            self.centers = skeleton.centers.copy()
+            self.rotation = numpy.zeros((len(self.names),3), "f")
+            self.movement = numpy.zeros((len(self.names),3), "f")
+            self.scale = numpy.ones((len(self.names),3), "f")
+            self._levels = list(skeleton._levels)
+            for i in xrange(len(self.names)):
+                self.bones[self.names[i]] = _MatrixBone(self, i)
+        elif skeleton:
+            parents = {}
+            for name in skeleton.bones:
+                for child in skeleton.bones[name].children:
+                    parents[child] = name
+            added = set()
+            def add(name):
+                bone = skeleton.bones[name]
+                if name in added:
+                    return
+                parent = parents.get(bone)
+                if parent:
+                    add(parent)
+                self.add_bone(name, bone._start, bone._end, parent, bone._anchor)
+                added.add(name)
+            for name in sorted(skeleton.bones):
+                add(name)
+
+    def add_bone(self, name, start, end, parent=None, anchor=0):
+        """Add a new bone
+           name is the name of the bone
+           start, end and anchor are just like the arguments for Bone.__init__
+           parent can be None or the name of the bone this is attached to - it must already be in the skeleton"""
+        start = numpy.array(start, "f")
+        end = numpy.array(end, "f")
+        if parent:
+            parent = self.names.index(parent)
+            depth = self.depths[parent] + 1
+        else:
+            parent = -1
+            depth = 0
+        index = len(self.names)
+        self.names.append(name)
+        self.parents = numpy.append(self.parents, parent).astype("i")
+        self.depths = numpy.append(self.depths, depth).astype("i")
+        self.anchors = numpy.vstack((self.anchors, (end - start) * anchor + start))
+        self.centers = numpy.vstack((self.centers, (start + end) / 2.0))
+        self.rotation = numpy.vstack((self.rotation, numpy.zeros((1,3), "f")))
+        self.movement = numpy.vstack((self.movement, numpy.zeros((1,3), "f")))
+        self.scale = numpy.vstack((self.scale, numpy.ones((1,3), "f")))
+
+        self._levels = [numpy.nonzero(self.depths == i)[0] for i in xrange(self.depths.max() + 1)]
+        self.bones[name] = _MatrixBone(self, index)
+        self.changed()
+        return self.bones[name]
+
+    def get(self, name):
+        """Return bone <name>"""
+        return self.bones[name]
+
+    def index(self, name):
+        """Return the index of bone <name> in the skeleton's arrays."""
+        return self.bones[name].index
+
+    def changed(self):
+        """Mark the pose as changed - call after writing to rotation/movement/scale directly."""
+        self._matrices = None
+        self._posed = True
+
+    def set_pose(self, rotation=None, movement=None, scale=None):
+        """Set the local pose of every bone at once
+           rotation/movement/scale can be None (leave as is) or (N,3) arrays, in the order bones were added
+           rotation is in degrees, movement is added to the position and scale is the scale of the mesh part"""
+        if rotation is not None:
+            self.rotation[:] = rotation
+        if movement is not None:
+            self.movement[:] = movement
+        if scale is not None:
+            self.scale[:] = scale
+        self.changed()
+
+    def _update(self):
+        """Evaluate the hierarchy - the world matrix of each bone, and the matrix its mesh part is drawn with."""
+        n = len(self.names)
+        #local matrices rotate around the bone's anchor, then move - rows are the usual GL rotation order,
+        #with z flipped like the rotations Animation used to hand to the mesh parts
+        rot = self.rotation * (1, 1, -1)
+        local = instance.compose_matrices(numpy.zeros((n,3), "f"), rot, numpy.ones((n,3), "f")).transpose((0,2,1))
+        local[:,:3,3] = self.movement + self.anchors - numpy.einsum("nij,nj->ni", local[:,:3,:3], self.anchors)
+
+        world = local.copy()
+        scales = self.scale.copy()
+        for level in self._levels[1:]:
+            parents = self.parents[level]
+            world[level] = numpy.einsum("nij,njk->nik", world[parents], local[level])
+            #part scales add up down the hierarchy, they don't scale the children's positions
+            scales[level] += scales[parents] - 1
+
+        #mesh parts are drawn at the bone's center, scaled around their own center
+        parts = world.copy()
+        parts[:,:3,3] = numpy.einsum("nij,nj->ni", world[:,:3,:3], self.centers) + world[:,:3,3]
+        parts[:,:3,:3] *= scales[:,numpy.newaxis,:]
+
+        self._world = world
+        self._scales = scales
+        self._matrices = parts.transpose((0,2,1)).copy()
+
+    def get_world_matrices(self):
+        """Return an (N,4,4) array of each bone's world transform (row-major), relative to the skeleton."""
+        if self._matrices is None:
+            self._update()
+        return self._world
+
+    def get_scales(self):
+        """Return an (N,3) array of each bone's mesh part scale, including its parents'."""
+        if self._matrices is None:
+            self._update()
+        return self._scales
+
+    def get_matrices(self):
+        """Return an (N,4,4) array of the matrices each bone's mesh part is drawn with,
+           column-major - ready for glMultMatrixf"""
+        if self._matrices is None:
+            self._update()
+        return self._matrices
+
+    def push(self):
+        """Calculate current values of all bones - only does any work if the pose changed."""
+        if self._matrices is None:
+            self._update()
+
+    def reset(self):
+        """Reset all bones to their rest pose, if they aren't already."""
+        if self._posed:
+            self.rotation[:] = 0
+            self.movement[:] = 0
+            self.scale[:] = 1
+            self.changed()
+            self._posed = False
+
 class Animation(BaseSceneObject):
     """Basic object to move mesh parts ased on action commands and a skeleton."""
     def __init__(self, mesh, skeleton, commands):
         """Create the Animation object
            mesh must be a BasicMesh object, used to get the mesh parts
-           skeleton must be a Skeleton object representing the mesh data
-           commands must be a dict of {"name":Action} pairs"""
+           skeleton must be a Skeleton or MatrixSkeleton object representing the mesh data
+           commands must be a dict of {"name":Action or Clip} pairs"""
         BaseSceneObject.__init__(self)
 
         self.mesh = mesh
@@ -703,6 +1990,7 @@ class Animation(BaseSceneObject):
 
         self.action = None
         self.loop = True
+        self.clip_start = 0
 
         self.pos = (0,0,0)
         self.rotation = (0,0,0)
@@ -716,13 +2004,21 @@ class Animation(BaseSceneObject):
         if not action == self.action:
             self.action = action
             if self.action in self.commands:
-                self.commands[self.action].start()
+                if isinstance(self.commands[self.action], Clip):
+                    self.clip_start = time.time()
+                else:
+                    self.commands[self.action].start()
         self.loop = loop
 
     def is_idle(self):
         """Returns whether any animation action is currently running."""
         if self.action in self.commands:
-            if self.commands[self.action].finished_frame and (not self.loop):
+            command = self.commands[self.action]
+            if isinstance(command, Clip):
+                finished = time.time() - self.clip_start >= command.duration
+            else:
+                finished = command.finished_frame
+            if finished and (not self.loop):
                 return False
         return True
 
@@ -738,12 +2034,16 @@ class Animation(BaseSceneObject):
         new.colorize = self.colorize
         new.action = self.action
         new.loop = self.loop
+        new.clip_start = self.clip_start
         return new
 
     def render(self, camera=None):
         """Render the Animation
            camera must be None or the camera object used to render the scene."""
         use_ani = False
+        if self.action and isinstance(self.commands.get(self.action), Clip):
+            self._render_clip(self.commands[self.action], camera)
+            return None
         if self.action:
             if self.action in self.commands:
                 command = self.commands[self.action]
@@ -769,6 +2069,18 @@ class Animation(BaseSceneObject):
 
         #TODO: add outlining to active models?
 
+        if isinstance(self.skeleton, MatrixSkeleton):
+            matrices = self.skeleton.get_matrices()
+            bones = self.skeleton.bones
+            for i in self.mesh.objs:
+                if i.name in bones:
+                    i.render_matrix(matrices[bones[i.name].index], self.colorize)
+                else:
+                    i.render(camera, self.colorize)
+            glPopMatrix()
+            self.skeleton.reset()
+            return None
+
         for i in self.mesh.objs:
             _pos, _rot, _sca = i.pos, i.rotation, i.scale
             if i.name in self.skeleton.bones:
@@ -782,18 +2094,515 @@ class Animation(BaseSceneObject):
                 i.rotation = nrot
                 i.scale = nsca
 
-            old = tuple(i.material.color)
-            r,g,b,a = old
-            r2,g2,b2,a2 = self.colorize
-            r *= r2
-            g *= g2
-            b *= b2
-            a *= a2
-            i.material.color = r,g,b,a
-            i.render(camera)
-            i.material.color = old
+            i.render(camera, self.colorize)
 
             i.pos, i.rotation, i.scale = _pos, _rot, _sca
         glPopMatrix()
 
         self.skeleton.reset()
+
+    def _render_clip(self, clip, camera=None):
+        """Render the Animation posed by a Clip at this Animation's time into it."""
+        age = time.time() - self.clip_start
+        matrices = clip.get_matrices(age, self.loop)
+        if age >= clip.duration and not self.loop:
+            self.action = None
+
+        glPushMatrix()
+        x,y,z = self.pos
+        glTranslatef(x,y,-z)
+        a, b, c = self.rotation
+        glRotatef(a, 1, 0, 0)
+        glRotatef(b, 0, 1, 0)
+        glRotatef(c, 0, 0, 1)
+        try:
+            glScalef(*self.scale)
+        except:
+            glScalef(self.scale, self.scale, self.scale)
+        glColor(*self.colorize)
+
+        bones = clip.skeleton.bones
+        for i in self.mesh.objs:
+            if i.name in bones:
+                i.render_matrix(matrices[bones[i.name].index], self.colorize)
+            else:
+                i.render(camera, self.colorize)
+        glPopMatrix()
+
+_skin_vertex_source = """
+#version 120
+uniform mat4 bones[%s];
+uniform int lighting;
+attribute vec4 skin_index;
+attribute vec4 skin_weight;
+varying vec4 color;
+
+void main()
+{
+    mat4 skin = bones[int(skin_index.x)] * skin_weight.x + bones[int(skin_index.y)] * skin_weight.y +
+                bones[int(skin_index.z)] * skin_weight.z + bones[int(skin_index.w)] * skin_weight.w;
+    vec4 pos = gl_ModelViewMatrix * (skin * gl_Vertex);
+    gl_Position = gl_ProjectionMatrix * pos;
+    gl_TexCoord[0] = gl_MultiTexCoord0;
+
+    color = gl_Color;
+    if (lighting != 0)
+    {
+        vec3 norm = normalize(gl_NormalMatrix * (mat3(skin) * gl_Normal));
+        vec4 lpos = gl_LightSource[0].position;
+        vec3 ldir = normalize(lpos.xyz - pos.xyz * lpos.w);
+        vec4 shade = gl_LightModel.ambient + gl_LightSource[0].ambient +
+                     gl_LightSource[0].diffuse * max(dot(norm, ldir), 0.0);
+        color.rgb = min(gl_Color * shade, 1.0).rgb;
+    }
+}
+"""
+
+def skin_palette(matrices, centers):
+    """Return the (N,4,4) row-major skinning matrices of the bones
+       matrices must be the (N,4,4) column-major part matrices from MatrixSkeleton.get_matrices or Clip.get_matrices
+       centers must be the (N,3) centers of the bones
+       Each skinning matrix moves a vertex from the skeleton's rest pose to where its bone has taken it."""
+    palette = matrices.transpose((0,2,1)).copy()
+    palette[:,:3,3] -= numpy.einsum("nij,nj->ni", palette[:,:3,:3], centers)
+    return palette
+
+def skin_vertices(verts, norms, bone_indices, bone_weights, palette):
+    """Deform vertices and normals by linear-blend skinning, returns the new (verts, norms)
+       verts/norms must be (N,3) arrays of the rest pose
+       bone_indices must be an (N,K) array of the bones each vertex follows
+       bone_weights must be a matching (N,K) array of how much each bone counts - each row should add up to 1
+       palette must be the (B,4,4) row-major bone matrices, see skin_palette"""
+    blend = numpy.zeros((len(verts), 3, 4), "f")
+    for k in xrange(bone_indices.shape[1]):
+        blend += palette[bone_indices[:,k],:3,:] * bone_weights[:,k,numpy.newaxis,numpy.newaxis]
+    new_verts = numpy.einsum("nij,nj->ni", blend[:,:,:3], verts) + blend[:,:,3]
+    new_norms = numpy.einsum("nij,nj->ni", blend[:,:,:3], norms)
+    lengths = numpy.sqrt((new_norms**2).sum(1))
+    new_norms /= numpy.maximum(lengths, 1e-9)[:,numpy.newaxis]
+    return new_verts, new_norms
+
+def skin_mesh(mesh, skeleton):
+    """Merge the rigid parts of a BasicMesh into one skinnable geometry, with every part's vertices following
+       the bone it is named after (parts without a bone follow the first bone)
+       mesh must be a BasicMesh whose groups are built from data.Geometry, and all use the same texture
+       skeleton must be the Skeleton or MatrixSkeleton the mesh was animated with
+       Returns (geometry, bone_indices, bone_weights, texture) - material colors become vertex colors,
+       and each part sits at its bone's center, just like Animation draws it."""
+    skeleton = MatrixSkeleton(skeleton)
+    parts = []
+    indices = []
+    texture = None
+    for i in mesh.objs:
+        if not isinstance(i.display_list, data.Geometry):
+            raise ValueError("Mesh part %s was not built from a data.Geometry!"%i.name)
+        if texture is None:
+            texture = i.material.texture
+        elif i.material.texture.gl_tex != texture.gl_tex:
+            raise ValueError("Skinned mesh parts must all use the same texture!")
+        if i.name in skeleton.bones:
+            bone = skeleton.index(i.name)
+            center = skeleton.centers[bone]
+        else:
+            bone = 0
+            center = i.pos
+        geom = i.display_list
+        colors = numpy.resize(numpy.array(i.material.color, "f"), (len(geom.verts), 4))
+        if geom.colors is not None:
+            colors = colors * geom.colors
+        parts.append(data.Geometry(geom.verts + center, geom.norms, geom.texcs, colors,
+                                   geom.indices, geom.render_type))
+        indices.append(numpy.zeros(len(geom.verts), "i") + bone)
+    geometry = data.merge_geometry(parts)
+    bone_indices = numpy.concatenate(indices).reshape((-1,1))
+    return geometry, bone_indices, numpy.ones(bone_indices.shape, "f"), texture
+
+class SkinnedMesh(Animation):
+    """A single mesh deformed by a whole skeleton with linear-blend skinning - every vertex follows up to four bones,
+       blended by weight - so a character is one piece of geometry drawn with one call, instead of one per part.
+       The vertices are skinned on the GPU by a shader when possible, otherwise on the CPU with numpy
+       (one blend of the bone matrix palette per frame) and re-uploaded into a single dynamic VBO.
+       Poses come from the skeleton and the Actions/Clips in commands, exactly like an Animation."""
+    max_shader_bones = 64
+    def __init__(self, geometry, bone_indices, bone_weights, skeleton, commands=None, texture=None, use_shader=True):
+        """Create the mesh
+           geometry must be the data.Geometry of the mesh in the skeleton's rest pose
+           bone_indices must be an (N,K) array of the (up to 4) bones each of the N vertices of geometry follows,
+               as indices in the order the bones were added to the skeleton
+           bone_weights must be a matching (N,K) array of how much each bone moves the vertex,
+               each row is scaled to add up to 1
+           skeleton must be the MatrixSkeleton (or a Skeleton, which is converted) the mesh is deformed by
+           commands can be None or a dict of {"name":Action or Clip} pairs
+           texture can be None, a string filename or a data.Texture object
+           use_shader can be set to False to always skin on the CPU - it is also turned off if the skinning shader
+               fails to build, like on drivers with too few vertex uniforms for max_shader_bones matrices"""
+        if not isinstance(skeleton, MatrixSkeleton):
+            skeleton = MatrixSkeleton(skeleton)
+        Animation.__init__(self, None, skeleton, commands or {})
+
+        self.bone_indices = numpy.array(bone_indices, "i").reshape((len(geometry.verts), -1))
+        weights = numpy.array(bone_weights, "f").reshape(self.bone_indices.shape)
+        self.bone_weights = weights / numpy.maximum(weights.sum(1), 1e-9)[:,numpy.newaxis]
+        if self.bone_indices.shape[1] > 4:
+            raise ValueError("Vertices can follow at most 4 bones!")
+
+        if type(texture) is type(""):
+            texture = data.Texture(texture)
+        if texture:
+            self.texture = texture
+
+        self.use_shader = bool(use_shader and SHADER_AVAILABLE and VBO_AVAILABLE and\
+                               len(skeleton.names) <= self.max_shader_bones)
+        self.rest_geometry = geometry
+        self.geometry = geometry
+        if self.use_shader:
+            try:
+                self._build_shader()
+            except RuntimeError: #compile/link failed - fall back to skinning on the CPU
+                self.use_shader = False
+        if not self.use_shader:
+            self.geometry = data.Geometry(geometry.verts, geometry.norms, geometry.texcs, geometry.colors,
+                                          geometry.indices, geometry.render_type, usage="dynamic")
+        self._last_matrices = None
+
+    def _build_shader(self):
+        """Create the skinning program and the vertex buffer of bone indices/weights it reads."""
+        self.program = shader.Program(_skin_vertex_source%self.max_shader_bones, instance._fragment_source)
+        self.program.set_uniform("tex", 0)
+        self._index_loc = self.program.get_attribute("skin_index")
+        self._weight_loc = self.program.get_attribute("skin_weight")
+
+        n, k = self.bone_indices.shape
+        skin = numpy.zeros((n, 8), "f")
+        skin[:,0:k] = self.bone_indices
+        skin[:,4:4+k] = self.bone_weights
+        self._skin_vbo = vbo.VBO(skin)
+        self._res = [resource.register("vbo", self._skin_vbo, skin.nbytes)]
+
+    def get_palette(self):
+        """Update the pose from the current action and return the (B,4,4) row-major skinning matrices."""
+        command = self.commands.get(self.action) if self.action else None
+        if isinstance(command, Clip):
+            age = time.time() - self.clip_start
+            matrices = command.get_matrices(age, self.loop)
+            if age >= command.duration and not self.loop:
+                self.action = None
+        else:
+            if command:
+                command.update(self.skeleton)
+                if command.finished_frame and not self.loop:
+                    self.action = None
+            matrices = self.skeleton.get_matrices()
+        changed = not matrices is self._last_matrices
+        self._last_matrices = matrices
+        palette = skin_palette(matrices, self.skeleton.centers)
+        self.skeleton.reset()
+        return palette, changed
+
+    def render(self, camera=None):
+        """Render the mesh
+           camera must be None or the camera object used to render the scene."""
+        palette, changed = self.get_palette()
+
+        glPushMatrix()
+        x,y,z = self.pos
+        glTranslatef(x,y,-z)
+        a, b, c = self.rotation
+        glRotatef(a, 1, 0, 0)
+        glRotatef(b, 0, 1, 0)
+        glRotatef(c, 0, 0, 1)
+        try:
+            glScalef(*self.scale)
+        except:
+            glScalef(self.scale, self.scale, self.scale)
+        glColor(*self.colorize)
+        self.texture.bind()
+
+        if self.use_shader:
+            self._render_shader(palette)
+        else:
+            if changed:
+                verts, norms = skin_vertices(self.rest_geometry.verts, self.rest_geometry.norms,
+                                             self.bone_indices, self.bone_weights, palette)
+                self.geometry.update(verts, norms)
+            self.geometry.render()
+        glPopMatrix()
+
+    def _render_shader(self, palette):
+        """Draw the mesh, skinned by the shader."""
+        self.program.set_uniform("bones", palette.transpose((0,2,1)))
+        self.program.set_uniform("lighting", int(view.screen.lighting))
+        last = shader.use(self.program)
+
+        self._skin_vbo.bind()
+        glEnableVertexAttribArray(self._index_loc)
+        glVertexAttribPointer(self._index_loc, 4, GL_FLOAT, GL_FALSE, 32, self._skin_vbo)
+        glEnableVertexAttribArray(self._weight_loc)
+        glVertexAttribPointer(self._weight_loc, 4, GL_FLOAT, GL_FALSE, 32, self._skin_vbo+16)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.geometry.render()
+
+        glDisableVertexAttribArray(self._index_loc)
+        glDisableVertexAttribArray(self._weight_loc)
+        shader.use(last)
+
+    def copy(self):
+        """Return a copy of the mesh - the rest geometry, weights and clips are shared, the skeleton is not."""
+        com = {}
+        for i in self.commands:
+            com[i] = self.commands[i].copy()
+        new = SkinnedMesh(self.rest_geometry, self.bone_indices, self.bone_weights,
+                          MatrixSkeleton(self.skeleton), com, self.texture, self.use_shader)
+        new.pos = self.pos
+        new.rotation = self.rotation
+        new.scale = self.scale
+        new.colorize = self.colorize
+        new.action = self.action
+        new.loop = self.loop
+        new.clip_start = self.clip_start
+        return new
+
+    def __del__(self):
+        """Clean up..."""
+        for i in getattr(self, "_res", []):
+            resource.release(i)
+
+_morph_vertex_source = """
+#version 120
+uniform float blend;
+uniform int lighting;
+attribute vec3 pos_a;
+attribute vec3 norm_a;
+attribute vec3 pos_b;
+attribute vec3 norm_b;
+varying vec4 color;
+
+void main()
+{
+    vec4 pos = gl_ModelViewMatrix * vec4(mix(pos_a, pos_b, blend), 1.0);
+    gl_Position = gl_ProjectionMatrix * pos;
+    gl_TexCoord[0] = gl_MultiTexCoord0;
+
+    color = gl_Color;
+    if (lighting != 0)
+    {
+        vec3 norm = normalize(gl_NormalMatrix * mix(norm_a, norm_b, blend));
+        vec4 lpos = gl_LightSource[0].position;
+        vec3 ldir = normalize(lpos.xyz - pos.xyz * lpos.w);
+        vec4 shade = gl_LightModel.ambient + gl_LightSource[0].ambient +
+                     gl_LightSource[0].diffuse * max(dot(norm, ldir), 0.0);
+        color.rgb = min(gl_Color * shade, 1.0).rgb;
+    }
+}
+"""
+
+class MorphFrames(object):
+    """The keyframes of a MorphMesh, stored as stacked (F,N,3) vertex and normal arrays.
+       Frames are shared by every MorphMesh made from them, including their GPU copy."""
+    def __init__(self, verts, norms=None, texcs=None, indices=None, render_type=None, sequences=None):
+        """Create the frames
+           verts must be an (F,N,3) array of the vertices of each of the F frames, or a list of F data.Geometry
+               objects with the same number of vertices - these also supply the norms/texcs/indices/render_type
+           norms can be None or a matching (F,N,3) array of normals
+           texcs can be None or an (N,2) array of texture coords, the same for every frame
+           indices can be None or a list/array of vertex indices, the same for every frame
+           render_type is the OpenGL constant used in rendering, ie GL_TRIANGLES (the default), GL_QUADS, etc.
+           sequences can be None or a dict of {"name":(first, last)} frame ranges - "all" always covers every frame"""
+        if len(verts) and isinstance(verts[0], data.Geometry):
+            geoms = verts
+            verts = [i.verts for i in geoms]
+            norms = [i.norms for i in geoms]
+            texcs = geoms[0].texcs
+            indices = geoms[0].indices
+            render_type = geoms[0].render_type
+        self.verts = numpy.array(verts, "f")
+        frames, n = self.verts.shape[:2]
+        if norms is None:
+            self.norms = numpy.zeros((frames,n,3), "f")
+            self.norms[:,:,1] = 1
+        else:
+            self.norms = numpy.array(norms, "f").reshape((frames,n,3))
+
+        self.sequences = {"all":(0, frames-1)}
+        if sequences:
+            self.sequences.update(sequences)
+
+        self.geometry = data.Geometry(self.verts[0], self.norms[0], texcs, None, indices, render_type)
+        self.texcs = self.geometry.texcs
+        self.indices = self.geometry.indices
+        self.render_type = self.geometry.render_type
+
+        self._buffer = None
+        self._res = None
+
+    def __len__(self):
+        """Return the number of frames."""
+        return len(self.verts)
+
+    def get_buffer(self):
+        """Return the VBO holding every frame, interleaved as x,y,z, nx,ny,nz - created the first time it is needed."""
+        if not self._buffer:
+            inter = numpy.empty(self.verts.shape[:2]+(6,), "f")
+            inter[:,:,0:3] = self.verts
+            inter[:,:,3:6] = self.norms
+            self._buffer = vbo.VBO(inter.reshape((-1,6)))
+            self._res = resource.register("vbo", self._buffer, inter.nbytes)
+        return self._buffer
+
+    def __del__(self):
+        """Clean up..."""
+        if self._res:
+            resource.release(self._res)
+
+class MorphMesh(BaseSceneObject):
+    """A mesh animated per vertex (flags, blobs, MD2-style characters) by blending between two of its keyframes.
+       On the GPU both frames are read straight from the shared frames buffer and blended by a shader,
+       otherwise the blend is done with numpy, into a dynamic VBO, whenever the blended frame changes."""
+    def __init__(self, frames, texture=None, fps=10, pos=(0,0,0), rotation=(0,0,0),
+                 scale=1, colorize=(1,1,1,1), use_shader=True):
+        """Create the mesh
+           frames must be the MorphFrames of the mesh
+           texture can be None, a string filename or a data.Texture object
+           fps is how many frames the sequences play each second
+           pos/rotation/scale/colorize attributes of the mesh
+           use_shader can be set to False to always blend on the CPU"""
+        BaseSceneObject.__init__(self)
+        self.frames = frames
+        if type(texture) is type(""):
+            texture = data.Texture(texture)
+        if texture:
+            self.texture = texture
+        self.fps = fps
+
+        self.pos = pos
+        self.rotation = rotation
+        self.scale = scale
+        self.colorize = colorize
+
+        self.frame = 0
+        self.sequence = None
+        self.loop = True
+        self.start_time = 0
+
+        self.use_shader = bool(use_shader and SHADER_AVAILABLE and VBO_AVAILABLE)
+        if self.use_shader:
+            self.geometry = frames.geometry
+            self.program = shader.Program(_morph_vertex_source, instance._fragment_source)
+            self.program.set_uniform("tex", 0)
+            self._locs = [self.program.get_attribute(i) for i in ("pos_a", "norm_a", "pos_b", "norm_b")]
+        else:
+            self.geometry = data.Geometry(frames.verts[0], frames.norms[0], frames.texcs, None,
+                                          frames.indices, frames.render_type, usage="dynamic")
+            self._verts = numpy.empty(frames.verts.shape[1:], "f")
+            self._norms = numpy.empty(frames.verts.shape[1:], "f")
+        self._state = (0, 0, 0)
+
+    def do(self, sequence=None, loop=True):
+        """Start playing a sequence of frames
+           sequence is the name of the sequence in the frames, or None to stop and hold the current frame
+           loop is whether to replay the sequence after finishing or not"""
+        if sequence is None:
+            self.frame = self.get_frame()
+        if not sequence == self.sequence:
+            self.sequence = sequence
+            self.start_time = time.time()
+        self.loop = loop
+
+    def is_idle(self):
+        """Returns whether no sequence is playing."""
+        return self.sequence is None
+
+    def get_frame(self):
+        """Return the current (fractional) frame."""
+        return self._get_blend()[0]
+
+    def _get_blend(self):
+        """Return (frame, first frame, second frame, amount) of the current blend - advancing the sequence."""
+        count = len(self.frames)
+        if self.sequence:
+            first, last = self.frames.sequences[self.sequence]
+            length = last - first + 1
+            pos = (time.time() - self.start_time) * self.fps
+            if self.loop:
+                pos %= length
+            elif pos >= length - 1:
+                pos = length - 1
+                self.sequence = None
+                self.frame = last
+            a = int(pos)
+            b = (a + 1) % length if self.loop else min(a + 1, length - 1)
+            return first + pos, first + a, first + b, pos - a
+        frame = self.frame % count
+        a = int(frame)
+        return frame, a, (a + 1) % count, frame - a
+
+    def render(self, camera=None):
+        """Render the mesh
+           camera must be None or the camera object used to render the scene."""
+        frame, first, second, amount = self._get_blend()
+
+        glPushMatrix()
+        x,y,z = self.pos
+        glTranslatef(x,y,-z)
+        a, b, c = self.rotation
+        glRotatef(a, 1, 0, 0)
+        glRotatef(b, 0, 1, 0)
+        glRotatef(c, 0, 0, 1)
+        try:
+            glScalef(*self.scale)
+        except:
+            glScalef(self.scale, self.scale, self.scale)
+        glColor(*self.colorize)
+        self.texture.bind()
+
+        if self.use_shader:
+            self._render_shader(first, second, amount)
+        else:
+            if not (first, second, amount) == self._state:
+                self._blend(first, second, amount)
+            self.geometry.render()
+        glPopMatrix()
+
+    def _blend(self, a, b, amount):
+        """Blend frames a and b into the geometry, without allocating any new arrays."""
+        frames = self.frames
+        for out, track in ((self._verts, frames.verts), (self._norms, frames.norms)):
+            numpy.subtract(track[b], track[a], out)
+            out *= amount
+            out += track[a]
+        self.geometry.update(self._verts, self._norms)
+        self._state = (a, b, amount)
+
+    def _render_shader(self, a, b, amount):
+        """Draw the mesh, blended by the shader from the shared frames buffer."""
+        self.program.set_uniform("blend", float(amount))
+        self.program.set_uniform("lighting", int(view.screen.lighting))
+        last = shader.use(self.program)
+
+        buf = self.frames.get_buffer()
+        buf.bind()
+        #each frame is N vertices of 6 floats, 24 bytes
+        size = len(self.geometry.verts) * 24
+        offsets = (a*size, a*size+12, b*size, b*size+12)
+        for loc, offset in zip(self._locs, offsets):
+            glEnableVertexAttribArray(loc)
+            glVertexAttribPointer(loc, 3, GL_FLOAT, GL_FALSE, 24, buf+offset)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.geometry.render()
+
+        for loc in self._locs:
+            glDisableVertexAttribArray(loc)
+        shader.use(last)
+
+    def copy(self):
+        """Return a copy of the mesh - the frames are shared, not copied."""
+        new = MorphMesh(self.frames, self.texture, self.fps, self.pos, self.rotation,
+                        self.scale, self.colorize, self.use_shader)
+        new.frame = self.frame
+        new.sequence = self.sequence
+        new.loop = self.loop
+        new.start_time = self.start_time
+        new.visible = self.visible
+        return new
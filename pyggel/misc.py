@@ -275,15 +275,14 @@ class BatchVertObject(BaseSceneObject):
 
         self.usage = usage
 
-        self.display_list = data.DisplayList()
         self._compile(fix_order)
 
     def _compile(self, fix_order):
         if not self.verts:
+            self.display_list = data.DisplayList() #nothing to draw
             return
-        self.display_list.begin()
 
-        norms = []
+        norms = None
 
         if fix_order and test_clockwise3d(self.verts):
             new = list(self.verts)
@@ -299,25 +298,14 @@ class BatchVertObject(BaseSceneObject):
                 self.texcs.append(self.texcs[n])
                 n += 1
 
-            for i in xrange(0, len(self.verts), 3):
-                norms.append(math3d.calcTriNormal(self.verts[i],
-                                                  self.verts[i+1],
-                                                  self.verts[i+2]))
-
-        glBegin(self.usage)
-        if norms:
-            for i in xrange(len(norms)):
-                x = i * 3
-                glNormal3f(*norms[i])
-                for j in xrange(x, x+3):
-                    glTexCoord2f(*self.texcs[j])
-                    glVertex3f(*self.verts[j])
+            tris = numpy.array(self.verts, "f").reshape((-1,3,3))
+            norms = numpy.repeat(numpy.cross(tris[:,1]-tris[:,0], tris[:,2]-tris[:,0]), 3, 0)
+
+        if self.usage == GL_POLYGON:
+            self.display_list = data.Geometry(self.verts, norms, self.texcs,
+                                              indices=data.fan_indices([len(self.verts)]))
         else:
-            for i in xrange(len(self.verts)):
-                glTexCoord2f(*self.texcs[i])
-                glVertex3f(*self.verts[i])
-        glEnd()
-        self.display_list.end()
+            self.display_list = data.Geometry(self.verts, norms, self.texcs, render_type=self.usage)
 
     def render(self, camera=None):
         glPushMatrix()
@@ -4,10 +4,11 @@ This library (PYGGEL) is licensed under the LGPL by Matthew Roe and PYGGEL contr
 
 The particle module contains classes for creating and rendering particle effects.
 A simple fire effect is included.
+EmitterArray keeps its particles in numpy arrays, for effects with many thousands of particles.
 """
 
 from include import *
-import data, image, misc, data, view
+import data, image, misc, data, view, shader, resource
 from scene import BaseSceneObject
 
 import random
@@ -203,12 +204,9 @@ class ParticlePoint(object):
         self.parent.remove_particle(self)
 
     def update(self):
-        """Update the particle."""
+        """Update the particle - the emitter uploads our pos/colorize with all the others afterwards."""
         self.behavior.particle_update(self)
 
-        self.parent.array.update_verts(self.index, self.pos)
-        self.parent.array.update_colors(self.index, self.colorize)
-
 class EmitterPoint(BaseSceneObject):
     """A more complex particle emitter, that stores all particles in a vertex array."""
     def __init__(self, behavior, pos=(0,0,0)):
@@ -269,9 +267,13 @@ class EmitterPoint(BaseSceneObject):
         self.update()
         glPointSize(self.behavior.point_size)
         glDisable(GL_LIGHTING)
-        for i in self.particles:
-            if i:
-                i.update()
+        live = [i for i in self.particles if i]
+        for i in live:
+            i.update()
+        if live:
+            indices = [i.index for i in live]
+            self.array.update_verts_many(indices, [i.pos for i in live])
+            self.array.update_colors_many(indices, [i.colorize for i in live])
         self.array.render()
         if view.screen.lighting:
             glEnable(GL_LIGHTING)
@@ -361,3 +363,267 @@ class FirePoint(BehaviorPoint):
         part.extra_data["dir"] = a, b, c
         part.pos = x, y, z
     particle_update.__doc__ = BehaviorPoint.particle_update.__doc__
+
+
+_point_vertex_source = """
+#version 120
+attribute float point_size;
+
+void main()
+{
+    gl_Position = ftransform();
+    gl_FrontColor = gl_Color;
+    gl_PointSize = point_size;
+}
+"""
+
+_point_fragment_source = """
+#version 120
+
+void main()
+{
+    gl_FragColor = gl_Color;
+}
+"""
+
+class EmitterArray(BaseSceneObject):
+    """A particle emitter for very many particles - instead of one object per particle,
+       every attribute of every particle is stored in its own numpy array:
+           positions (N,3), velocities (N,3), colors (N,4), ages (N,), lifespans (N,) and sizes (N,)
+       The live particles are always packed at the start of the arrays (ie positions[:count]),
+       the behavior updates them all at once with numpy operations,
+       and they are sent to the GPU with one buffer upload per frame."""
+    def __init__(self, behavior, pos=(0,0,0), use_shader=True):
+        """Create the emitter.
+           behavior must be the behavior class (not instance) that will control how the emitter and particles will behave
+           pos must be a three-part tuple of the position of the emitter
+           use_shader controls whether a shader is used (if available) so every particle can have its own size,
+               otherwise all particles are behavior.point_size"""
+        BaseSceneObject.__init__(self)
+
+        self.pos = pos
+        self.behavior = behavior(self)
+        self.count = 0
+        self.texture = data.BlankTexture()
+
+        self.pickable = False
+
+        self.use_vbo = VBO_AVAILABLE
+        self.use_shader = bool(use_shader and SHADER_AVAILABLE and VBO_AVAILABLE)
+        self._vbo = None
+        self._allocate(self.behavior.max_particles)
+        if self.use_shader:
+            self.program = shader.Program(_point_vertex_source, _point_fragment_source)
+            self._size_loc = self.program.get_attribute("point_size")
+
+    def _allocate(self, max_particles):
+        """Create the particle arrays (keeping as many live particles as fit) and the upload buffer."""
+        old = self.count and (self.positions, self.velocities, self.colors, self.ages, self.lifespans, self.sizes)
+        self.max_particles = max_particles
+        self.positions = numpy.zeros((max_particles, 3), "f")
+        self.velocities = numpy.zeros((max_particles, 3), "f")
+        self.colors = numpy.zeros((max_particles, 4), "f")
+        self.ages = numpy.zeros(max_particles, "f")
+        self.lifespans = numpy.zeros(max_particles, "f")
+        self.sizes = numpy.zeros(max_particles, "f")
+        if old:
+            self.count = min(self.count, max_particles)
+            for a, b in zip(old, self.get_arrays()):
+                b[:self.count] = a[:self.count]
+
+        #positions, colors and sizes are packed one after the other for the upload
+        self._packed = numpy.zeros(max_particles*8, "f")
+        if self.use_vbo:
+            if self._vbo is None:
+                self._vbo = vbo.VBO(self._packed, "GL_STREAM_DRAW")
+                self._res = resource.register("vbo", self._vbo, self._packed.nbytes)
+            else:
+                self._vbo.set_array(self._packed)
+                resource.resize(self._res, self._packed.nbytes)
+
+    def get_arrays(self):
+        """Return a list of every per-particle array."""
+        return [self.positions, self.velocities, self.colors, self.ages, self.lifespans, self.sizes]
+
+    def resize(self, max_particles):
+        """Change the maximum number of particles - live particles past the new maximum are dropped."""
+        self._allocate(max_particles)
+
+    def __len__(self):
+        """Return the number of live particles."""
+        return self.count
+
+    def get_dimensions(self):
+        """Return the maximum dimensions (width/height/depth) of the emitter and particles."""
+        return self.behavior.get_dimensions()
+
+    def get_pos(self):
+        """Return the emitter position."""
+        return self.pos
+
+    def get_scale(self):
+        """Return the scale of the object."""
+        return 1,1,1
+
+    def emit(self, count):
+        """Add count new particles (fewer if the arrays are full) at the emitter position and let the behavior set them up
+           Returns the slice of the arrays holding the new particles."""
+        start = self.count
+        new = slice(start, min(start + count, self.max_particles))
+        self.positions[new] = self.pos
+        self.velocities[new] = 0
+        self.colors[new] = 1
+        self.ages[new] = 0
+        self.lifespans[new] = self.behavior.particle_lifespan
+        self.sizes[new] = self.behavior.point_size
+        self.count = new.stop
+        self.behavior.register_particles(new)
+        return new
+
+    def kill(self, indices):
+        """Kill the live particles at indices - they are removed at the end of the next update."""
+        self.ages[:self.count][indices] = self.lifespans[:self.count][indices]
+
+    def remove_dead(self):
+        """Remove every particle whose age has reached its lifespan, packing the survivors at the start of the arrays."""
+        n = self.count
+        alive = self.ages[:n] < self.lifespans[:n]
+        if alive.all():
+            return
+        keep = numpy.nonzero(alive)[0]
+        for i in self.get_arrays():
+            i[:len(keep)] = i[keep]
+        self.count = len(keep)
+
+    def update(self):
+        """Update the emitter and all live particles."""
+        self.behavior.emitter_update()
+        if self.count:
+            self.behavior.particles_update(slice(0, self.count))
+            self.remove_dead()
+
+    def render(self, camera=None):
+        """Render and update all particles.
+           camera must be None of the camera the scene is using"""
+        self.update()
+        n = self.count
+        if not n:
+            return None
+        glDisable(GL_LIGHTING)
+        self.texture.bind()
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+
+        if self.use_vbo:
+            packed = self._packed
+            packed[:3*n] = self.positions[:n].ravel()
+            packed[3*n:7*n] = self.colors[:n].ravel()
+            packed[7*n:8*n] = self.sizes[:n]
+            self._vbo.bind()
+            glBufferData(GL_ARRAY_BUFFER, packed[:8*n], GL_STREAM_DRAW)
+            glVertexPointer(3, GL_FLOAT, 0, self._vbo)
+            glColorPointer(4, GL_FLOAT, 0, self._vbo + 12*n)
+        else:
+            glVertexPointerf(self.positions[:n])
+            glColorPointerf(self.colors[:n])
+
+        if self.use_shader:
+            last = shader.use(self.program)
+            glEnable(GL_VERTEX_PROGRAM_POINT_SIZE)
+            glEnableVertexAttribArray(self._size_loc)
+            glVertexAttribPointer(self._size_loc, 1, GL_FLOAT, GL_FALSE, 0, self._vbo + 28*n)
+        else:
+            glPointSize(self.behavior.point_size)
+
+        glDrawArrays(GL_POINTS, 0, n)
+
+        if self.use_shader:
+            glDisableVertexAttribArray(self._size_loc)
+            glDisable(GL_VERTEX_PROGRAM_POINT_SIZE)
+            shader.use(last)
+        if self.use_vbo:
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+        if view.screen.lighting:
+            glEnable(GL_LIGHTING)
+
+    def __del__(self):
+        if self._vbo is not None:
+            resource.release(self._res)
+
+
+class BehaviorArray(object):
+    """A behavior for an EmitterArray - instead of updating one particle at a time,
+       register_particles and particles_update get a slice of the emitter's arrays to change all at once."""
+    def __init__(self, emitter):
+        """Create the emitter.
+           emitter must be the emitter object that is using this behavior.
+           NOTE: this should never be called, the emitter object will do that!"""
+        self.emitter = emitter
+
+        self.particle_lifespan = 1
+        self.max_particles = 2
+        self.point_size = 1
+        self.emit_rate = 0
+
+    def get_dimensions(self):
+        """Calculate and return the maximum dimensions (width/height/depth) of the emitter and particles."""
+        return 1,1,1
+
+    def emitter_update(self):
+        """Update the emitter - emits emit_rate particles."""
+        if self.emit_rate:
+            self.emitter.emit(self.emit_rate)
+
+    def particles_update(self, live):
+        """Update the particles in the live slice of the emitter's arrays - ages them and moves them by their velocity.
+           Particles whose age reaches their lifespan are removed afterwards."""
+        self.emitter.ages[live] += 1
+        self.emitter.positions[live] += self.emitter.velocities[live]
+
+    def register_particles(self, new):
+        """Set up the particles in the new slice of the emitter's arrays."""
+        pass
+
+class FireArray(BehaviorArray):
+    """The FirePoint fire behavior for an EmitterArray - raise emit_rate and resize the emitter for bigger fires."""
+    def __init__(self, emitter):
+        BehaviorArray.__init__(self, emitter)
+
+        self.particle_lifespan = 20
+        self.point_size = 15
+        self.emit_rate = 5
+        self.max_particles = 105
+        self.palette = numpy.array(((1, 0, 0, 1),
+                                    (1, .25, 0, 1),
+                                    (1, 1, 0, 1)), "f")
+    __init__.__doc__ = BehaviorArray.__init__.__doc__
+
+    def get_dimensions(self):
+        return 2, 6, 2 #max/abs(min) directions (x,y,z) of particles * particle_lifespan
+    get_dimensions.__doc__ = BehaviorArray.get_dimensions.__doc__
+
+    def register_particles(self, new):
+        n = new.stop - new.start
+        uniform = numpy.random.uniform
+        vel = self.emitter.velocities[new]
+        vel[:,0] = uniform(-.1, .1, n)
+        vel[:,1] = uniform(.15, .3, n)
+        vel[:,2] = uniform(-.1, .1, n)
+
+        pos = self.emitter.positions[new]
+        pos[:,0] += vel[:,0] * uniform(1, 1.2, n)
+        pos[:,2] += vel[:,2] * uniform(1, 1.2, n)
+
+        self.emitter.colors[new] = self.palette[numpy.random.randint(0, len(self.palette), n)]
+    register_particles.__doc__ = BehaviorArray.register_particles.__doc__
+
+    def particles_update(self, live):
+        colors = self.emitter.colors[live]
+        colors[:,1] += .01
+        colors[:,3] -= 1.0/20
+
+        BehaviorArray.particles_update(self, live)
+        self.emitter.velocities[live,1] -= .01
+    particles_update.__doc__ = BehaviorArray.particles_update.__doc__
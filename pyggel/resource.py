@@ -0,0 +1,192 @@
+"""
+pyggel.resource
+This library (PYGGEL) is licensed under the LGPL by Matthew Roe and PYGGEL contributors.
+
+The resource module keeps track of every OpenGL object PYGGEL creates - textures, display lists,
+VBOs, frame buffers, render buffers and shader programs - how much memory each one uses and which part of the code made it.
+Objects are never deleted from __del__ directly, instead their deletion is queued and run by collect,
+which view.refresh_screen calls every frame from the thread that owns the GL context.
+"""
+
+from include import *
+import sys, os
+
+KINDS = ("texture", "display_list", "vbo", "framebuffer", "renderbuffer", "program")
+
+track_sites = True #set to False to skip recording where each object was created
+report_on_quit = False #set to True to print a leak report when pyggel.quit is called
+
+class Record(object):
+    """Information about one live OpenGL object."""
+    def __init__(self, handle, kind, name, size, owner, site):
+        """Create the record
+           handle is the id used to refer to this record
+           kind is one of KINDS
+           name is the GL name (or, for VBOs, the vbo.VBO object) to delete
+           size is the number of bytes the object uses
+           owner is the name of the subsystem (module) that created the object
+           site is the "file:line" the object was created at, or None"""
+        self.handle = handle
+        self.kind = kind
+        self.name = name
+        self.size = size
+        self.owner = owner
+        self.site = site
+
+    def __repr__(self):
+        return "<%s %s, %s bytes, owner %s, created at %s>"%(self.kind, self.handle, self.size,
+                                                            self.owner, self.site)
+
+_live = {}
+_pending = []
+_next_handle = [0]
+_internal = ("data", "resource")
+
+def _find_site():
+    """Return the (owner, site) of the first caller outside the data/resource modules."""
+    frame = sys._getframe(2)
+    while frame:
+        name = frame.f_globals.get("__name__", "")
+        if not name.split(".")[-1] in _internal:
+            site = "%s:%s"%(os.path.basename(frame.f_code.co_filename), frame.f_lineno)
+            return name, site
+        frame = frame.f_back
+    return None, None
+
+def register(kind, name, size=0, owner=None):
+    """Record a newly created GL object, returns the handle used to resize or release it.
+       kind must be one of KINDS
+       name is the GL name of the object - for VBOs pass the vbo.VBO object itself
+       size is the number of bytes the object uses
+       owner can be None (use the module that created the object) or a subsystem name"""
+    if not kind in KINDS:
+        raise ValueError("Unknown resource kind: %s"%kind)
+    _next_handle[0] += 1
+    handle = _next_handle[0]
+    site = None
+    if track_sites:
+        caller, site = _find_site()
+        owner = owner or caller
+    _live[handle] = Record(handle, kind, name, size, owner, site)
+    return handle
+
+def resize(handle, size):
+    """Update the number of bytes a live object uses."""
+    if handle in _live:
+        _live[handle].size = size
+
+def release(handle):
+    """Queue the object for deletion on the next collect - safe to call from __del__ and other threads."""
+    record = _live.pop(handle, None)
+    if record:
+        _pending.append(record)
+
+def _delete_texture(name):
+    glDeleteTextures([name])
+
+def _delete_display_list(name):
+    glDeleteLists(name, 1)
+
+def _delete_vbo(buf):
+    buf.delete()
+
+def _delete_framebuffer(name):
+    glDeleteFramebuffersEXT(1, [name])
+
+def _delete_renderbuffer(name):
+    glDeleteRenderbuffersEXT(1, [name])
+
+def _delete_program(name):
+    glDeleteProgram(name)
+
+_deleters = {"texture":_delete_texture,
+             "display_list":_delete_display_list,
+             "vbo":_delete_vbo,
+             "framebuffer":_delete_framebuffer,
+             "renderbuffer":_delete_renderbuffer,
+             "program":_delete_program}
+
+def collect():
+    """Delete every queued object - must be called from the thread that owns the GL context.
+       Returns the number of objects deleted."""
+    count = 0
+    while _pending:
+        record = _pending.pop()
+        try:
+            _deleters[record.kind](record.name)
+            count += 1
+        except:
+            pass #pyggel.quit() was called and we can no longer access the functions!
+    return count
+
+def get_pending_count():
+    """Return the number of objects waiting to be deleted."""
+    return len(_pending)
+
+def get_live(kind=None, owner=None):
+    """Return a list of the Records of live objects, optionally only of one kind and/or owner."""
+    return [i for i in _live.values() if (kind in (None, i.kind)) and (owner in (None, i.owner))]
+
+def get_counts(owner=None):
+    """Return a dict of kind:number of live objects, optionally only for one owner."""
+    counts = dict((i, 0) for i in KINDS)
+    for i in get_live(owner=owner):
+        counts[i.kind] += 1
+    return counts
+
+def get_bytes(owner=None):
+    """Return a dict of kind:bytes used by live objects, optionally only for one owner."""
+    sizes = dict((i, 0) for i in KINDS)
+    for i in get_live(owner=owner):
+        sizes[i.kind] += i.size
+    return sizes
+
+def get_owners():
+    """Return a dict of owner:bytes used by that subsystem's live objects."""
+    owners = {}
+    for i in _live.values():
+        owners[i.owner] = owners.get(i.owner, 0) + i.size
+    return owners
+
+def get_total_bytes():
+    """Return the bytes used by all live objects."""
+    return sum(i.size for i in _live.values())
+
+def snapshot():
+    """Return a marker for the current state, to be passed to get_leaks or report later."""
+    return _next_handle[0]
+
+def get_leaks(since=0):
+    """Return the Records of objects created after snapshot since that are still alive, oldest first."""
+    return sorted((i for i in _live.values() if i.handle > since), key=lambda x: x.handle)
+
+def report(since=0, out=None):
+    """Return a text report of live objects, grouped by kind and owner, and their creation sites
+       since can be a value from snapshot, to only list objects created after that point
+       out can be None or a file-like object to also write the report to"""
+    records = get_leaks(since)
+    lines = ["PYGGEL GPU resources: %s live objects, %s bytes"%(len(records), sum(i.size for i in records))]
+    for kind in KINDS:
+        these = [i for i in records if i.kind == kind]
+        if not these:
+            continue
+        lines.append("  %s: %s objects, %s bytes"%(kind, len(these), sum(i.size for i in these)))
+        sites = {}
+        for i in these:
+            key = (i.owner, i.site)
+            count, size = sites.get(key, (0, 0))
+            sites[key] = (count+1, size+i.size)
+        for key in sorted(sites, key=lambda x: -sites[x][1]):
+            count, size = sites[key]
+            lines.append("    %s x%s, %s bytes - %s"%(key[0], count, size, key[1] or "unknown site"))
+    text = "\n".join(lines)
+    if out:
+        out.write(text+"\n")
+    return text
+
+def shutdown():
+    """Run any queued deletions and, if report_on_quit is set, print a report of what is still alive.
+       Called by pyggel.quit"""
+    collect()
+    if report_on_quit:
+        report(out=sys.stdout)
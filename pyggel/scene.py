@@ -6,7 +6,7 @@ The scene module contains classes used to represent an entire group of renderabl
 """
 
 from include import *
-import camera, view, misc
+import camera, view, misc, shader
 from light import all_lights
 from data import BlankTexture
 
@@ -31,6 +31,8 @@ class BaseSceneObject(object):
 
         self.dead_remove_from_scene = False
 
+        self.shader = None #None for fixed-function, or a shader.Program to render with
+
     def get_dimensions(self):
         """Return the size of the object..."""
         return 1,1,1
@@ -130,6 +132,7 @@ class Scene(object):
                 if i.dead_remove_from_scene:
                     self.graph.render_3d.remove(i)
                 if i.visible:
+                    shader.use(getattr(i, "shader", None))
                     i.render(camera)
                     if self.pick and i.pickable:
                         dep = glReadPixelsf(mpx, mpy, 1, 1, GL_DEPTH_COMPONENT)[0][0]
@@ -145,6 +148,7 @@ class Scene(object):
                 if i.dead_remove_from_scene:
                     self.graph.render_3d_blend.remove(i)
                 if i.visible:
+                    shader.use(getattr(i, "shader", None))
                     i.render(camera)
                     if self.pick and i.pickable:
                         r, g, b, a = glReadPixelsf(mpx, mpy, 1, 1, GL_RGBA)[0][0]
@@ -158,6 +162,7 @@ class Scene(object):
                 if i.dead_remove_from_scene:
                     self.graph.render_3d_always.remove(i)
                 if i.visible:
+                    shader.use(getattr(i, "shader", None))
                     i.render(camera)
                     if self.pick and i.pickable:
                         r, g, b, a = glReadPixelsf(mpx, mpy, 1, 1, GL_RGBA)[0][0]
@@ -173,6 +178,7 @@ class Scene(object):
                 if i.dead_remove_from_scene:
                     self.graph.render_3d_after.remove(i)
                 if i.visible:
+                    shader.use(getattr(i, "shader", None))
                     i.render(camera)
                     if self.pick and i.pickable:
                         dep = glReadPixelsf(mpx, mpy, 1, 1, GL_DEPTH_COMPONENT)[0][0]
@@ -181,6 +187,7 @@ class Scene(object):
                             pick = i
             glDisable(GL_ALPHA_TEST)
 
+            shader.use(None)
             for i in self.graph.lights:
                 i.hide()
             if camera:
@@ -196,7 +203,10 @@ class Scene(object):
             for i in self.graph.render_2d:
                 if i.dead_remove_from_scene:
                     self.graph.render_2d.remove(i)
-                if i.visible: i.render()
+                if i.visible:
+                    shader.use(getattr(i, "shader", None))
+                    i.render()
+            shader.use(None)
             if view.screen.lighting:
                 glEnable(GL_LIGHTING)
             glPopMatrix()
@@ -0,0 +1,176 @@
+"""
+pyggel.shader
+This library (PYGGEL) is licensed under the LGPL by Matthew Roe and PYGGEL contributors.
+
+The shader module contains classes and functions to compile, cache and use GLSL shader programs.
+"""
+
+from include import *
+import view, resource
+
+import os
+import hashlib
+import weakref
+
+class _CompiledProgram(object):
+    """The GL program shared by every Program built from the same source,
+       along with its uniform/attribute locations and the last uniform values sent.
+       The GL program is deleted once no Program (or the cache) uses it any more."""
+    _res = None
+    def __init__(self, vertex, fragment):
+        """Compile and link the program
+           vertex/fragment are the GLSL source strings - either can be None"""
+        parts = []
+        if vertex:
+            parts.append(shaders.compileShader(vertex, GL_VERTEX_SHADER))
+        if fragment:
+            parts.append(shaders.compileShader(fragment, GL_FRAGMENT_SHADER))
+        self.gl_program = shaders.compileProgram(*parts)
+        self._res = resource.register("program", self.gl_program)
+        self.uniforms = {}
+        self.attributes = {}
+        self.values = {}
+        self.owner = None #a weakref to the Program whose uniform values were sent last
+
+    def __del__(self):
+        """Clean up..."""
+        resource.release(self._res)
+
+def _read_source(source):
+    """Return (source, filename) - source can be GLSL code or the filename of a file holding it."""
+    if source and not "\n" in source and os.path.isfile(source):
+        return open(source, "rU").read(), source
+    return source, None
+
+def _uniform_funcs(value):
+    """Return the function and arguments used to send value to a uniform location."""
+    if isinstance(value, numpy.ndarray) and value.ndim == 3 and value.shape[1:] == (4,4):
+        return glUniformMatrix4fv, (len(value), GL_FALSE, numpy.ascontiguousarray(value, "f"))
+    if isinstance(value, numpy.ndarray) and value.size == 16:
+        return glUniformMatrix4fv, (1, GL_FALSE, numpy.asarray(value, "f"))
+    if isinstance(value, numpy.ndarray):
+        value = value.tolist()
+    try:
+        n = len(value)
+    except TypeError:
+        value = (value,)
+        n = 1
+    if n == 16:
+        return glUniformMatrix4fv, (1, GL_FALSE, numpy.array(value, "f"))
+    if False in [isinstance(i, (int, long, bool, numpy.integer)) for i in value]:
+        return (glUniform1f, glUniform2f, glUniform3f, glUniform4f)[n-1], tuple(value)
+    return (glUniform1i, glUniform2i, glUniform3i, glUniform4i)[n-1], tuple(value)
+
+class Program(object):
+    """A GLSL shader program.
+       Programs are cached by a hash of their source, so creating (or reloading) a program
+       whose source has already been compiled reuses the existing GL program.
+       Uniform values belong to each Program though - when a Program is used after another one
+       sharing its GL program, any of its values the other one changed are sent again."""
+    bound = None
+    _all_compiled = {}
+    def __init__(self, vertex=None, fragment=None):
+        """Create the program
+           vertex can be None, a string of GLSL vertex shader code or the filename of a file holding it
+           fragment can be None, a string of GLSL fragment shader code or the filename of a file holding it"""
+        view.require_init()
+        if not SHADER_AVAILABLE:
+            raise AttributeError("Shaders not available!")
+        self.vertex = vertex
+        self.fragment = fragment
+        self.values = {}
+        self._pending = {}
+        self._load()
+
+    def _load(self):
+        """Read the sources and fetch/compile the cached program."""
+        vertex, self.vertex_filename = _read_source(self.vertex)
+        fragment, self.fragment_filename = _read_source(self.fragment)
+
+        self.key = hashlib.md5("%s\0%s"%(vertex, fragment)).hexdigest()
+        if not self.key in Program._all_compiled:
+            Program._all_compiled[self.key] = _CompiledProgram(vertex, fragment)
+        self.compiled = Program._all_compiled[self.key]
+        self.gl_program = self.compiled.gl_program
+
+    def reload(self):
+        """Re-read the sources (if they came from files) - only recompiles if the source actually changed."""
+        was_bound = Program.bound is self
+        self._load()
+        if was_bound:
+            Program.bound = None
+            use(self)
+
+    def get_uniform(self, name):
+        """Return the (cached) location of uniform name."""
+        locs = self.compiled.uniforms
+        if not name in locs:
+            locs[name] = glGetUniformLocation(self.gl_program, name)
+        return locs[name]
+
+    def get_attribute(self, name):
+        """Return the (cached) location of vertex attribute name."""
+        locs = self.compiled.attributes
+        if not name in locs:
+            locs[name] = glGetAttribLocation(self.gl_program, name)
+        return locs[name]
+
+    def set_uniform(self, name, value):
+        """Queue a new value for uniform name - queued values are sent together the next time the program is used.
+           value can be a number, a tuple of 2-4 numbers (ints for int/sampler uniforms), a 4x4 matrix
+               or an (N,4,4) array for a mat4[N] uniform - matrices are column-major"""
+        self.values[name] = value
+        self._pending[name] = value
+        if Program.bound is self:
+            self.flush()
+
+    def flush(self):
+        """Send all queued uniform values that differ from what the program already has - the program must be bound.
+           If another Program sent values to the GL program since this one did, all of this one's values are checked."""
+        compiled = self.compiled
+        if compiled.owner is None or not compiled.owner() is self:
+            compiled.owner = weakref.ref(self)
+            pending = self.values
+        else:
+            pending = self._pending
+        if not pending:
+            return
+        values = compiled.values
+        for name in pending:
+            value = pending[name]
+            if name in values and numpy.array_equal(values[name], value):
+                continue
+            loc = self.get_uniform(name)
+            if loc < 0:
+                continue
+            func, args = _uniform_funcs(value)
+            func(loc, *args)
+            values[name] = numpy.array(value) #a copy, so later changes to the caller's array are still sent
+        self._pending = {}
+
+    def bind(self):
+        """Start using the program for rendering."""
+        use(self)
+
+    def unbind(self):
+        """Go back to fixed-function rendering."""
+        use(None)
+
+def use(program):
+    """Start using program (or fixed function rendering if program is None) - returns the program that was in use.
+       Does nothing if program is already in use, except send its queued uniform values."""
+    last = Program.bound
+    if not program is last:
+        if program:
+            glUseProgram(program.gl_program)
+        else:
+            glUseProgram(0)
+        Program.bound = program
+    if program:
+        program.flush()
+    return last
+
+def clear_cache():
+    """Forget all cached programs - the next Program created for any source is compiled from scratch.
+       The GL programs are deleted once the Programs still using them are gone."""
+    Program._all_compiled = {}
@@ -10,6 +10,7 @@ from OpenGL import error
 oglError = error
 
 from include import *
+import resource, data
 
 class _Screen(object):
     """A simple object to store screen settings."""
@@ -305,7 +306,9 @@ def set3d():
     glEnable(GL_DEPTH_TEST)
 
 def refresh_screen():
-    """Flip the screen buffer, displaying any changes since the last clear."""
+    """Flip the screen buffer, displaying any changes since the last clear,
+       delete any GL objects queued for deletion since the last refresh,
+       and start a new frame on every StreamBuffer."""
     if screen.cursor and screen.cursor_visible and pygame.mouse.get_focused():
         glPushMatrix()
         glDisable(GL_LIGHTING)
@@ -323,6 +326,8 @@ def refresh_screen():
             glEnable(GL_LIGHTING)
         glPopMatrix()
     pygame.display.flip()
+    resource.collect()
+    data.begin_stream_frame()
 
 def clear_screen(scene=None):
     """Clear buffers."""
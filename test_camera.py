@@ -132,6 +132,13 @@ def main():
             if "=" in eh.keyboard.active:
                 mscene.camera.rotz += .5
 
+        #pick the box with the mouse on the cpu, using the camera's cached matrices
+        origin, direction = mscene.camera.screen_to_ray(*pyggel.view.screen.get_mouse_pos())
+        if numpy.isfinite(pyggel.math3d.ray_boxes(origin, direction, [box.pos], [(2.5, 2.5, 2.5)])[0]):
+            box.colorize = (1, .5, .5, 1)
+        else:
+            box.colorize = (1, 1, 1, 1)
+
         box.rotation[1] += 1
 
         pyggel.view.clear_screen(mscene)
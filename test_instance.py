@@ -0,0 +1,69 @@
+import pyggel
+from pyggel import *
+
+import random
+
+rf = pyggel.misc.randfloat
+
+def get_cube():
+    corners = ((-1,-1,1), (1,-1,1), (1,1,1), (-1,1,1),
+               (-1,-1,-1), (1,-1,-1), (1,1,-1), (-1,1,-1))
+    sides = (((3,0,1,2), (0,0,1)), ((6,5,4,7), (0,0,-1)),
+             ((7,3,2,6), (0,1,0)), ((0,4,5,1), (0,-1,0)),
+             ((2,1,5,6), (1,0,0)), ((7,4,0,3), (-1,0,0)))
+    coords = ((0,1), (0,0), (1,0), (1,1))
+    verts, norms, texcs = [], [], []
+    for side, norm in sides:
+        for i in (0, 1, 2, 0, 2, 3):
+            verts.append(corners[side[i]])
+            norms.append(norm)
+            texcs.append(coords[i])
+    return verts, norms, texcs
+
+def main():
+    pyggel.view.init()
+    pyggel.view.set_debug(False)
+
+    camera = pyggel.camera.LookAtCamera((0,0,0), rotation=(-15,0,0), distance=40)
+    my_light = pyggel.light.Light((50,100,50), (0.5,0.5,0.5,1),
+                                  (1,1,1,1), (50,50,50,10),
+                                  (0,0,0), True)
+
+    verts, norms, texcs = get_cube()
+    group = pyggel.instance.InstancedGroup(verts, norms, texcs, "data/tile_example.png")
+    how_many = 2500
+    group.add_instances([(rf(-30,30), rf(-30,30), rf(-30,30)) for i in xrange(how_many)],
+                        [(rf(0,360), rf(0,360), 0) for i in xrange(how_many)],
+                        [rf(.25,1) for i in xrange(how_many)],
+                        [(rf(0,1), rf(0,1), rf(0,1), 1) for i in xrange(how_many)])
+    spin = [(rf(-3,3), rf(-3,3), rf(-3,3)) for i in xrange(how_many)]
+
+    scene = pyggel.scene.Scene()
+    scene.camera = camera
+    scene.add_3d(group)
+    scene.add_light(my_light)
+
+    meh = pyggel.event.Handler()
+
+    clock = pygame.time.Clock()
+
+    while 1:
+        clock.tick(999)
+        if group.instanced:
+            pyggel.view.set_title("FPS with %s instances (instanced): "%how_many+str(clock.get_fps()))
+        else:
+            pyggel.view.set_title("FPS with %s instances (fallback): "%how_many+str(clock.get_fps()))
+        meh.update()
+        if meh.quit:
+            pyggel.quit()
+            return None
+
+        group.rotations += spin
+        group.invalidate()
+        camera.roty += 0.25
+
+        view.clear_screen()
+        scene.render()
+        view.refresh_screen()
+
+main()
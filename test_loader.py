@@ -0,0 +1,51 @@
+import pyggel
+from pyggel import *
+
+def main():
+    pyggel.view.init(screen_size=(800,600), screen_size_2d=(640, 480))
+    pyggel.view.set_debug(False)
+
+    my_light = pyggel.light.Light((0,100,0), (0.5,0.5,0.5,1),
+                                  (1,1,1,1), (50,50,50,10),
+                                  (0,0,0), True)
+
+    camera = pyggel.camera.LookAtCamera((0,0,0), distance=10)
+
+    #meshes and images are parsed/decoded in worker processes, only the GL uploads happen here
+    assets, report = pyggel.loader.load_many(["data/bird_plane.obj", "data/ar.png", "data/skybox.png",
+                                              "data/stickdude.png", "data/tile_example.png"])
+    print report
+
+    obj = assets[0]
+    #weld, cache-order and fetch-order the mesh's groups, and show how much the vertex cache gains
+    print pyggel.mesh.optimize_mesh(obj)
+    quad = pyggel.geometry.Quad(2, pos=(0,2,0), texture=assets[1])
+
+    my_scene = pyggel.scene.Scene()
+    my_scene.camera = camera
+    my_scene.add_3d(obj)
+    my_scene.add_3d(quad)
+    my_scene.add_light(my_light)
+
+    clock = pygame.time.Clock()
+
+    meh = pyggel.event.Handler()
+
+    while 1:
+        clock.tick(60)
+        pyggel.view.set_title("FPS: %s"%clock.get_fps())
+
+        meh.update()
+
+        if meh.quit:
+            pyggel.quit()
+            return None
+
+        camera.roty += .5
+
+        pyggel.view.clear_screen()
+        my_scene.render()
+        pyggel.view.refresh_screen()
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,9 @@ def main():
 
     image = pyggel.image.Image("data/ar.png")
 
+    start = pyggel.resource.snapshot()
+    frame = 0
+
     while 1:
 ##        clock.tick(999)
 ##        pyggel.view.set_title("FPS: %s"%clock.get_fps())
@@ -40,5 +43,11 @@ def main():
 ##        t2.text = str(f)
         image.copy()
 
+        #deletions are queued until the next refresh - run them, and show anything created since start that is still alive
+        pyggel.resource.collect()
+        frame += 1
+        if frame % 1000 == 0:
+            print pyggel.resource.report(start)
+
 main()
 
@@ -68,18 +68,52 @@ def main():
     ani.mesh.objs.append(new_obj2)
 
     ani2 = ani.copy()
+    #same bones, evaluated with batched matrices instead
+    ani2.skeleton = pyggel.mesh.MatrixSkeleton(skel)
     ani2.do("5", True)
     ani2.pos = (0,0,-10)
 
+    #the same action baked into keyframes once, then shared by any number of animations
+    clip = pyggel.mesh.Clip(action, skel)
+    ani3 = pyggel.mesh.Animation(ani.mesh, skel, {"5":clip})
+    ani3.do("5", True)
+    ani3.pos = (0,0,-20)
+
+    #the whole bird as one skinned geometry, driven by the same clip - a single draw call
+    geom, bones, weights, tex = pyggel.mesh.skin_mesh(ani.mesh, skel)
+    skin = pyggel.mesh.SkinnedMesh(geom, bones, weights, skel, {"5":clip}, tex)
+    skin.do("5", True)
+    skin.pos = (0,0,-30)
+
+    #a waving flag, made of 16 keyframes of a grid of vertices
+    grid = numpy.mgrid[0:10,0:6].reshape((2,-1)).T
+    quads = numpy.array([(x*6+y, x*6+y+1, x*6+y+7, x*6+y+6) for x in xrange(9) for y in xrange(5)])
+    frames = []
+    for i in xrange(16):
+        wave = numpy.sin(grid[:,0] * 0.7 + i * numpy.pi / 8) * grid[:,0] * 0.05
+        frames.append(numpy.column_stack((grid[:,0] * 0.3, grid[:,1] * 0.3, wave)))
+    flag = pyggel.mesh.MorphMesh(pyggel.mesh.MorphFrames(frames, texcs=grid / (9.0, 5.0), indices=quads,
+                                                         render_type=GL_QUADS),
+                                 fps=16, pos=(3,0,0))
+    flag.do("all")
+
     exp = pyggel.mesh.Exploder(obj.copy(), frame_duration=100,
                                kill_when_finished=False)
+    #the same, broken into clusters of about 8 triangles instead of whole groups
+    debris = pyggel.mesh.Debris(obj.copy(), cluster_size=8, frame_duration=100,
+                                kill_when_finished=False)
+    debris.pos = (0,0,10)
 
     my_scene = pyggel.scene.Scene()
     my_scene.camera = camera
     my_scene.add_3d(ani)
     my_scene.add_3d(ani2)
+    my_scene.add_3d(ani3)
+    my_scene.add_3d(skin)
+    my_scene.add_3d(flag)
     my_scene.add_light(my_light)
     my_scene.add_3d(exp)
+    my_scene.add_3d(debris)
 
     clock = pygame.time.Clock()
 
@@ -128,6 +162,8 @@ def main():
 
         if exp.dead:
             exp.reset()
+        if debris.dead:
+            debris.reset()
 
         pyggel.view.clear_screen()
 
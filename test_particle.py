@@ -16,10 +16,17 @@ def main():
     emitter2 = particle.EmitterPoint(particle.FirePoint)
     emitter2.visible = False
 
+    #100k particles, updated with numpy and uploaded in one buffer each frame
+    emitter3 = particle.EmitterArray(particle.FireArray)
+    emitter3.behavior.emit_rate = 5000
+    emitter3.resize(100000)
+    emitter3.visible = False
+
     scene = pyggel.scene.Scene()
     scene.camera = camera
     scene.add_3d_blend(emitter)
     scene.add_3d_blend(emitter2)
+    scene.add_3d_blend(emitter3)
 
     eh = event.Handler()
 
@@ -34,8 +41,7 @@ def main():
             pyggel.quit()
             return None
         if " " in eh.keyboard.hit:
-            emitter.visible = not emitter.visible
-            emitter2.visible = not emitter2.visible
+            emitter.visible, emitter2.visible, emitter3.visible = emitter3.visible, emitter.visible, emitter2.visible
 
         view.clear_screen()
         scene.render()#camera)
@@ -82,6 +82,13 @@ def main():
     vert_vbo.reset_colors(colors)
     vert_vbo.reset_norms(norms)
 
+    #a line rewritten every frame through a shared StreamBuffer
+    stream_line = None
+    if have_vbo:
+        stream_line = data.StreamArray(data.StreamBuffer(2**14), GL_LINE_STRIP, 100)
+        stream_line.colors[:] = (1, 1, 0, 1)
+    wave = numpy.arange(100, dtype="f")
+
     meh = pyggel.event.Handler()
 
     last_index = 0
@@ -130,6 +137,11 @@ def main():
         my_light.shine()
         camera.push()
         vert_vbo.render()
+        if stream_line:
+            stream_line.verts[:,0] = wave
+            stream_line.verts[:,1] = numpy.sin(wave * .2 + pygame.time.get_ticks() / 200.0) * 2 + 5
+            stream_line.verts[:,2] = -20
+            stream_line.render()
         camera.pop()
         view.refresh_screen()
 